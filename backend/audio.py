@@ -0,0 +1,193 @@
+"""
+Server-side audio keyword spotting.
+
+Segments sampled by the clip recorder are decoded to 16 kHz mono PCM with
+ffmpeg and fed in small chunks to a streaming Vosk recognizer kept per
+stream. Finished utterances are matched against ChatKeyword with the spaCy
+matcher from detection.py, and hits are stored as audio_detection logs.
+
+Each stream holds at most AUDIO_QUEUE_SEGMENTS undecoded segments and is
+processed by one worker at a time; when decoding falls behind, the oldest
+pending segment is dropped, so memory stays bounded.
+
+Needs both VOSK_MODEL_PATH, pointing at an unpacked Vosk model, and
+CLIP_RECORDER_ENABLED=1: the segments come from the clip recorder, so with
+the recorder off nothing reaches the pipeline.
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config import app
+from metrics import stage_timer, AUDIO_SEGMENTS
+from ingest import record_audio_detection
+from clips import CLIP_RECORDER_ENABLED
+import detection
+
+AUDIO_MODEL_PATH = os.getenv("VOSK_MODEL_PATH")
+AUDIO_SAMPLE_RATE = 16000
+# 0.25s of 16-bit mono PCM per recognizer call.
+AUDIO_CHUNK_BYTES = AUDIO_SAMPLE_RATE // 4 * 2
+AUDIO_QUEUE_SEGMENTS = 2
+AUDIO_WORKERS = int(os.getenv("AUDIO_WORKERS", 2))
+AUDIO_DECODE_TIMEOUT = 30
+# The same keyword on the same stream is only logged once per window.
+AUDIO_ALERT_WINDOW = 60
+AUDIO_IDLE_TIMEOUT = 300
+KEYWORD_REFRESH_INTERVAL = 60
+
+_model = None
+_model_lock = threading.Lock()
+_keywords_refreshed_at = 0
+_keywords_lock = threading.Lock()
+
+def get_model():
+    """Return the shared Vosk model, loading it on first call."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from vosk import Model
+                with stage_timer("model_load"):
+                    _model = Model(AUDIO_MODEL_PATH)
+    return _model
+
+def ffmpeg_binary():
+    """Return the system ffmpeg, or the one bundled with imageio-ffmpeg (via moviepy)."""
+    path = shutil.which("ffmpeg")
+    if path is None:
+        import imageio_ffmpeg
+        path = imageio_ffmpeg.get_ffmpeg_exe()
+    return path
+
+def decode_audio(data):
+    """Decode the audio track of a media segment to raw 16 kHz mono PCM."""
+    result = subprocess.run(
+        [ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+         "-vn", "-ac", "1", "-ar", str(AUDIO_SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+        input=data, capture_output=True, timeout=AUDIO_DECODE_TIMEOUT,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode(errors="replace").strip() or "ffmpeg failed")
+    return result.stdout
+
+def spot_keywords(text):
+    """Return the flagged keywords found in a transcript."""
+    global _keywords_refreshed_at
+    # Audio workers share one refresh; each keeps the matcher it took.
+    with _keywords_lock:
+        matcher = detection.matcher
+        if matcher is None or time.monotonic() - _keywords_refreshed_at > KEYWORD_REFRESH_INTERVAL:
+            matcher = detection.refresh_keywords()
+            _keywords_refreshed_at = time.monotonic()
+    doc = detection.get_nlp()(text.lower())
+    return {doc[start:end].text for _, start, end in matcher(doc)}
+
+class StreamAudio:
+    """Pending segments and recognizer state of one stream."""
+    def __init__(self, ring):
+        self.ring = ring
+        self.pending = deque(maxlen=AUDIO_QUEUE_SEGMENTS)
+        self.busy = False
+        self.recognizer = None
+        self.last_offer = time.monotonic()
+        self.last_alerts = {}
+
+class AudioPipeline:
+    def __init__(self, workers=AUDIO_WORKERS):
+        self.streams = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pruned_at = time.monotonic()
+
+    def offer(self, ring, segment, init=None):
+        """Queue a segment for a stream without blocking the caller."""
+        now = time.monotonic()
+        with self.lock:
+            if now - self.pruned_at > AUDIO_IDLE_TIMEOUT:
+                self._prune(now)
+            state = self.streams.get(ring.url)
+            if state is None:
+                state = self.streams[ring.url] = StreamAudio(ring)
+            state.ring = ring
+            state.last_offer = now
+            if len(state.pending) == state.pending.maxlen:
+                AUDIO_SEGMENTS.labels("dropped").inc()
+            state.pending.append((segment, init))
+            if state.busy:
+                return
+            state.busy = True
+        self.executor.submit(self._drain, state)
+
+    def _prune(self, now):
+        for url, state in list(self.streams.items()):
+            if not state.busy and now - state.last_offer > AUDIO_IDLE_TIMEOUT:
+                del self.streams[url]
+        self.pruned_at = now
+
+    def _drain(self, state):
+        while True:
+            with self.lock:
+                if not state.pending:
+                    state.busy = False
+                    return
+                segment, init = state.pending.popleft()
+            try:
+                with app.app_context():
+                    self.process(state, segment, init)
+                AUDIO_SEGMENTS.labels("processed").inc()
+            except Exception as e:
+                AUDIO_SEGMENTS.labels("error").inc()
+                logging.error("Audio pipeline error for %s: %s", state.ring.url, e)
+
+    def process(self, state, segment, init=None):
+        """Decode one segment and run its audio through the stream's recognizer."""
+        data = init.content + segment.content if init is not None else segment.content
+        with stage_timer("audio_decode"):
+            pcm = decode_audio(data)
+        if state.recognizer is None:
+            from vosk import KaldiRecognizer
+            state.recognizer = KaldiRecognizer(get_model(), AUDIO_SAMPLE_RATE)
+            state.recognizer.SetWords(True)
+        with stage_timer("asr"):
+            for offset in range(0, len(pcm), AUDIO_CHUNK_BYTES):
+                if state.recognizer.AcceptWaveform(pcm[offset:offset + AUDIO_CHUNK_BYTES]):
+                    self.handle_result(state, json.loads(state.recognizer.Result()))
+
+    def handle_result(self, state, result):
+        text = result.get("text", "")
+        if not text:
+            return
+        now = time.monotonic()
+        for keyword in spot_keywords(text):
+            if now - state.last_alerts.get(keyword, -AUDIO_ALERT_WINDOW) < AUDIO_ALERT_WINDOW:
+                continue
+            state.last_alerts[keyword] = now
+            words = keyword.split()
+            confidences = [w["conf"] for w in result.get("result", []) if w.get("word") in words]
+            stream = state.ring.stream
+            record_audio_detection(
+                stream.get("room_url") or state.ring.url,
+                keyword,
+                text,
+                sum(confidences) / len(confidences) if confidences else 0,
+                streamer_name=stream.get("streamer_name"),
+                platform=stream.get("platform"),
+            )
+
+audio_pipeline = AudioPipeline()
+
+def start_audio_pipeline(recorder):
+    """Feed the recorder's segments to the audio pipeline if a model is configured."""
+    if not AUDIO_MODEL_PATH:
+        logging.info("VOSK_MODEL_PATH not set; server-side audio detection is disabled.")
+        return
+    if not CLIP_RECORDER_ENABLED:
+        logging.warning("VOSK_MODEL_PATH is set but CLIP_RECORDER_ENABLED is not; no audio will be sampled.")
+        return
+    recorder.segment_listeners.append(audio_pipeline.offer)
@@ -0,0 +1,197 @@
+"""
+Workload-aware assignment of streams to agents.
+
+A stream's load is 1 plus DETECTION_LOAD for every detection logged for it
+in the last BALANCE_WINDOW; an agent's load is the sum over its assigned
+streams. New streams go to the least loaded agent, and a rebalance
+redistributes every stream in a single transaction, keeping streams with
+their current agent whenever that agent stays close to the average load.
+
+Databases created before assignments were unique per (agent, stream) are
+migrated once, by hand, before deploying:
+
+    flask --app balancer unique-assignments
+"""
+import heapq
+import click
+from datetime import datetime, timedelta
+from config import app
+from extensions import db
+from models import User, Stream, Assignment, Log, ChaturbateStream, StripchatStream
+
+BALANCE_WINDOW = timedelta(hours=24)
+DETECTION_LOAD = 0.1
+# A stream stays with its agent while that agent is within this fraction
+# above the average load.
+BALANCE_TOLERANCE = 0.1
+DETECTION_EVENT_TYPES = ["object_detection", "audio_detection", "chat_detection", "video_notification"]
+
+def _assignment_index():
+    indexes = db.inspect(db.engine).get_indexes("assignments")
+    return next((i for i in indexes if i["name"] == "idx_assignment_agent_stream"), None)
+
+def assignments_are_unique():
+    """Return True if idx_assignment_agent_stream is a unique index. Must run inside an app context."""
+    index = _assignment_index()
+    return index is not None and bool(index.get("unique"))
+
+def make_assignments_unique():
+    """
+    Make idx_assignment_agent_stream a unique index on databases created
+    before it was declared unique, removing duplicate pairs first (the
+    oldest assignment of each pair is kept). Returns the number of
+    assignments removed. Must run inside an app context.
+    """
+    index = _assignment_index()
+    if index is not None and index.get("unique"):
+        return 0
+    with db.engine.begin() as conn:
+        removed = conn.execute(db.text(
+            "DELETE FROM assignments WHERE id NOT IN ("
+            "SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM assignments "
+            "GROUP BY agent_id, stream_id) AS keep)"
+        )).rowcount
+        if index is not None:
+            conn.execute(db.text("DROP INDEX idx_assignment_agent_stream"))
+        conn.execute(db.text(
+            "CREATE UNIQUE INDEX idx_assignment_agent_stream ON assignments (agent_id, stream_id)"
+        ))
+    return removed
+
+@app.cli.command("unique-assignments")
+def unique_assignments_command():
+    """Remove duplicate assignments and make (agent, stream) unique."""
+    removed = make_assignments_unique()
+    click.echo(f"Removed {removed} duplicate assignments; idx_assignment_agent_stream is unique.")
+
+def stream_loads(streams):
+    """Return {stream_id: load} from recent detection volume."""
+    counts = dict(
+        db.session.query(Log.room_url, db.func.count(Log.id))
+        .filter(
+            Log.timestamp >= datetime.utcnow() - BALANCE_WINDOW,
+            Log.event_type.in_(DETECTION_EVENT_TYPES),
+        )
+        .group_by(Log.room_url)
+        .all()
+    )
+    loads = {}
+    for stream in streams:
+        urls = {
+            stream.room_url,
+            getattr(stream, "chaturbate_m3u8_url", None),
+            getattr(stream, "stripchat_m3u8_url", None),
+        }
+        detections = sum(counts.get(url, 0) for url in urls if url)
+        loads[stream.id] = 1 + DETECTION_LOAD * detections
+    return loads
+
+def _load_state():
+    poly = db.with_polymorphic(Stream, [ChaturbateStream, StripchatStream])
+    streams = db.session.query(poly).options(db.lazyload(poly.assignments)).all()
+    agents = [agent_id for (agent_id,) in db.session.query(User.id).filter(User.role == "agent").order_by(User.id)]
+    assignments = db.session.query(Assignment).all()
+    return streams, agents, assignments
+
+def agent_loads():
+    """Return {agent_id: load} for every agent."""
+    streams, agents, assignments = _load_state()
+    loads = stream_loads(streams)
+    result = {agent_id: 0.0 for agent_id in agents}
+    for assignment in assignments:
+        if assignment.agent_id in result:
+            result[assignment.agent_id] += loads.get(assignment.stream_id, 0)
+    return result
+
+def auto_assign(stream_ids=None):
+    """
+    Assign every unassigned stream (or only those in stream_ids) to the
+    least loaded agent, heaviest streams first. Adds the assignments to the
+    session without committing and returns them.
+    """
+    streams, agents, assignments = _load_state()
+    if not agents:
+        return []
+    loads = stream_loads(streams)
+    agent_load = {agent_id: 0.0 for agent_id in agents}
+    assigned = set()
+    for assignment in assignments:
+        assigned.add(assignment.stream_id)
+        if assignment.agent_id in agent_load:
+            agent_load[assignment.agent_id] += loads.get(assignment.stream_id, 0)
+    wanted = set(stream_ids) if stream_ids is not None else None
+    pending = [
+        s.id for s in streams
+        if s.id not in assigned and (wanted is None or s.id in wanted)
+    ]
+    heap = [(load, agent_id) for agent_id, load in agent_load.items()]
+    heapq.heapify(heap)
+    created = []
+    for stream_id in sorted(pending, key=lambda sid: -loads[sid]):
+        load, agent_id = heapq.heappop(heap)
+        assignment = Assignment(agent_id=agent_id, stream_id=stream_id)
+        db.session.add(assignment)
+        created.append(assignment)
+        heapq.heappush(heap, (load + loads[stream_id], agent_id))
+    return created
+
+def plan_rebalance():
+    """
+    Return ({stream_id: agent_id}, {agent_id: load}) distributing every
+    stream to exactly one agent. Heaviest streams are placed first; each
+    stays with one of its current agents if that agent would not exceed
+    the average load by more than BALANCE_TOLERANCE, otherwise it goes to
+    the least loaded agent.
+    """
+    streams, agents, assignments = _load_state()
+    if not agents:
+        return {}, {}
+    loads = stream_loads(streams)
+    current = {}
+    for assignment in sorted(assignments, key=lambda a: a.id):
+        current.setdefault(assignment.stream_id, []).append(assignment.agent_id)
+    limit = sum(loads.values()) / len(agents) * (1 + BALANCE_TOLERANCE)
+    agent_load = {agent_id: 0.0 for agent_id in agents}
+    plan = {}
+    for stream in sorted(streams, key=lambda s: -loads[s.id]):
+        load = loads[stream.id]
+        # A stream heavier than the limit can still stay with an otherwise idle agent.
+        keep = [
+            a for a in current.get(stream.id, [])
+            if a in agent_load and agent_load[a] + load <= max(limit, load)
+        ]
+        agent_id = keep[0] if keep else min(agents, key=lambda a: (agent_load[a], a))
+        plan[stream.id] = agent_id
+        agent_load[agent_id] += load
+    return plan, agent_load
+
+def rebalance(dry_run=False):
+    """
+    Apply plan_rebalance() in one transaction and return a summary. Streams
+    end up with exactly one assignment; only assignments that change are
+    deleted or created.
+    """
+    plan, agent_load = plan_rebalance()
+    moves = []
+    existing = {}
+    for assignment in db.session.query(Assignment).all():
+        existing.setdefault(assignment.stream_id, []).append(assignment)
+    for stream_id, agent_id in plan.items():
+        current = existing.get(stream_id, [])
+        if [a.agent_id for a in current] == [agent_id]:
+            continue
+        moves.append({
+            "stream_id": stream_id,
+            "from": [a.agent_id for a in current],
+            "to": agent_id,
+        })
+        if dry_run:
+            continue
+        for assignment in current:
+            if assignment.agent_id != agent_id:
+                db.session.delete(assignment)
+        if agent_id not in [a.agent_id for a in current]:
+            db.session.add(Assignment(agent_id=agent_id, stream_id=stream_id))
+    if not dry_run:
+        db.session.commit()
+    return {"moves": moves, "agent_loads": agent_load}
@@ -0,0 +1,144 @@
+"""
+Blob store for annotated frames uploaded by agents' browsers.
+
+Frames arrive either as a multipart file part or, from older clients, as a
+base64 data URL inside JSON. They are stored in the annotated_frames table,
+shared by all replicas, and served under /api/annotated-frames/; detection
+logs keep only that URL, and notifications attach a small WebP thumbnail.
+Bytes are written and read BLOB_CHUNK_SIZE at a time, so an upload is never
+held in memory whole.
+"""
+import io
+import os
+import uuid
+import base64
+import logging
+from extensions import db
+from models import AnnotatedFrame, AnnotatedFrameChunk
+
+BLOB_URL_PREFIX = "/api/annotated-frames/"
+BLOB_MAX_BYTES = 10 * 1024 * 1024
+BLOB_CHUNK_SIZE = 256 * 1024
+IMAGE_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+}
+# Telegram shows notification photos small; keep them well under its limits.
+THUMBNAIL_MAX_SIDE = 640
+THUMBNAIL_MAX_BYTES = 64 * 1024
+THUMBNAIL_QUALITIES = (80, 65, 50, 35, 20)
+
+def blob_url(filename):
+    return BLOB_URL_PREFIX + filename
+
+def _filename_for_url(url):
+    if not url or not url.startswith(BLOB_URL_PREFIX):
+        return None
+    return os.path.basename(url)
+
+def _new_filename(content_type):
+    extension = IMAGE_EXTENSIONS.get(content_type)
+    if extension is None:
+        raise ValueError(f"Unsupported image type: {content_type}")
+    return f"{uuid.uuid4().hex}.{extension}"
+
+def _store(chunks, content_type):
+    """Write an iterable of byte chunks as one blob and return its URL."""
+    filename = _new_filename(content_type)
+    frame = AnnotatedFrame(id=filename, content_type=content_type, size=0)
+    try:
+        db.session.add(frame)
+        db.session.flush()
+        for seq, chunk in enumerate(chunks):
+            frame.size += len(chunk)
+            if frame.size > BLOB_MAX_BYTES:
+                raise ValueError("Image too large")
+            # A bulk insert keeps written chunks out of the session.
+            db.session.execute(db.insert(AnnotatedFrameChunk), [{"frame_id": filename, "seq": seq, "data": chunk}])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return blob_url(filename)
+
+def save_bytes(data, content_type):
+    """Store raw image bytes in the blob store and return their URL."""
+    if len(data) > BLOB_MAX_BYTES:
+        raise ValueError("Image too large")
+    return _store((data[i:i + BLOB_CHUNK_SIZE] for i in range(0, len(data), BLOB_CHUNK_SIZE)), content_type)
+
+def save_stream(stream, content_type):
+    """
+    Copy an uploaded image into the blob store chunk by chunk and return its
+    URL. Uploads over BLOB_MAX_BYTES are rejected once the limit is crossed.
+    """
+    return _store(iter(lambda: stream.read(BLOB_CHUNK_SIZE), b""), content_type)
+
+def iter_chunks(filename):
+    """Yield the bytes of a stored blob in order, one chunk at a time."""
+    query = db.select(AnnotatedFrameChunk.data) \
+        .where(AnnotatedFrameChunk.frame_id == filename) \
+        .order_by(AnnotatedFrameChunk.seq) \
+        .execution_options(yield_per=1)
+    yield from db.session.scalars(query)
+
+def load(url):
+    """Return (content_type, bytes) of the blob behind url, or None."""
+    filename = _filename_for_url(url)
+    frame = db.session.get(AnnotatedFrame, filename) if filename else None
+    if frame is None:
+        return None
+    return frame.content_type, b"".join(iter_chunks(filename))
+
+def delete_frames(filenames):
+    """Delete the given blobs and their chunks; the caller commits."""
+    AnnotatedFrameChunk.query.filter(AnnotatedFrameChunk.frame_id.in_(filenames)).delete(synchronize_session=False)
+    AnnotatedFrame.query.filter(AnnotatedFrame.id.in_(filenames)).delete(synchronize_session=False)
+
+def discard(url):
+    """Delete a blob that will not be referenced by any log."""
+    filename = _filename_for_url(url)
+    if filename:
+        try:
+            delete_frames([filename])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error("Error discarding blob %s: %s", filename, e)
+
+def decode_data_url(data_url):
+    """Return (content_type, bytes) for a base64 data URL."""
+    header, _, encoded = data_url.partition(",")
+    content_type = header[len("data:"):].split(";")[0] or "image/jpeg"
+    return content_type, base64.b64decode(encoded)
+
+def make_thumbnail(image_ref):
+    """
+    Re-encode an annotated frame (blob URL or data URL) as a WebP thumbnail
+    no larger than THUMBNAIL_MAX_BYTES and return its URL, or None on failure.
+    """
+    if not image_ref:
+        return None
+    try:
+        from PIL import Image
+        blob = decode_data_url(image_ref) if image_ref.startswith("data:") else load(image_ref)
+        if blob is None:
+            return None
+        with Image.open(io.BytesIO(blob[1])) as image:
+            image.thumbnail((THUMBNAIL_MAX_SIDE, THUMBNAIL_MAX_SIDE))
+            image = image.convert("RGB")
+            encoded = None
+            while True:
+                for quality in THUMBNAIL_QUALITIES:
+                    buffer = io.BytesIO()
+                    image.save(buffer, format="WEBP", quality=quality)
+                    encoded = buffer.getvalue()
+                    if len(encoded) <= THUMBNAIL_MAX_BYTES:
+                        return save_bytes(encoded, "image/webp")
+                if max(image.size) <= 64:
+                    return save_bytes(encoded, "image/webp")
+                image = image.resize((max(1, image.width // 2), max(1, image.height // 2)))
+    except Exception as e:
+        logging.error("Thumbnail error: %s", e)
+        return None
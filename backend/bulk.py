@@ -0,0 +1,200 @@
+"""
+Bulk operations on notification logs.
+
+Filters select logs by ids, room URLs, time range and event type, and are
+always restricted to the caller's scope: an agent only reaches the logs of
+the streams assigned to them. Matching rows are updated or deleted in
+id-ordered chunks of BULK_CHUNK_SIZE, each in its own short transaction, so
+a cleanup of millions of rows never holds the database lock for long.
+Read and unread only change the caller's own read state (readstate.py), and
+so does an agent's delete: it becomes "hide", which is not scoped to their
+streams since it only affects their own list. Hidden logs match no filter.
+An agent's scope also covers the chat detections, which belong to no stream
+and are listed for everyone. Jobs count their matches themselves, so
+starting one costs the request no scan. Progress is kept in the shared
+cache, like scrape jobs.
+"""
+import time
+import uuid
+import logging
+from datetime import datetime
+from config import cache
+from extensions import db
+from models import Log, Stream, Assignment, ChaturbateStream, StripchatStream
+from tasks import task_handler, enqueue
+from readstate import (
+    NOTIFICATION_EVENT_TYPES, unread_condition, visible_condition,
+    mark_read, mark_unread, hide_logs, forget_logs, invalidate_counts,
+)
+
+BULK_CHUNK_SIZE = 1000
+# Pause between chunks so ingest writes can take the database lock.
+BULK_CHUNK_PAUSE = 0.05
+BULK_JOB_TIMEOUT = 3600
+BULK_ACTIONS = ("read", "unread", "delete")
+# Room URL of the chat detections logged by detection.py.
+CHAT_ROOM_URL = "chat"
+
+def stream_url_map(agent_id=None):
+    """
+    Return {stream_id: [room and M3U8 URLs]} for the streams assigned to an
+    agent, or for every stream if agent_id is None.
+    """
+    poly = db.with_polymorphic(Stream, [ChaturbateStream, StripchatStream])
+    query = db.session.query(poly).options(db.lazyload(poly.assignments))
+    if agent_id is not None:
+        query = query.join(Assignment, Assignment.stream_id == poly.id).filter(Assignment.agent_id == agent_id)
+    return {
+        stream.id: [
+            url for url in (stream.room_url,
+                            getattr(stream, "chaturbate_m3u8_url", None),
+                            getattr(stream, "stripchat_m3u8_url", None))
+            if url
+        ]
+        for stream in query.all()
+    }
+
+def agent_stream_urls(agent_id):
+    """Return the room and M3U8 URLs of the streams assigned to an agent."""
+    return sorted({url for urls in stream_url_map(agent_id).values() for url in urls})
+
+def resolve_filters(data, user_id, role, scoped=True):
+    """
+    Validate a bulk filter payload and return it as a JSON-serializable
+    dict with the caller's scope applied. Raises ValueError on bad input.
+
+    {
+        "ids": [1, 2],                     # optional
+        "room_urls": ["https://..."],      # optional
+        "since": "2024-01-01T00:00:00",    # optional, inclusive
+        "until": "2024-02-01T00:00:00",    # optional, exclusive
+        "event_types": ["object_detection"],
+        "unread_only": true,
+        "agent_id": 3                      # admins only; agents are scoped to themselves
+    }                                      # unless scoped is False
+    """
+    filters = {"user_id": user_id}
+    for key in ("ids", "room_urls"):
+        values = data.get(key)
+        if values is None:
+            continue
+        if not isinstance(values, list):
+            raise ValueError(f"{key} must be a list")
+        filters[key] = [int(v) for v in values] if key == "ids" else [str(v) for v in values]
+    for key in ("since", "until"):
+        if data.get(key):
+            datetime.fromisoformat(data[key])
+            filters[key] = data[key]
+    event_types = data.get("event_types") or NOTIFICATION_EVENT_TYPES
+    unknown = set(event_types) - set(NOTIFICATION_EVENT_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown event types: {', '.join(sorted(unknown))}")
+    filters["event_types"] = list(event_types)
+    if data.get("unread_only"):
+        filters["unread_only"] = True
+    if role == "admin":
+        if data.get("agent_id") is not None:
+            filters["scope_urls"] = agent_stream_urls(int(data["agent_id"]))
+    elif scoped:
+        filters["scope_urls"] = agent_stream_urls(user_id) + [CHAT_ROOM_URL]
+    return filters
+
+def filtered_query(filters):
+    """Return a Log query for the logs matching resolved filters."""
+    query = Log.query.filter(Log.event_type.in_(filters["event_types"]), visible_condition(filters["user_id"]))
+    if "ids" in filters:
+        query = query.filter(Log.id.in_(filters["ids"]))
+    if "room_urls" in filters:
+        query = query.filter(Log.room_url.in_(filters["room_urls"]))
+    if "scope_urls" in filters:
+        query = query.filter(Log.room_url.in_(filters["scope_urls"]))
+    if "since" in filters:
+        query = query.filter(Log.timestamp >= datetime.fromisoformat(filters["since"]))
+    if "until" in filters:
+        query = query.filter(Log.timestamp < datetime.fromisoformat(filters["until"]))
+    if filters.get("unread_only"):
+        query = query.filter(unread_condition(filters["user_id"]))
+    return query
+
+def run_chunk(filters, action, after_id=0):
+    """
+    Apply action to the next BULK_CHUNK_SIZE matching logs with an id above
+    after_id, in one transaction. Returns (rows affected, last id seen).
+    """
+    ids = [
+        log_id for (log_id,) in filtered_query(filters)
+        .with_entities(Log.id)
+        .filter(Log.id > after_id)
+        .order_by(Log.id)
+        .limit(BULK_CHUNK_SIZE)
+    ]
+    if not ids:
+        return 0, after_id
+    if action == "read":
+        mark_read(filters["user_id"], ids)
+    elif action == "unread":
+        mark_unread(filters["user_id"], ids)
+    elif action == "hide":
+        hide_logs(filters["user_id"], ids)
+    else:
+        forgotten = forget_logs(ids)
+        Log.query.filter(Log.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        invalidate_counts(forgotten)
+    return len(ids), ids[-1]
+
+def is_small(filters):
+    """Return True if the filter selects at most one chunk by id."""
+    return "ids" in filters and len(filters["ids"]) <= BULK_CHUNK_SIZE
+
+def save_bulk_job(job_id, job):
+    try:
+        cache.set(f"bulk_job:{job_id}", job, timeout=BULK_JOB_TIMEOUT)
+    except Exception as e:
+        logging.error("Failed to store bulk job %s: %s", job_id, e)
+
+def get_bulk_job(job_id):
+    """Return the progress of a bulk job, or None if unknown."""
+    try:
+        return cache.get(f"bulk_job:{job_id}")
+    except Exception as e:
+        logging.error("Failed to load bulk job %s: %s", job_id, e)
+        return None
+
+def start_bulk_job(action, filters, user_id):
+    """Queue a chunked bulk job and return its initial progress record."""
+    job = {
+        "job_id": str(uuid.uuid4()),
+        "action": action,
+        "status": "queued",
+        "total": None,
+        "processed": 0,
+        "user_id": user_id,
+    }
+    save_bulk_job(job["job_id"], job)
+    enqueue("bulk", job_id=job["job_id"], action=action, filters=filters)
+    return job
+
+@task_handler("bulk")
+def run_bulk_job(job_id, action, filters):
+    """Task handler working through a bulk job chunk by chunk."""
+    job = get_bulk_job(job_id) or {"job_id": job_id, "action": action, "processed": 0}
+    after_id = 0
+    try:
+        job["total"] = filtered_query(filters).count()
+        job["status"] = "running"
+        save_bulk_job(job_id, job)
+        while True:
+            count, after_id = run_chunk(filters, action, after_id)
+            if not count:
+                break
+            job["processed"] += count
+            save_bulk_job(job_id, job)
+            time.sleep(BULK_CHUNK_PAUSE)
+        job["status"] = "completed"
+    except Exception as e:
+        db.session.rollback()
+        logging.error("Bulk job %s failed: %s", job_id, e)
+        job["status"] = "failed"
+        job["error"] = str(e)
+    save_bulk_job(job_id, job)
@@ -0,0 +1,75 @@
+import hashlib
+import logging
+from functools import wraps
+from flask import request
+from config import app, cache
+
+# Seconds a cached GET response may live even without an invalidation.
+CACHE_RESPONSE_TIMEOUT = app.config.get("CACHE_RESPONSE_TIMEOUT", 300)
+
+def _tag_key(tag):
+    return f"tag:{tag}"
+
+def _tag_versions(tags):
+    """Return the current generation number of each tag."""
+    versions = cache.get_many(*[_tag_key(tag) for tag in tags])
+    return [version or 0 for version in versions]
+
+def invalidate_tags(*tags):
+    """
+    Invalidate every cached response depending on any of the given tags.
+    Bumping the tag generation changes the cache key of dependent responses,
+    so stale entries are never read again and simply expire.
+    """
+    for tag in tags:
+        try:
+            cache.cache.inc(_tag_key(tag))
+        except Exception as e:
+            logging.error("Cache invalidation error for tag %s: %s", tag, e)
+
+def cached_response(*tags, timeout=None):
+    """
+    Decorator caching a JSON GET response under the given tags.
+    Sets an ETag on the response and answers conditional GETs with 304.
+    Must be applied below login_required so authorization runs first.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            try:
+                versions = _tag_versions(tags)
+                key = "view:{}:{}:{}".format(
+                    f.__name__,
+                    ",".join(f"{tag}={version}" for tag, version in zip(tags, versions)),
+                    request.full_path,
+                )
+                entry = cache.get(key)
+            except Exception as e:
+                logging.error("Cache lookup error: %s", e)
+                return f(*args, **kwargs)
+
+            if entry is None:
+                rv = f(*args, **kwargs)
+                response = app.make_response(rv)
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                entry = {
+                    "body": body,
+                    "etag": hashlib.md5(body).hexdigest(),
+                    "mimetype": response.mimetype,
+                }
+                try:
+                    cache.set(key, entry, timeout=timeout or CACHE_RESPONSE_TIMEOUT)
+                except Exception as e:
+                    logging.error("Cache store error: %s", e)
+
+            if entry["etag"] in request.if_none_match:
+                response = app.response_class(status=304)
+            else:
+                response = app.response_class(entry["body"], mimetype=entry["mimetype"])
+            response.set_etag(entry["etag"])
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return decorated_function
+    return decorator
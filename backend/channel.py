@@ -0,0 +1,150 @@
+"""
+Bidirectional WebSocket channel for agents' browsers at /api/ws.
+
+One authenticated connection replaces the per-event HTTP requests: the client
+uploads detections and read acknowledgements over it, and the server pushes
+the same notification payloads as /api/notification-events.
+
+Client -> server
+    text:   {"op": "detection", "ref": 1, "data": {...}}   body of /api/detect-objects
+            {"op": "ack", "ref": 2, "ids": [12, 13]}        mark notifications read
+            {"op": "ping", "ref": 3}
+    binary: 4-byte big-endian header length, JSON header, raw image bytes.
+            The header is a "detection" message whose data omits annotated_image
+            and may give the image "content_type" (default image/jpeg). The
+            image is written to the blob store as-is, once the detection has
+            passed admission control and validation.
+
+Server -> client
+    {"op": "result", "ref": 1, "status": 201, "body": {...}}
+        Detections are rate limited like the HTTP endpoints; a rejected one
+        gets status 429 and "retry_after" seconds in the body.
+    {"op": "event", "data": {...}}
+
+Each connection blocks on receive() while a companion thread (a greenlet
+under the gevent workers, see gunicorn.conf.py) blocks on the notification
+queue and pushes events; neither polls.
+"""
+import json
+import math
+import queue
+import struct
+import logging
+import threading
+from flask import session
+from flask_sock import Sock, ConnectionClosed
+from config import app
+from extensions import db
+from blobs import save_bytes
+from events import broadcaster
+from ingest import record_object_detection, mark_notifications_read
+from metrics import WEBSOCKET_CLIENTS
+from ratelimit import admission
+
+sock = Sock(app)
+
+# How often an idle pusher wakes up to notice a closed connection.
+PUSH_IDLE_TIMEOUT = 15
+
+def decode_binary_frame(frame):
+    """
+    Split a binary frame into its JSON header and attached image. Returns
+    (header, (image bytes, content type)), or (header, None) without an image.
+    """
+    (header_length,) = struct.unpack(">I", frame[:4])
+    header = json.loads(frame[4:4 + header_length])
+    image = frame[4 + header_length:]
+    if not image:
+        return header, None
+    content_type = (header.get("data") or {}).pop("content_type", "image/jpeg")
+    return header, (image, content_type)
+
+def handle_message(message, user_id, image=None):
+    """
+    Execute one client message for a user and return the (status, body)
+    result. image is the (bytes, content type) attached to a binary frame.
+    """
+    op = message.get("op")
+    if op == "detection":
+        data = message.get("data") or {}
+        retry_after, reason = admission.admit(f"user:{user_id}", data.get("stream_url"))
+        if reason:
+            return 429, {"message": "Too many detection events", "reason": reason,
+                         "retry_after": math.ceil(retry_after)}
+        store_image = (lambda: save_bytes(*image)) if image else None
+        body, status = record_object_detection(data, store_image)
+        return status, body
+    if op == "ack":
+        updated = mark_notifications_read(user_id, message.get("ids") or [])
+        return 200, {"message": "Notifications marked as read", "updated": updated}
+    if op == "ping":
+        return 200, {"message": "pong"}
+    return 400, {"message": f"Unknown op: {op}"}
+
+def push_events(ws, subscriber, send, closed):
+    """Send the broadcaster's events to one client until it disconnects."""
+    try:
+        while not closed.is_set():
+            try:
+                payload = subscriber.get(timeout=PUSH_IDLE_TIMEOUT)
+            except queue.Empty:
+                continue
+            if payload is None:
+                return
+            send({"op": "event", "data": payload})
+    except ConnectionClosed:
+        pass
+    except Exception as e:
+        logging.error("WebSocket push error: %s", e)
+
+@sock.route("/api/ws")
+def channel(ws):
+    # Authentication happens once, at the handshake, instead of per event.
+    if "user_id" not in session:
+        ws.close(reason=1008, message="Authentication required")
+        return
+    subscriber = broadcaster.subscribe()
+    WEBSOCKET_CLIENTS.inc()
+    send_lock = threading.Lock()
+    closed = threading.Event()
+
+    def send(message):
+        # Results and pushes come from two threads; keep their frames apart.
+        with send_lock:
+            ws.send(json.dumps(message))
+
+    try:
+        backlog = broadcaster.replay()
+        # The view lives as long as the socket; don't hold a pooled connection meanwhile.
+        db.session.remove()
+        for payload in backlog:
+            send({"op": "event", "data": payload})
+        threading.Thread(target=push_events, args=(ws, subscriber, send, closed), daemon=True).start()
+        while True:
+            frame = ws.receive()
+            ref = None
+            try:
+                if isinstance(frame, bytes):
+                    message, image = decode_binary_frame(frame)
+                else:
+                    message, image = json.loads(frame), None
+                ref = message.get("ref")
+                status, body = handle_message(message, session["user_id"], image)
+            except Exception as e:
+                db.session.rollback()
+                logging.error("WebSocket message error: %s", e)
+                status, body = 500, {"message": "Error handling message", "error": str(e)}
+            finally:
+                db.session.remove()
+            send({"op": "result", "ref": ref, "status": status, "body": body})
+    except ConnectionClosed:
+        pass
+    finally:
+        broadcaster.unsubscribe(subscriber)
+        closed.set()
+        try:
+            # Wake the pusher so it exits now rather than at its next timeout.
+            subscriber.put_nowait(None)
+        except queue.Full:
+            pass
+        WEBSOCKET_CLIENTS.dec()
@@ -1,63 +1,211 @@
 import os
 import time
+import bisect
 import logging
+import threading
+from datetime import datetime, timedelta
 from config import app
+from extensions import db
+from models import AnnotatedFrame
+from blobs import delete_frames
+from metrics import heartbeat, CLEANUP_RECLAIMED_BYTES
+from leader import host_leader, background_leader
 
-def cleanup_chat_images():
+class FolderIndex:
     """
-    Remove chat images older than 20 seconds from the chat images folder.
+    Time-ordered index of the files in one folder, evicted by age and size.
+    The folder is only relisted (with os.scandir) when its mtime changes, so
+    idle cycles cost a single stat call. A relisting only stats the files it
+    has not seen before and inserts them in order, instead of re-sorting the
+    whole folder.
     """
-    chat_folder = app.config["CHAT_IMAGES_FOLDER"]
-    now = time.time()
-    for filename in os.listdir(chat_folder):
-        filepath = os.path.join(chat_folder, filename)
-        if os.path.isfile(filepath):
-            file_age = now - os.path.getctime(filepath)
-            if file_age > 20:
+    def __init__(self, folder, max_age=None, max_bytes=None):
+        self.folder = folder
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.entries = []  # sorted (ctime, path, size)
+        self.known = {}  # path -> its entry
+        self.total_bytes = 0
+        self.dir_mtime = None
+        self.lock = threading.Lock()
+
+    def _reset(self):
+        self.entries, self.known, self.total_bytes, self.dir_mtime = [], {}, 0, None
+
+    def refresh(self):
+        """Pick up the files added or removed since the last listing."""
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            self._reset()
+            return
+        if mtime == self.dir_mtime:
+            return
+        listed = set()
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                listed.add(entry.path)
+                if entry.path in self.known:
+                    continue
                 try:
-                    os.remove(filepath)
+                    if entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        item = (st.st_ctime, entry.path, st.st_size)
+                        bisect.insort(self.entries, item)
+                        self.known[entry.path] = item
+                        self.total_bytes += st.st_size
+                except FileNotFoundError:
+                    continue
+        gone = self.known.keys() - listed
+        if gone:
+            # Removed by something else, e.g. the OCR task moving a flagged image.
+            self.entries = [item for item in self.entries if item[1] not in gone]
+            for path in gone:
+                self.total_bytes -= self.known.pop(path)[2]
+        # A file added within the same tick may not move a coarse mtime again,
+        # so a folder that just changed is relisted on the next cycle too.
+        self.dir_mtime = mtime if time.time_ns() - mtime > 1_000_000_000 else None
+
+    def evict(self, now=None):
+        """
+        Delete files older than max_age, then the oldest files until the folder
+        fits in max_bytes. Returns (files_removed, bytes_reclaimed).
+        """
+        now = now or time.time()
+        with self.lock:
+            self.refresh()
+            cutoff = now - self.max_age if self.max_age is not None else None
+            removed = reclaimed = 0
+            keep_from = 0
+            for ctime, path, size in self.entries:
+                too_old = cutoff is not None and ctime < cutoff
+                over_budget = self.max_bytes is not None and self.total_bytes > self.max_bytes
+                if not (too_old or over_budget):
+                    break
+                try:
+                    os.remove(path)
+                    removed += 1
+                    reclaimed += size
+                except FileNotFoundError:
+                    pass
                 except Exception as e:
-                    logging.error("Error deleting file %s: %s", filepath, e)
+                    logging.error("Error deleting file %s: %s", path, e)
+                    break
+                keep_from += 1
+                self.total_bytes -= size
+                del self.known[path]
+            # Our deletions move the folder mtime, so the next cycle relists
+            # it; that is cheap, and catches files added meanwhile, which
+            # re-reading the mtime here would hide.
+            del self.entries[:keep_from]
+        if reclaimed:
+            CLEANUP_RECLAIMED_BYTES.labels(self.folder).inc(reclaimed)
+            logging.info("Cleanup removed %s files (%s bytes) from %s", removed, reclaimed, self.folder)
+        return removed, reclaimed
+
+FRAME_CLEANUP_BATCH = 500
+
+# Age (seconds) and size (bytes) budgets per folder.
+cleanup_indexes = {
+    "chat_images": FolderIndex(
+        app.config["CHAT_IMAGES_FOLDER"],
+        max_age=app.config["CHAT_IMAGES_MAX_AGE"],
+        max_bytes=app.config["CHAT_IMAGES_MAX_BYTES"],
+    ),
+    "flagged_chat_images": FolderIndex(
+        app.config["FLAGGED_CHAT_IMAGES_FOLDER"],
+        max_age=app.config["FLAGGED_CHAT_IMAGES_MAX_AGE"],
+        max_bytes=app.config["FLAGGED_CHAT_IMAGES_MAX_BYTES"],
+    ),
+    "detection_images": FolderIndex(
+        app.config["DETECTIONS_FOLDER"],
+        max_age=app.config["DETECTION_IMAGES_MAX_AGE"],
+        max_bytes=app.config["DETECTION_IMAGES_MAX_BYTES"],
+    ),
+    "clips": FolderIndex(
+        app.config["CLIPS_FOLDER"],
+        max_age=app.config["CLIPS_MAX_AGE"],
+        max_bytes=app.config["CLIPS_MAX_BYTES"],
+    ),
+}
+
+def cleanup_chat_images():
+    """Evict chat images and flagged chat images by age and size budget."""
+    chat = cleanup_indexes["chat_images"].evict()
+    flagged = cleanup_indexes["flagged_chat_images"].evict()
+    return chat[0] + flagged[0], chat[1] + flagged[1]
 
 def start_chat_cleanup_thread():
     """Start a background thread to clean up chat images."""
     def cleanup_loop():
         while True:
             try:
-                cleanup_chat_images()
+                # Uploads are pod-local, so this runs on every host, not once per cluster.
+                if host_leader.is_leader():
+                    cleanup_chat_images()
             except Exception as e:
                 logging.error("Chat cleanup error: %s", e)
+            heartbeat("chat_cleanup", 20)
             time.sleep(20)
-    import threading
     threading.Thread(target=cleanup_loop, daemon=True).start()
 
 def cleanup_detection_images():
+    """Evict detection images by age and size budget."""
+    return cleanup_indexes["detection_images"].evict()
+
+def cleanup_annotated_frames(now=None):
     """
-    Remove detection images older than 30 minutes from the detections folder.
+    Delete stored annotated frames older than ANNOTATED_FRAMES_MAX_AGE, then
+    the oldest ones while the rest exceed ANNOTATED_FRAMES_MAX_BYTES.
+    Idle cycles run one aggregate query; only the rows being deleted are
+    loaded, FRAME_CLEANUP_BATCH at a time. Returns (frames_removed, bytes_reclaimed).
     """
-    detections_folder = "detections"
-    now = time.time()
-    threshold = 1800  # 30 minutes
-    if not os.path.exists(detections_folder):
-        return
-    for filename in os.listdir(detections_folder):
-        filepath = os.path.join(detections_folder, filename)
-        if os.path.isfile(filepath):
-            file_age = now - os.path.getctime(filepath)
-            if file_age > threshold:
-                try:
-                    os.remove(filepath)
-                except Exception as e:
-                    logging.error("Error deleting detection image %s: %s", filepath, e)
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=app.config["ANNOTATED_FRAMES_MAX_AGE"])
+    max_bytes = app.config["ANNOTATED_FRAMES_MAX_BYTES"]
+    removed = reclaimed = 0
+    with app.app_context():
+        total, oldest = db.session.query(
+            db.func.coalesce(db.func.sum(AnnotatedFrame.size), 0), db.func.min(AnnotatedFrame.created_at)
+        ).one()
+        while oldest is not None and (oldest < cutoff or total > max_bytes):
+            batch = db.session.query(AnnotatedFrame.id, AnnotatedFrame.size, AnnotatedFrame.created_at) \
+                .order_by(AnnotatedFrame.created_at).limit(FRAME_CLEANUP_BATCH).all()
+            ids = []
+            for frame_id, size, created_at in batch:
+                if created_at >= cutoff and total <= max_bytes:
+                    break
+                ids.append(frame_id)
+                total -= size
+                reclaimed += size
+            if not ids:
+                break
+            delete_frames(ids)
+            db.session.commit()
+            removed += len(ids)
+            if len(ids) < FRAME_CLEANUP_BATCH:
+                break
+    if reclaimed:
+        CLEANUP_RECLAIMED_BYTES.labels("annotated_frames").inc(reclaimed)
+        logging.info("Cleanup removed %s annotated frames (%s bytes)", removed, reclaimed)
+    return removed, reclaimed
+
+def cleanup_clips():
+    """Evict detection clips by age and size budget."""
+    return cleanup_indexes["clips"].evict()
 
 def start_detection_cleanup_thread():
     """Start a background thread to clean up detection images."""
     def cleanup_loop():
         while True:
             try:
-                cleanup_detection_images()
+                if host_leader.is_leader():
+                    cleanup_detection_images()
+                    cleanup_clips()
+                # Frames are in the shared database, so once per cluster.
+                if background_leader.is_leader():
+                    cleanup_annotated_frames()
             except Exception as e:
                 logging.error("Detection cleanup error: %s", e)
-            time.sleep(1800)
-    import threading
+            heartbeat("detection_cleanup", 60)
+            time.sleep(60)
     threading.Thread(target=cleanup_loop, daemon=True).start()
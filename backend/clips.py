@@ -0,0 +1,261 @@
+"""
+Rolling clip recorder for evidence capture.
+
+While it holds the background-jobs lease, this process follows the HLS
+playlist of every monitored stream and keeps its most recent segments in a
+ring buffer. When an object detection is logged for a stream, the buffered
+segments are written back to back into a clip (MPEG-TS and fMP4 segments
+concatenate without re-encoding) and the clip URL is stored on the log.
+
+The recorder is off unless CLIP_RECORDER_ENABLED=1. It runs in the leader
+web worker, holding up to CLIP_BUFFER_BYTES of segments across all rings,
+and writes clips to its own pod's CLIPS_FOLDER: with several replicas that
+folder must be a shared volume for /api/clips to find them.
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+from config import app
+from extensions import db
+from models import Stream, Log, ChaturbateStream, StripchatStream
+from metrics import heartbeat
+from leader import background_leader
+from scheduler import stream_scheduler
+import hls
+
+# Segments kept per stream; at typical 2-6s segments this is 10-30s of context.
+CLIP_SEGMENTS = 5
+# Loop tick; how often each stream is actually polled is set by the scheduler.
+CLIP_POLL_INTERVAL = 1
+STREAM_REFRESH_INTERVAL = 60
+# Segments held by all rings together; the largest rings are trimmed first.
+CLIP_BUFFER_BYTES = int(os.getenv("CLIP_BUFFER_BYTES", 64 * 1024 * 1024))
+CLIP_URL_PREFIX = "/api/clips/"
+CLIP_RECORDER_ENABLED = os.getenv("CLIP_RECORDER_ENABLED", "0") == "1"
+
+recorder_executor = ThreadPoolExecutor(max_workers=8)
+
+def stream_m3u8_url(stream):
+    """Return the stored M3U8 URL of a Chaturbate or Stripchat stream."""
+    return getattr(stream, "chaturbate_m3u8_url", None) or getattr(stream, "stripchat_m3u8_url", None)
+
+class SegmentRing:
+    """
+    Ring buffer of the latest segments of one stream. Each new segment is
+    also passed to the listeners as listener(ring, segment, init_segment).
+    """
+    def __init__(self, url, size=CLIP_SEGMENTS, listeners=()):
+        self.url = url
+        self.media_url = None
+        self.listeners = listeners
+        self.stream = {}  # room_url, streamer_name and platform of the stream
+        # (segment url, Segment, init section url, init Segment)
+        self.segments = deque(maxlen=size)
+        self.last_url = None
+        self.lock = threading.Lock()
+        # Held for a whole poll so scheduled polls and clip catch-ups don't overlap.
+        self.poll_lock = threading.Lock()
+
+    def poll(self):
+        """Fetch the segments published since the last poll."""
+        if self.media_url is None:
+            playlist = hls.get_playlist(self.url)
+            if playlist.is_variant:
+                variant = hls.select_variant(playlist.variants())
+                if variant is None:
+                    return
+                playlist = hls.get_playlist(variant["uri"])
+            self.media_url = playlist.url
+        else:
+            playlist = hls.get_playlist(self.media_url)
+        urls = [urljoin(playlist.url, segment.uri) for segment in playlist.parsed.segments]
+        start = urls.index(self.last_url) + 1 if self.last_url in urls else 0
+        # Older segments would be pushed out of the ring immediately.
+        new = list(zip(playlist.parsed.segments, urls))[start:][-self.segments.maxlen:]
+        for segment, url in new:
+            init_url = init = None
+            if segment.init_section is not None:
+                init_url = urljoin(playlist.url, segment.init_section.uri)
+                init = hls.get_segment(init_url, playlist.url)
+            content = hls.get_segment(url, playlist.url)
+            with self.lock:
+                self.segments.append((url, content, init_url, init))
+                self.last_url = url
+            for listener in self.listeners:
+                listener(self, content, init)
+
+    def snapshot(self, path):
+        """Write the buffered segments to path as one clip; return False if empty."""
+        with self.lock:
+            segments = list(self.segments)
+        if not segments:
+            return False
+        buffers = []
+        current_init = None
+        for _, content, init_url, init in segments:
+            if init is not None and init_url != current_init:
+                buffers.append(init.content)
+                current_init = init_url
+            buffers.append(content.content)
+        # Large buffers bypass BufferedWriter, so segments are never joined in memory.
+        with open(path, "wb") as f:
+            f.writelines(buffers)
+        return True
+
+    def nbytes(self):
+        with self.lock:
+            return sum(len(content) for _, content, _, _ in self.segments)
+
+    def drop_oldest(self):
+        with self.lock:
+            if self.segments:
+                self.segments.popleft()
+
+    def is_fmp4(self):
+        with self.lock:
+            return bool(self.segments) and self.segments[-1][3] is not None
+
+class ClipRecorder:
+    """Keeps a SegmentRing per monitored stream and clips it on detections."""
+    def __init__(self):
+        self.rings = {}  # stored M3U8 URL -> SegmentRing
+        self.aliases = {}  # stream room URL -> stored M3U8 URL
+        self.last_log_id = None
+        self.streams_refreshed_at = 0
+        self.polls = {}  # stored M3U8 URL -> Future of its running poll
+        self.budget_lock = threading.Lock()
+        # Called with every newly fetched segment, e.g. by the audio pipeline.
+        self.segment_listeners = []
+
+    def reset(self):
+        self.rings = {}
+        self.aliases = {}
+        self.last_log_id = None
+        self.streams_refreshed_at = 0
+        self.polls = {}
+
+    def refresh_streams(self):
+        poly = db.with_polymorphic(Stream, [ChaturbateStream, StripchatStream])
+        streams = {}
+        for stream in db.session.query(poly).all():
+            url = stream_m3u8_url(stream)
+            if url:
+                streams[url] = stream
+        rings = {}
+        for url, stream in streams.items():
+            ring = self.rings.get(url) or SegmentRing(url, listeners=self.segment_listeners)
+            ring.stream = {
+                "room_url": stream.room_url,
+                "streamer_name": stream.streamer_username,
+                "platform": stream.type,
+            }
+            rings[url] = ring
+        self.rings = rings
+        self.aliases = {stream.room_url: url for url, stream in streams.items()}
+        self.streams_refreshed_at = time.monotonic()
+
+    def _poll_ring(self, ring):
+        try:
+            with ring.poll_lock:
+                ring.poll()
+        except Exception as e:
+            logging.error("Clip recorder error for %s: %s", ring.url, e)
+            # The playlist URL may have rotated; resolve it again next time.
+            ring.media_url = None
+        self.enforce_budget()
+
+    def enforce_budget(self):
+        """Trim the largest rings until all of them fit in CLIP_BUFFER_BYTES."""
+        with self.budget_lock:
+            sizes = {ring: ring.nbytes() for ring in list(self.rings.values())}
+            total = sum(sizes.values())
+            while total > CLIP_BUFFER_BYTES:
+                ring = max(sizes, key=sizes.get)
+                ring.drop_oldest()
+                total -= sizes[ring]
+                sizes[ring] = ring.nbytes()
+                total += sizes[ring]
+
+    def find_ring(self, room_url):
+        ring = self.rings.get(self.aliases.get(room_url, room_url))
+        if ring is None:
+            ring = next((r for r in self.rings.values() if r.media_url == room_url), None)
+        return ring
+
+    def save_clip(self, ring):
+        """Snapshot a ring into the clips folder and return the clip URL."""
+        filename = f"{uuid.uuid4().hex}.{'mp4' if ring.is_fmp4() else 'ts'}"
+        if ring.snapshot(os.path.join(app.config["CLIPS_FOLDER"], filename)):
+            return CLIP_URL_PREFIX + filename
+        return None
+
+    def clip_detection(self, ring, log_id):
+        """Catch up on a ring, cut a clip from it and store it on the log."""
+        # Quiet streams are sampled rarely; catch up before cutting the clip.
+        self._poll_ring(ring)
+        clip = self.save_clip(ring)
+        if not clip:
+            return
+        with app.app_context():
+            log = db.session.get(Log, log_id)
+            if log is not None:
+                log.details = {**log.details, "clip": clip}
+                db.session.commit()
+
+    def capture_new_detections(self):
+        if self.last_log_id is None:
+            # Only detections logged after we started recording can be clipped.
+            self.last_log_id = db.session.query(db.func.max(Log.id)).scalar() or 0
+            return
+        logs = Log.query.filter(
+            Log.id > self.last_log_id,
+            Log.event_type == "object_detection"
+        ).order_by(Log.id).all()
+        for log in logs:
+            self.last_log_id = log.id
+            ring = self.find_ring(log.room_url)
+            if ring:
+                recorder_executor.submit(self.clip_detection, ring, log.id)
+
+    def run_once(self):
+        if time.monotonic() - self.streams_refreshed_at > STREAM_REFRESH_INTERVAL:
+            self.refresh_streams()
+        stream_scheduler.set_streams({
+            url: (url, ring.stream.get("room_url"), ring.media_url) for url, ring in self.rings.items()
+        })
+        stream_scheduler.rescore()
+        now = time.monotonic()
+        # Polls run in the background so a slow upstream never stalls this loop;
+        # a stream whose last poll is still running is skipped until it ends.
+        for url in stream_scheduler.due(now):
+            running = self.polls.get(url)
+            if running is not None and not running.done():
+                continue
+            self.polls[url] = recorder_executor.submit(self._poll_ring, self.rings[url])
+            stream_scheduler.mark_sampled(url, now)
+        self.capture_new_detections()
+
+clip_recorder = ClipRecorder()
+
+def start_clip_recorder():
+    """Start the clip recorder thread; it only records while leader."""
+    if not CLIP_RECORDER_ENABLED:
+        return
+    def record_loop():
+        while True:
+            try:
+                if not background_leader.is_leader():
+                    clip_recorder.reset()
+                else:
+                    with app.app_context():
+                        clip_recorder.run_once()
+            except Exception as e:
+                logging.error("Clip recorder error: %s", e)
+            heartbeat("clip_recorder", CLIP_POLL_INTERVAL)
+            time.sleep(CLIP_POLL_INTERVAL)
+    threading.Thread(target=record_loop, daemon=True).start()
@@ -2,14 +2,19 @@ import os
 import logging
 from datetime import timedelta
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_cors import CORS
 from extensions import db
 from flask_caching import Cache
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "http://127.0.0.1:3000"}}, supports_credentials=True)
+# Requests arrive through the ingress controller; take the client address
+# (used to rate limit anonymous callers) from its X-Forwarded-For header.
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.getenv("TRUSTED_PROXY_HOPS", 1)), x_proto=1)
 
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///stream_monitor.db"
+# DATABASE_URL points the app at another database; the tests use a throwaway SQLite file.
+app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///stream_monitor.db")
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_size": 20,
     "max_overflow": 40,
@@ -22,14 +27,33 @@ app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=1)
 app.config["UPLOAD_FOLDER"] = "uploads"
 app.config["CHAT_IMAGES_FOLDER"] = os.path.join(app.config["UPLOAD_FOLDER"], "chat_images")
 app.config["FLAGGED_CHAT_IMAGES_FOLDER"] = os.path.join(app.config["UPLOAD_FOLDER"], "flagged_chat_images")
+app.config["DETECTIONS_FOLDER"] = "detections"
+# Evidence clips cut from the recent segments of a stream on detection.
+app.config["CLIPS_FOLDER"] = os.path.join(app.config["UPLOAD_FOLDER"], "clips")
 
-# Redis caching
-app.config["CACHE_TYPE"] = "RedisCache"
-app.config["CACHE_REDIS_URL"] = "redis://localhost:6379/0"
+# Cleanup budgets: files are removed once older than MAX_AGE seconds, and the
+# oldest files are removed while a folder is larger than MAX_BYTES.
+app.config["CHAT_IMAGES_MAX_AGE"] = 20
+app.config["CHAT_IMAGES_MAX_BYTES"] = 256 * 1024 * 1024
+app.config["FLAGGED_CHAT_IMAGES_MAX_AGE"] = 7 * 24 * 3600
+app.config["FLAGGED_CHAT_IMAGES_MAX_BYTES"] = 1024 * 1024 * 1024
+app.config["DETECTION_IMAGES_MAX_AGE"] = 1800
+app.config["DETECTION_IMAGES_MAX_BYTES"] = 1024 * 1024 * 1024
+# Annotated frames and thumbnails are rows in the annotated_frames table.
+app.config["ANNOTATED_FRAMES_MAX_AGE"] = 7 * 24 * 3600
+app.config["ANNOTATED_FRAMES_MAX_BYTES"] = 2 * 1024 * 1024 * 1024
+app.config["CLIPS_MAX_AGE"] = 7 * 24 * 3600
+app.config["CLIPS_MAX_BYTES"] = 5 * 1024 * 1024 * 1024
+
+# Redis caching (set CACHE_TYPE=SimpleCache to run without Redis, e.g. in tests)
+app.config["CACHE_TYPE"] = os.getenv("CACHE_TYPE", "RedisCache")
+app.config["CACHE_REDIS_URL"] = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+app.config["CACHE_RESPONSE_TIMEOUT"] = 300
 cache = Cache(app)
 
 os.makedirs(app.config["CHAT_IMAGES_FOLDER"], exist_ok=True)
 os.makedirs(app.config["FLAGGED_CHAT_IMAGES_FOLDER"], exist_ok=True)
+os.makedirs(app.config["CLIPS_FOLDER"], exist_ok=True)
 
 db.init_app(app)
 
@@ -1,33 +1,64 @@
-import cv2
-import numpy as np
-import spacy
-from spacy.matcher import Matcher
+import os
+import shutil
 import threading
 import logging
-from models import ChatKeyword, FlaggedObject
+from models import ChatKeyword, FlaggedObject, Log
 from config import app
 from extensions import db
+from metrics import stage_timer, EVENTS_TOTAL
+from notifications import send_chat_telegram_notification
+from tasks import task_handler
+import readstate
 
-# Load the spaCy language model and initialize the matcher
-nlp = spacy.load("en_core_web_sm")
-matcher = Matcher(nlp.vocab)
+# The spaCy model is loaded on first use (or by warm_up_models) rather than at
+# import, so workers can boot and serve /health without paying for it.
+_nlp = None
+_nlp_lock = threading.Lock()
+# The keyword matcher is replaced whole by refresh_keywords(); callers take
+# the reference once and use that, never a half-built one.
+matcher = None
+_matcher_lock = threading.Lock()
+
+def get_nlp():
+    """Return the shared spaCy language model, loading it on first call."""
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                import spacy
+                with stage_timer("model_load"):
+                    _nlp = spacy.load("en_core_web_sm")
+    return _nlp
+
+def warm_up_models():
+    """Load the detection models now instead of on the first request."""
+    get_nlp()
 
 def refresh_keywords():
-    """Refresh the keyword matcher with flagged chat keywords from the database."""
-    with app.app_context():
-        keywords = [kw.keyword.lower() for kw in ChatKeyword.query.all()]
+    """
+    Rebuild the keyword matcher from the flagged chat keywords in the
+    database, publish it and return it.
+    """
+    from spacy.matcher import Matcher
     global matcher
-    matcher = Matcher(nlp.vocab)
-    for word in keywords:
-        pattern = [{"LOWER": word}]
-        matcher.add(word, [pattern])
+    # Concurrent refreshes publish in order, so a stale keyword list can't win.
+    with _matcher_lock:
+        with app.app_context():
+            keywords = [kw.keyword.lower() for kw in ChatKeyword.query.all()]
+        fresh = Matcher(get_nlp().vocab)
+        for word in keywords:
+            pattern = [{"LOWER": word}]
+            fresh.add(word, [pattern])
+        matcher = fresh
+    return fresh
 
 def detect_chat(stream_url=""):
     """Detect flagged keywords in a sample chat message."""
-    refresh_keywords()
+    keyword_matcher = refresh_keywords()
     sample_message = "Sample chat message containing flagged keywords"
-    doc = nlp(sample_message.lower())
-    matches = matcher(doc)
+    with stage_timer("nlp"):
+        doc = get_nlp()(sample_message.lower())
+        matches = keyword_matcher(doc)
     detected = set()
     if matches:
         for match_id, start, end in matches:
@@ -56,3 +87,38 @@ def detect_frame(frame):
     This function always returns an empty list.
     """
     return []
+
+@task_handler("ocr", concurrency=2)
+def process_chat_image(chat_image_path):
+    """
+    OCR a chat screenshot and flag it if it contains chat keywords.
+    Flagged images are moved to the flagged folder, logged and sent to Telegram.
+    Returns the list of detected keywords.
+    """
+    import pytesseract
+    from PIL import Image
+    image = Image.open(chat_image_path)
+    with stage_timer("ocr"):
+        ocr_text = pytesseract.image_to_string(image)
+    refresh_keywords()
+    flagged_keywords = [kw.keyword for kw in ChatKeyword.query.all()]
+    detected_keywords = [kw for kw in flagged_keywords if kw.lower() in ocr_text.lower()]
+    if detected_keywords:
+        flagged_filename = f"flagged_{os.path.basename(chat_image_path)}"
+        flagged_filepath = os.path.join(app.config["FLAGGED_CHAT_IMAGES_FOLDER"], flagged_filename)
+        shutil.move(chat_image_path, flagged_filepath)
+        description = (
+            "Chat flagged: Detected keywords " + ", ".join(detected_keywords) +
+            ". OCR text: " + ocr_text
+        )
+        log_entry = Log(
+            room_url="chat",
+            event_type="chat_detection",
+            details={"keywords": detected_keywords, "ocr_text": ocr_text},
+        )
+        db.session.add(log_entry)
+        db.session.commit()
+        EVENTS_TOTAL.labels(log_entry.event_type).inc()
+        readstate.count_new_log(log_entry)
+        send_chat_telegram_notification(flagged_filepath, description)
+    return detected_keywords
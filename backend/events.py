@@ -0,0 +1,118 @@
+import json
+import time
+import queue
+import logging
+import threading
+from datetime import datetime, timedelta
+from config import app
+from extensions import db
+from models import Log
+
+SSE_EVENT_TYPES = ["object_detection", "video_notification"]
+# How far back a newly connected client is replayed.
+SSE_REPLAY_SECONDS = 30
+SSE_POLL_INTERVAL = 1
+SSE_KEEPALIVE_SECONDS = 15
+# Per-client buffer; a client that falls this far behind loses events rather
+# than growing memory.
+SSE_CLIENT_QUEUE_SIZE = 100
+
+def log_to_payloads(log):
+    """Convert a detection log into the SSE payloads sent to dashboards."""
+    if log.event_type == "object_detection":
+        return [
+            {
+                "type": "detection",
+                "stream": log.room_url,
+                "object": det.get("class", "object"),
+                "confidence": det.get("confidence", 0),
+                "id": log.id,
+            }
+            for det in log.details.get("detections", [])
+        ]
+    if log.event_type == "video_notification":
+        return [{
+            "type": "video",
+            "stream": log.room_url,
+            "message": log.details.get("message", "Video event occurred"),
+            "id": log.id,
+        }]
+    return []
+
+class NotificationBroadcaster:
+    """
+    One poller per worker reads new logs and fans them out to every connected
+    SSE client, so the database cost no longer grows with the client count.
+    Works with threads under sync workers and with greenlets under gevent.
+    """
+    def __init__(self):
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.last_id = 0
+        self._started = False
+
+    def _poll(self):
+        with app.app_context():
+            logs = Log.query.filter(
+                Log.id > self.last_id,
+                Log.event_type.in_(SSE_EVENT_TYPES)
+            ).order_by(Log.id).all()
+            payloads = []
+            for log in logs:
+                self.last_id = log.id
+                payloads.extend(log_to_payloads(log))
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for payload in payloads:
+            for subscriber in subscribers:
+                try:
+                    subscriber.put_nowait(payload)
+                except queue.Full:
+                    pass
+
+    def _run(self):
+        while True:
+            try:
+                self._poll()
+            except Exception as e:
+                logging.error("SSE broadcaster error: %s", e)
+                time.sleep(5)
+            time.sleep(SSE_POLL_INTERVAL)
+
+    def subscribe(self):
+        """Register a client and return the queue its payloads are pushed to."""
+        subscriber = queue.Queue(maxsize=SSE_CLIENT_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.add(subscriber)
+            if not self._started:
+                self._started = True
+                # Clients get older events from replay(); poll only newer ones.
+                with app.app_context():
+                    self.last_id = db.session.query(db.func.max(Log.id)).scalar() or 0
+                threading.Thread(target=self._run, daemon=True).start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def replay(self):
+        """Return the payloads from the last SSE_REPLAY_SECONDS for a new client."""
+        cutoff = datetime.utcnow() - timedelta(seconds=SSE_REPLAY_SECONDS)
+        logs = Log.query.filter(
+            Log.timestamp >= cutoff,
+            Log.event_type.in_(SSE_EVENT_TYPES)
+        ).order_by(Log.timestamp.desc()).all()
+        return [payload for log in logs for payload in log_to_payloads(log)]
+
+    def stream(self, subscriber, backlog):
+        """Generator yielding SSE messages for one subscribed client, forever."""
+        for payload in backlog:
+            yield "data: " + json.dumps(payload) + "\n\n"
+        while True:
+            try:
+                yield "data: " + json.dumps(subscriber.get(timeout=SSE_KEEPALIVE_SECONDS)) + "\n\n"
+            except queue.Empty:
+                yield ": keepalive\n\n"
+
+broadcaster = NotificationBroadcaster()
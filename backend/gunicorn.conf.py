@@ -0,0 +1,65 @@
+import os
+
+# gevent serves each request, including long-lived /api/notification-events
+# streams and /api/ws connections, on a greenlet, so one worker holds
+# hundreds of clients. Under sync or gthread workers each of those would pin
+# a worker thread, so no other worker class is accepted (see on_starting).
+# Patching must happen before the app is preloaded, hence here rather than
+# in the worker.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+if worker_class == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+import gc
+import shutil
+
+# Shared directory where each worker writes its Prometheus samples so that
+# /metrics reports values aggregated across all workers.
+# It is reset here, when the config is read and before the app is (pre)loaded.
+prometheus_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+shutil.rmtree(prometheus_dir, ignore_errors=True)
+os.makedirs(prometheus_dir, exist_ok=True)
+
+bind = "0.0.0.0:5000"
+workers = 4
+
+# Load the app and the detection models once in the master and fork workers
+# from it, so model memory is shared copy-on-write instead of duplicated per
+# worker. Set GUNICORN_PRELOAD=0 to load everything in each worker instead.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+if preload_app:
+    os.environ["BACKGROUND_TASKS_POST_FORK"] = "1"
+
+def on_starting(server):
+    # Also catches --worker-class / --threads given on the command line.
+    if server.cfg.worker_class_str != "gevent":
+        raise RuntimeError("gunicorn must run with the gevent worker class, not %s"
+                           % server.cfg.worker_class_str)
+
+def when_ready(server):
+    if preload_app:
+        from detection import warm_up_models
+        try:
+            warm_up_models()
+        except Exception as e:
+            # Workers fall back to loading the models lazily themselves.
+            server.log.error("Model warm-up failed: %s", e)
+        # Move everything allocated so far out of the GC's reach; otherwise
+        # collections in workers touch the shared pages and copy them.
+        gc.freeze()
+
+def post_fork(server, worker):
+    if preload_app:
+        from config import app
+        from extensions import db
+        from main import start_background_tasks
+        # Connections opened by the master must not be shared with workers.
+        with app.app_context():
+            db.engine.dispose(close=False)
+        start_background_tasks()
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
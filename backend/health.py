@@ -0,0 +1,96 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from config import app, cache
+from extensions import db
+from metrics import last_heartbeats
+from tasks import uses_worker, queue_depth
+from ratelimit import INGEST_QUEUE_LIMIT
+
+# Probes may hit every worker every few seconds; results are reused for this long.
+HEALTH_CACHE_SECONDS = 5
+CHECK_TIMEOUT = 2
+# A background loop is considered dead after missing this many intervals.
+HEARTBEAT_GRACE_INTERVALS = 3
+# Queued notifications at which this pod stops taking traffic; ingest is shed
+# at the same backlog.
+MAX_QUEUED_NOTIFICATIONS = INGEST_QUEUE_LIMIT
+
+_check_executor = ThreadPoolExecutor(max_workers=2)
+_results = {}
+_results_lock = threading.Lock()
+
+def _check_database():
+    with app.app_context():
+        db.session.execute(db.text("SELECT 1"))
+        db.session.remove()
+
+def _check_redis():
+    client = getattr(cache.cache, "_write_client", None)
+    if client is not None:
+        client.ping()
+
+def _run_with_timeout(check):
+    """Run a blocking check, returning an error string on failure or timeout."""
+    try:
+        _check_executor.submit(check).result(timeout=CHECK_TIMEOUT)
+        return None
+    except TimeoutError:
+        return f"timed out after {CHECK_TIMEOUT}s"
+    except Exception as e:
+        return str(e)
+
+def check_heartbeats():
+    """Return the background loops of this process that stopped iterating."""
+    now = time.time()
+    return [
+        loop for loop, (last, interval) in list(last_heartbeats.items())
+        if now - last > interval * HEARTBEAT_GRACE_INTERVALS + CHECK_TIMEOUT
+    ]
+
+def liveness():
+    """Checks that only fail when the process itself is wedged."""
+    stale = check_heartbeats()
+    checks = {"background_loops": "ok" if not stale else "stale: " + ", ".join(stale)}
+    return not stale, checks
+
+def readiness():
+    """Checks that the process can serve traffic: DB, Redis, loops and queues."""
+    healthy, checks = liveness()
+    error = _run_with_timeout(_check_database)
+    checks["database"] = error or "ok"
+    healthy = healthy and error is None
+    # The cache, leases and rate limits fall back to in-process state without
+    # Redis; only the Redis task queue cannot work without it.
+    error = _run_with_timeout(_check_redis)
+    if error is None:
+        checks["redis"] = "ok"
+    elif uses_worker():
+        checks["redis"] = error
+        healthy = False
+    else:
+        checks["redis"] = f"degraded ({error})"
+    try:
+        queued = queue_depth("notify")
+    except Exception as e:
+        # Without Redis the queue is unreachable, which the redis check reports.
+        queued = 0
+        logging.error("Notification queue depth check failed: %s", e)
+    checks["notification_queue"] = "ok" if queued < MAX_QUEUED_NOTIFICATIONS else f"saturated ({queued})"
+    healthy = healthy and queued < MAX_QUEUED_NOTIFICATIONS
+    return healthy, checks
+
+def cached_health(kind):
+    """Return (healthy, checks) for 'live' or 'ready', reusing recent results."""
+    now = time.monotonic()
+    with _results_lock:
+        cached = _results.get(kind)
+        if cached and now - cached[0] < HEALTH_CACHE_SECONDS:
+            return cached[1]
+    result = liveness() if kind == "live" else readiness()
+    if not result[0]:
+        logging.warning("Health check %s failed: %s", kind, result[1])
+    with _results_lock:
+        _results[kind] = (now, result)
+    return result
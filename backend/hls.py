@@ -0,0 +1,392 @@
+"""
+Caching proxy and segment relay for HLS streams.
+
+Every agent opening a stream used to fetch the master M3U8 from the platform
+with a fresh connection. Playlists are now fetched through one pooled
+requests.Session, kept per worker for as long as they stay valid (the target
+duration for media playlists), and concurrent requests for the same URL
+share a single upstream fetch.
+
+With relaying enabled, media segments take the same path: each worker keeps
+a byte-bounded LRU of the latest segments of every stream, so agents and
+server-side consumers watching one stream share one upstream fetch.
+
+Both caches are per worker process, not shared between workers or replicas:
+a segment is fetched upstream once per gunicorn worker per replica that
+serves it, so the upstream load is bounded by replicas x workers rather than
+by the number of viewers.
+
+Only public hosts of stored stream M3U8 URLs, and hosts referenced by a
+playlist fetched from them, are ever contacted, so the proxy cannot be used
+to reach internal services.
+"""
+import os
+import re
+import time
+import ipaddress
+import threading
+from collections import OrderedDict
+from urllib.parse import urljoin, urlsplit, quote
+from config import app
+from extensions import db
+from models import ChaturbateStream, StripchatStream
+from metrics import HLS_PLAYLIST_REQUESTS, HLS_SEGMENT_REQUESTS
+
+MASTER_PLAYLIST_TTL = 30
+ENDLIST_PLAYLIST_TTL = 300
+DEFAULT_TARGET_DURATION = 6
+PLAYLIST_CACHE_SIZE = 512
+FETCH_TIMEOUT = 10
+HTTP_POOL_SIZE = 32
+PROXY_PATH = "/api/hls/playlist"
+RELAY_PATH = "/api/hls/segment"
+# Segments never change once published; entries only leave the relay when
+# they age out of the window below or the LRU budgets are exceeded.
+SEGMENT_TTL = 120
+SEGMENTS_PER_STREAM = 12
+# Per worker: gunicorn runs 4 of them in a 512Mi pod next to the models.
+SEGMENT_CACHE_BYTES = int(os.getenv("HLS_SEGMENT_CACHE_BYTES", 32 * 1024 * 1024))
+SEGMENT_CACHE_SIZE = 4096
+
+# How often the hosts of stored stream URLs are reloaded, and how long a host
+# referenced by a fetched playlist stays allowed after its last fetch.
+STORED_HOSTS_REFRESH = 60
+REFERENCED_HOST_TTL = 600
+MAX_REDIRECTS = 3
+# Callers sharing an in-flight fetch wait out the owner's worst case, one
+# FETCH_TIMEOUT per redirect hop, plus a little slack.
+UPSTREAM_WAIT_TIMEOUT = (MAX_REDIRECTS + 1) * FETCH_TIMEOUT + 5
+
+URI_ATTRIBUTE = re.compile(r'URI="([^"]+)"')
+
+class UpstreamError(Exception):
+    """Raised when an upstream playlist or segment cannot be fetched or parsed."""
+    def __init__(self, message, status=502):
+        super().__init__(message)
+        self.status = status
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Return the shared HTTP session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+_stored_hosts = (None, frozenset())  # (loaded at, hosts)
+_referenced_hosts = {}  # host -> allowed until
+_hosts_lock = threading.Lock()
+
+def stored_stream_hosts():
+    """Return the hosts of the stored stream M3U8 URLs."""
+    global _stored_hosts
+    loaded_at, hosts = _stored_hosts
+    if loaded_at is None or time.monotonic() - loaded_at > STORED_HOSTS_REFRESH:
+        # Clip recorder polls run in executor threads without an app context.
+        with app.app_context():
+            urls = [url for (url,) in db.session.query(ChaturbateStream.chaturbate_m3u8_url)]
+            urls += [url for (url,) in db.session.query(StripchatStream.stripchat_m3u8_url)]
+        hosts = frozenset(urlsplit(url).hostname for url in urls if url)
+        _stored_hosts = (time.monotonic(), hosts)
+    return hosts
+
+def is_internal_host(host):
+    """Return True for hosts that resolve inside the cluster or the machine."""
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        # Bare service names and cluster DNS never belong to a platform CDN.
+        return "." not in host or host == "localhost" or host.endswith((".local", ".internal"))
+    return not address.is_global
+
+def _remember_hosts(urls):
+    allowed_until = time.monotonic() + REFERENCED_HOST_TTL
+    with _hosts_lock:
+        for url in urls:
+            host = urlsplit(url).hostname
+            if host:
+                _referenced_hosts[host] = allowed_until
+        now = time.monotonic()
+        for host in [h for h, until in _referenced_hosts.items() if until < now]:
+            del _referenced_hosts[host]
+
+def check_url(url):
+    """Raise UpstreamError (403) unless url is on an allowed stream host."""
+    parts = urlsplit(url)
+    host = parts.hostname
+    if parts.scheme not in ("http", "https") or not host or is_internal_host(host):
+        raise UpstreamError("URL is not an allowed stream host", 403)
+    with _hosts_lock:
+        referenced = _referenced_hosts.get(host, 0) > time.monotonic()
+    if not referenced and host not in stored_stream_hosts():
+        raise UpstreamError("URL is not an allowed stream host", 403)
+
+def _fetch(url):
+    """GET url, following redirects only to allowed stream hosts."""
+    for _ in range(MAX_REDIRECTS + 1):
+        response = get_session().get(url, timeout=FETCH_TIMEOUT, allow_redirects=False)
+        if not response.is_redirect:
+            return response
+        url = urljoin(url, response.headers["Location"])
+        check_url(url)
+    raise UpstreamError("Too many redirects")
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlightCache:
+    """
+    LRU of values with individual expiry times. A miss runs loader(key),
+    which returns (value, ttl); callers asking for the same key meanwhile
+    wait for that call instead of starting their own.
+
+    With max_bytes, entries are also evicted oldest-first while the total
+    len() of the cached values exceeds it, and with max_per_group each group
+    (e.g. one stream) keeps at most that many entries.
+    """
+    def __init__(self, max_entries, metric=None, max_bytes=None, max_per_group=None):
+        self.max_entries = max_entries
+        self.metric = metric
+        self.max_bytes = max_bytes
+        self.max_per_group = max_per_group
+        self.entries = OrderedDict()  # key -> (expires_at, value, size, group)
+        self.groups = {}  # group -> OrderedDict of its keys
+        self.total_bytes = 0
+        self.inflight = {}
+        self.lock = threading.Lock()
+
+    def _count(self, result):
+        if self.metric is not None:
+            self.metric.labels(result).inc()
+
+    def _remove(self, key):
+        _, _, size, group = self.entries.pop(key)
+        self.total_bytes -= size
+        if group is not None:
+            keys = self.groups[group]
+            keys.pop(key, None)
+            if not keys:
+                del self.groups[group]
+
+    def _store(self, key, value, ttl, group):
+        if key in self.entries:
+            self._remove(key)
+        size = len(value) if self.max_bytes is not None else 0
+        self.entries[key] = (time.monotonic() + ttl, value, size, group)
+        self.total_bytes += size
+        if group is not None:
+            keys = self.groups.setdefault(group, OrderedDict())
+            keys[key] = None
+            while self.max_per_group and len(keys) > self.max_per_group:
+                self._remove(next(iter(keys)))
+        while len(self.entries) > self.max_entries or (
+            self.max_bytes is not None and self.total_bytes > self.max_bytes and len(self.entries) > 1
+        ):
+            self._remove(next(iter(self.entries)))
+
+    def get(self, key, loader, group=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self._count("hit")
+                return entry[1]
+            call = self.inflight.get(key)
+            owner = call is None
+            if owner:
+                call = self.inflight[key] = _Call()
+        if not owner:
+            self._count("shared")
+            if not call.event.wait(UPSTREAM_WAIT_TIMEOUT):
+                raise UpstreamError("Timed out waiting for upstream", 504)
+            if call.error is not None:
+                raise call.error
+            return call.result
+        self._count("miss")
+        try:
+            value, ttl = loader(key)
+            call.result = value
+            with self.lock:
+                self._store(key, value, ttl, group)
+            return value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+            call.event.set()
+
+class Playlist:
+    """A fetched playlist: its URL, raw text and parsed m3u8 object."""
+    def __init__(self, url, text, parsed):
+        self.url = url
+        self.text = text
+        self.parsed = parsed
+
+    def uris(self):
+        """Return every URI the playlist references, made absolute."""
+        uris = []
+        for line in self.text.splitlines():
+            stripped = line.strip()
+            if stripped.startswith("#"):
+                uris += [urljoin(self.url, uri) for uri in URI_ATTRIBUTE.findall(stripped)]
+            elif stripped:
+                uris.append(urljoin(self.url, stripped))
+        return uris
+
+    @property
+    def is_variant(self):
+        return self.parsed.is_variant
+
+    @property
+    def is_live(self):
+        """True for a media playlist that is still growing."""
+        return not self.is_variant and not self.parsed.is_endlist
+
+    def ttl(self):
+        if self.is_variant:
+            return MASTER_PLAYLIST_TTL
+        if self.parsed.is_endlist:
+            return ENDLIST_PLAYLIST_TTL
+        return self.parsed.target_duration or DEFAULT_TARGET_DURATION
+
+    def variants(self):
+        """Return the variant streams of a master playlist as dicts."""
+        variants = []
+        for variant in self.parsed.playlists:
+            info = variant.stream_info
+            variants.append({
+                "uri": urljoin(self.url, variant.uri),
+                "bandwidth": info.bandwidth,
+                "resolution": "x".join(map(str, info.resolution)) if info.resolution else None,
+                "height": info.resolution[1] if info.resolution else None,
+                "codecs": info.codecs,
+            })
+        return variants
+
+def _load_playlist(url):
+    import m3u8
+    try:
+        response = _fetch(url)
+    except UpstreamError:
+        raise
+    except Exception as e:
+        raise UpstreamError(f"Failed to fetch M3U8 file: {e}")
+    if response.status_code != 200:
+        raise UpstreamError(f"Failed to fetch M3U8 file: upstream returned {response.status_code}")
+    try:
+        playlist = Playlist(url, response.text, m3u8.loads(response.text, uri=url))
+    except Exception as e:
+        raise UpstreamError(f"Invalid M3U8 file: {e}")
+    # Variants and segments may live on other CDN hosts of the same platform.
+    _remember_hosts(playlist.uris())
+    return playlist, playlist.ttl()
+
+playlist_cache = SingleFlightCache(PLAYLIST_CACHE_SIZE, HLS_PLAYLIST_REQUESTS)
+
+def get_playlist(url):
+    """Return the Playlist at url from the cache or a single upstream fetch."""
+    check_url(url)
+    return playlist_cache.get(url, _load_playlist)
+
+def select_variant(variants, max_bandwidth=None, max_height=None):
+    """
+    Pick the best variant within the given limits: the highest bandwidth that
+    fits, or the lowest one if nothing does. Without limits the first listed
+    variant is returned, as the platform intends.
+    """
+    if not variants:
+        return None
+    if max_bandwidth is None and max_height is None:
+        return variants[0]
+    fitting = [
+        v for v in variants
+        if (max_bandwidth is None or (v["bandwidth"] or 0) <= int(max_bandwidth))
+        and (max_height is None or v["height"] is None or v["height"] <= int(max_height))
+    ]
+    if not fitting:
+        return min(variants, key=lambda v: v["bandwidth"] or 0)
+    return max(fitting, key=lambda v: v["bandwidth"] or 0)
+
+class Segment:
+    """A relayed media segment (or init section / key) and its content type."""
+    def __init__(self, content, content_type):
+        self.content = content
+        self.content_type = content_type
+
+    def __len__(self):
+        return len(self.content)
+
+def _load_segment(url):
+    try:
+        response = _fetch(url)
+    except UpstreamError:
+        raise
+    except Exception as e:
+        raise UpstreamError(f"Failed to fetch segment: {e}")
+    if response.status_code != 200:
+        raise UpstreamError(f"Failed to fetch segment: upstream returned {response.status_code}")
+    content_type = response.headers.get("Content-Type", "video/mp2t")
+    return Segment(response.content, content_type), SEGMENT_TTL
+
+segment_cache = SingleFlightCache(
+    SEGMENT_CACHE_SIZE, HLS_SEGMENT_REQUESTS,
+    max_bytes=SEGMENT_CACHE_BYTES, max_per_group=SEGMENTS_PER_STREAM,
+)
+
+def get_segment(url, stream=None):
+    """
+    Return the Segment at url, fetching it upstream at most once per worker
+    process (of each replica) while it is cached. stream (the media playlist URL) groups segments for
+    the per-stream limit.
+    """
+    check_url(url)
+    return segment_cache.get(url, _load_segment, group=stream)
+
+def proxy_url(url, relay=False):
+    """Return the proxy path serving the playlist at url."""
+    path = f"{PROXY_PATH}?url={quote(url, safe='')}"
+    return path + "&relay=1" if relay else path
+
+def relay_url(url, stream):
+    """Return the relay path serving the segment at url of the given stream."""
+    return f"{RELAY_PATH}?url={quote(url, safe='')}&stream={quote(stream, safe='')}"
+
+def rewrite_playlist(playlist, relay=False):
+    """
+    Return the playlist text with every URI made absolute, and nested
+    playlists (variants and alternate renditions) pointed back at the proxy.
+    With relay, segments, init sections and keys go through the relay too.
+    """
+    nested = playlist.is_variant
+
+    def rewrite(uri):
+        absolute = urljoin(playlist.url, uri)
+        if nested:
+            return proxy_url(absolute, relay)
+        return relay_url(absolute, playlist.url) if relay else absolute
+
+    lines = []
+    for line in playlist.text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            lines.append(line)
+        elif stripped.startswith("#"):
+            lines.append(URI_ATTRIBUTE.sub(lambda m: f'URI="{rewrite(m.group(1))}"', line))
+        else:
+            lines.append(rewrite(stripped))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+from extensions import db
+from models import Log
+from metrics import EVENTS_TOTAL
+from notifications import send_notifications
+import readstate
+
+# Identical detections of the same object on a stream within this window are dropped.
+DUPLICATE_WINDOW = timedelta(minutes=5)
+
+def record_object_detection(data, store_image=None):
+    """
+    Validate and store an object detection sent by an agent's browser, then
+    notify recipients. Shared by the HTTP and WebSocket ingest paths.
+    store_image, if given, is called once the detection is accepted and
+    returns the blob URL of its annotated frame.
+    Returns (response_body, status_code).
+    """
+    stream_url = data.get("stream_url")
+    detections = data.get("detections")
+    detected_object = data.get("detected_object")
+
+    if not stream_url or not detections:
+        return {"message": "Missing required fields"}, 400
+
+    # Check if a similar detection has already been logged in the last 5 minutes, if detected_object is provided.
+    if detected_object:
+        existing_detection = Log.query.filter(
+            Log.room_url == stream_url,
+            Log.event_type == "object_detection",
+            Log.timestamp >= datetime.utcnow() - DUPLICATE_WINDOW,
+            Log.details.contains({"detected_object": detected_object})
+        ).first()
+        if existing_detection:
+            return {"message": "Duplicate detection skipped"}, 200
+
+    log_entry = Log(
+        room_url=stream_url,
+        event_type="object_detection",
+        details={
+            "detections": detections,
+            "annotated_image": store_image() if store_image else data.get("annotated_image"),
+            "timestamp": data.get("timestamp"),
+            "streamer_name": data.get("streamer_name"),
+            "platform": data.get("platform"),
+            "assigned_agent": data.get("assigned_agent"),
+            "detected_object": detected_object,
+        }
+    )
+    db.session.add(log_entry)
+    db.session.commit()
+    EVENTS_TOTAL.labels(log_entry.event_type).inc()
+    readstate.count_new_log(log_entry)
+
+    send_notifications(log_entry, detections)
+    return {"message": "Detection logged successfully", "id": log_entry.id}, 201
+
+def record_audio_detection(room_url, keyword, transcript, confidence, streamer_name=None, platform=None):
+    """Store a keyword heard by the server-side audio pipeline and notify recipients."""
+    log_entry = Log(
+        room_url=room_url,
+        event_type="audio_detection",
+        details={
+            "keyword": keyword,
+            "transcript": transcript,
+            "confidence": confidence,
+            "streamer_name": streamer_name,
+            "platform": platform,
+            "source": "server",
+        }
+    )
+    db.session.add(log_entry)
+    db.session.commit()
+    EVENTS_TOTAL.labels(log_entry.event_type).inc()
+    readstate.count_new_log(log_entry)
+    send_notifications(log_entry)
+    return log_entry
+
+def mark_notifications_read(user_id, ids):
+    """Mark the given notification logs as read for a user and return how many changed."""
+    return readstate.mark_read(user_id, [int(i) for i in ids])
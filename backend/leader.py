@@ -0,0 +1,132 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from config import cache
+
+# Renew well before expiry so a live leader never loses its lease, while a
+# dead one is replaced within LEASE_TTL seconds.
+LEASE_TTL = 30
+RENEW_INTERVAL = LEASE_TTL / 3
+
+# Extend the lease only if we still own it.
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class RedisLease:
+    """Lease stored as a Redis key with a TTL, shared by every worker and replica."""
+    def __init__(self, client):
+        self.client = client
+
+    def acquire(self, name, token, ttl):
+        key = f"lease:{name}"
+        ttl_ms = int(ttl * 1000)
+        if self.client.set(key, token, nx=True, px=ttl_ms):
+            return True
+        return bool(self.client.eval(RENEW_SCRIPT, 1, key, token, ttl_ms))
+
+    def release(self, name, token):
+        self.client.eval(RELEASE_SCRIPT, 1, f"lease:{name}", token)
+
+class LocalLease:
+    """In-process lease used when Redis is not configured (tests, single worker)."""
+    def __init__(self):
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, name, token, ttl):
+        now = time.monotonic()
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder is None or holder[0] == token or holder[1] <= now:
+                self._leases[name] = (token, now + ttl)
+                return True
+            return False
+
+    def release(self, name, token):
+        with self._lock:
+            if self._leases.get(name, (None,))[0] == token:
+                del self._leases[name]
+
+def default_lease_backend():
+    """Use Redis when the cache is Redis-backed, otherwise the in-process lease."""
+    client = getattr(cache.cache, "_write_client", None)
+    return RedisLease(client) if client is not None else LocalLease()
+
+class LeaderElector:
+    """
+    Keeps trying to hold the named lease from a daemon thread.
+    Singleton background jobs run in every process but only do work while
+    is_leader() is True, so they execute once cluster-wide and fail over
+    when the leader stops renewing.
+    """
+    def __init__(self, name, backend=None, ttl=LEASE_TTL):
+        self.name = name
+        self.ttl = ttl
+        self.backend = backend
+        self.token = self._new_token()
+        self._leader = False
+        self._started = False
+
+    @staticmethod
+    def _new_token():
+        return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+
+    def is_leader(self):
+        return self._leader
+
+    def try_acquire(self):
+        """Acquire or renew the lease once and return whether we hold it."""
+        if self.backend is None:
+            self.backend = default_lease_backend()
+        try:
+            leader = self.backend.acquire(self.name, self.token, self.ttl)
+        except Exception as e:
+            logging.error("Lease %s renewal error: %s", self.name, e)
+            leader = False
+        if leader != self._leader:
+            logging.info("Process %s %s leadership of %s", self.token,
+                         "acquired" if leader else "lost", self.name)
+        self._leader = leader
+        return leader
+
+    def start(self):
+        """Start the election thread (idempotent)."""
+        if self._started:
+            return
+        self._started = True
+        # Regenerate in case this object was created in a pre-fork master.
+        self.token = self._new_token()
+        self.try_acquire()
+
+        def election_loop():
+            while True:
+                time.sleep(RENEW_INTERVAL)
+                self.try_acquire()
+        threading.Thread(target=election_loop, daemon=True).start()
+
+    def release(self):
+        if self._leader:
+            try:
+                self.backend.release(self.name, self.token)
+            except Exception as e:
+                logging.error("Lease %s release error: %s", self.name, e)
+            self._leader = False
+
+# Lease guarding the singleton background jobs started from main.py.
+background_leader = LeaderElector("background-jobs")
+# Lease held by one process per host, for jobs on pod-local files such as
+# upload cleanup, which every replica needs for its own disk.
+host_leader = LeaderElector(f"host-jobs:{socket.gethostname()}")
@@ -3,10 +3,21 @@ from extensions import db
 from models import User
 from routes import *
 from cleanup import start_chat_cleanup_thread, start_detection_cleanup_thread
+from search import ensure_search_index
+from balancer import assignments_are_unique
+from readstate import ensure_read_cursors, create_cursor
+from clips import start_clip_recorder, clip_recorder
+from audio import start_audio_pipeline
+from leader import background_leader, host_leader
+import os
+import atexit
 import logging
 
 with app.app_context():
     db.create_all()
+    ensure_search_index()
+    if not assignments_are_unique():
+        logging.warning("Duplicate assignments are possible; run: flask --app balancer unique-assignments")
     # Create default admin if none exists.
     if not User.query.filter_by(role="admin").first():
         admin = User(
@@ -19,6 +30,8 @@ with app.app_context():
             role="admin",
         )
         db.session.add(admin)
+        db.session.flush()
+        create_cursor(admin.id)
         db.session.commit()
     # Create default agent if none exists.
     if not User.query.filter_by(role="agent").first():
@@ -32,13 +45,30 @@ with app.app_context():
             role="agent",
         )
         db.session.add(agent)
+        db.session.flush()
+        create_cursor(agent.id)
         db.session.commit()
+    ensure_read_cursors()
 
 
-# Start background tasks.
-start_notification_monitor()
-start_chat_cleanup_thread()
-start_detection_cleanup_thread()
+def start_background_tasks():
+    """
+    Start background tasks. They run in every worker but only the process
+    holding the background-jobs lease does any work.
+    """
+    background_leader.start()
+    atexit.register(background_leader.release)
+    host_leader.start()
+    atexit.register(host_leader.release)
+    start_chat_cleanup_thread()
+    start_detection_cleanup_thread()
+    start_audio_pipeline(clip_recorder)
+    start_clip_recorder()
+
+# Threads don't survive fork, so when gunicorn preloads the app in the master
+# (see gunicorn.conf.py) the tasks are started from its post_fork hook instead.
+if os.getenv("BACKGROUND_TASKS_POST_FORK") != "1":
+    start_background_tasks()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, threaded=True, debug=False)
@@ -0,0 +1,107 @@
+import os
+import time
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, REGISTRY,
+    generate_latest, CONTENT_TYPE_LATEST, multiprocess,
+)
+from config import app
+
+# When PROMETHEUS_MULTIPROC_DIR is set (see gunicorn.conf.py) every worker
+# writes its samples there and /metrics aggregates all of them.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"]
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "Database statements executed per request", ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "Database statement latency")
+STAGE_DURATION = Histogram(
+    "stage_duration_seconds", "Duration of heavy processing stages (ocr, nlp, scrape)", ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+NOTIFICATION_SEND_LATENCY = Histogram(
+    "notification_send_duration_seconds", "Telegram send latency", ["kind", "outcome"]
+)
+# Sends being made right now; the queued backlog is tasks.queue_depth("notify").
+NOTIFICATIONS_IN_FLIGHT = Gauge(
+    "notifications_in_flight", "Telegram sends in progress", multiprocess_mode="livesum"
+)
+BACKGROUND_HEARTBEAT = Gauge(
+    "background_loop_heartbeat_timestamp_seconds", "Last iteration time of each background loop",
+    ["loop"], multiprocess_mode="max",
+)
+SSE_CLIENTS = Gauge("sse_clients", "Connected SSE clients", multiprocess_mode="livesum")
+WEBSOCKET_CLIENTS = Gauge("websocket_clients", "Connected WebSocket clients", multiprocess_mode="livesum")
+EVENTS_TOTAL = Counter("ingest_events_total", "Ingested detection events", ["event_type"])
+HLS_PLAYLIST_REQUESTS = Counter(
+    "hls_playlist_requests_total", "HLS playlist lookups by cache result (hit, miss, shared)", ["result"]
+)
+HLS_SEGMENT_REQUESTS = Counter(
+    "hls_segment_requests_total", "HLS segment relay lookups by cache result (hit, miss, shared)", ["result"]
+)
+AUDIO_SEGMENTS = Counter(
+    "audio_segments_total", "HLS segments seen by the audio pipeline (processed, dropped, error)", ["result"]
+)
+INGEST_ADMISSION = Counter(
+    "ingest_admission_total",
+    "Detection events by admission result (accepted, limited_session, limited_stream, limited_global, shed)",
+    ["result"],
+)
+CLEANUP_RECLAIMED_BYTES = Counter("cleanup_reclaimed_bytes_total", "Bytes freed by cleanup", ["folder"])
+
+# Process-local copies of the values the health checks need to read back.
+last_heartbeats = {}
+
+def stage_timer(stage):
+    """Context manager recording the duration of a processing stage."""
+    return STAGE_DURATION.labels(stage=stage).time()
+
+def heartbeat(loop, interval):
+    """Record that a background loop running every `interval` seconds completed an iteration."""
+    last_heartbeats[loop] = (time.time(), interval)
+    BACKGROUND_HEARTBEAT.labels(loop=loop).set_to_current_time()
+
+def notification_in_flight():
+    """Context manager counting a notification as in flight for the duration of its send."""
+    return NOTIFICATIONS_IN_FLIGHT.track_inprogress()
+
+def metrics_response():
+    """Return the body and content type for the /metrics endpoint."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERY_DURATION.observe(time.perf_counter() - conn.info["query_start_time"].pop())
+    if has_request_context():
+        g.db_query_count = g.get("db_query_count", 0) + 1
+
+@app.before_request
+def _start_request_timer():
+    g.request_start_time = time.perf_counter()
+    g.db_query_count = 0
+
+@app.after_request
+def _record_request_metrics(response):
+    start = g.get("request_start_time")
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(
+            time.perf_counter() - start
+        )
+        DB_QUERIES_PER_REQUEST.labels(route).observe(g.get("db_query_count", 0))
+    return response
@@ -119,7 +119,7 @@ class Assignment(db.Model):
     stream = db.relationship('Stream', back_populates='assignments')
 
     __table_args__ = (
-        db.Index('idx_assignment_agent_stream', 'agent_id', 'stream_id'),
+        db.Index('idx_assignment_agent_stream', 'agent_id', 'stream_id', unique=True),
     )
 
     def serialize(self):
@@ -141,6 +141,7 @@ class Log(db.Model):
     room_url = db.Column(db.String(300), index=True)
     event_type = db.Column(db.String(50), index=True)
     details = db.Column(db.JSON)  # Stores detection details, images, etc.
+    # Legacy global flag, only used to seed read cursors; see readstate.py.
     read = db.Column(db.Boolean, default=False, index=True)
 
     __table_args__ = (
@@ -149,16 +150,69 @@ class Log(db.Model):
     )
 
     def serialize(self):
-        """Serialize the Log model into a dictionary."""
+        """
+        Serialize the Log model into a dictionary. Read state is per user and
+        is not included; see readstate.read_ids.
+        """
         return {
             "id": self.id,
             "timestamp": self.timestamp.isoformat(),
             "room_url": self.room_url,
             "event_type": self.event_type,
             "details": self.details,
-            "read": self.read,
         }
 
+class NotificationCursor(db.Model):
+    """
+    NotificationCursor holds a user's read position: notification logs with
+    an id up to last_read_id are read, newer ones unread, except for the
+    logs listed in NotificationReadException.
+    """
+    __tablename__ = "notification_cursors"
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    last_read_id = db.Column(db.Integer, nullable=False, default=0)
+
+class NotificationReadException(db.Model):
+    """
+    NotificationReadException flips the read state implied by the user's
+    cursor for one log: a log above the cursor that was read, or one at or
+    below it that was marked unread again.
+    """
+    __tablename__ = "notification_read_exceptions"
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    log_id = db.Column(db.Integer, db.ForeignKey('logs.id'), primary_key=True)
+
+class NotificationHidden(db.Model):
+    """
+    NotificationHidden removes one log from a user's notification list.
+    Logs are shared by every user, so an agent's delete only hides them.
+    """
+    __tablename__ = "notification_hidden"
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    log_id = db.Column(db.Integer, db.ForeignKey('logs.id'), primary_key=True)
+
+class AnnotatedFrame(db.Model):
+    """
+    AnnotatedFrame stores an uploaded annotated frame or its notification
+    thumbnail. Frames live in the database so every replica can serve them;
+    their bytes are split into AnnotatedFrameChunk rows.
+    """
+    __tablename__ = "annotated_frames"
+    id = db.Column(db.String(40), primary_key=True)  # filename in the blob URL
+    content_type = db.Column(db.String(20), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class AnnotatedFrameChunk(db.Model):
+    """
+    AnnotatedFrameChunk holds one piece of a frame's bytes, so frames are
+    written and served a chunk at a time.
+    """
+    __tablename__ = "annotated_frame_chunks"
+    frame_id = db.Column(db.String(40), db.ForeignKey("annotated_frames.id", ondelete="CASCADE"), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+
 class ChatKeyword(db.Model):
     """
     ChatKeyword model stores keywords for flagging chat messages.
@@ -2,13 +2,16 @@ import time
 import threading
 import concurrent.futures
 import logging
-from datetime import datetime, timedelta
 from config import app
 from extensions import db
-from models import Stream, Log, Assignment
+from models import Stream, Assignment
 from notifications import *
+from scheduler import stream_scheduler
 
 monitoring_executor = concurrent.futures.ThreadPoolExecutor(max_workers=20)
+# Used for streams the scheduler does not track, i.e. when the clip recorder
+# (which registers the streams with it) is not running.
+MONITOR_INTERVAL = 10
 
 def monitor_stream(stream_url):
     while True:
@@ -18,7 +21,8 @@ def monitor_stream(stream_url):
                 logging.info("Stream %s not found. Exiting monitor.", stream_url)
                 return
             logging.info("Backend object detection is disabled for stream: %s", stream_url)
-        time.sleep(10)
+        # Hot streams are revisited within seconds, quiet ones about once a minute.
+        time.sleep(stream_scheduler.interval_for_url(stream_url, default=MONITOR_INTERVAL))
 
 def start_monitoring():
     with app.app_context():
@@ -28,24 +32,3 @@ def start_monitoring():
         for stream in streams:
             monitoring_executor.submit(monitor_stream, stream.room_url)
             logging.info("Submitted monitoring task for %s", stream.room_url)
-
-def start_notification_monitor():
-    def monitor_notifications():
-        last_notified_time = datetime.utcnow() - timedelta(seconds=5)
-        while True:
-            try:
-                with app.app_context():
-                    logs = Log.query.filter(
-                        Log.timestamp > last_notified_time,
-                        Log.event_type == "object_detection"
-                    ).all()
-                    for log in logs:
-                        detections = log.details.get("detections", [])
-                        if detections:
-                            send_notifications(log, detections)
-                    if logs:
-                        last_notified_time = max(log.timestamp for log in logs)
-            except Exception as e:
-                logging.error("Notification monitor error: %s", e)
-            time.sleep(2)
-    threading.Thread(target=monitor_notifications, daemon=True).start()
\ No newline at end of file
@@ -1,10 +1,13 @@
 import os
+import time
 import logging
 from config import app
 from models import Log, TelegramRecipient, Stream, Assignment, User
 from extensions import db
-from telegram import Bot
 from concurrent.futures import ThreadPoolExecutor
+from metrics import NOTIFICATION_SEND_LATENCY, notification_in_flight
+from tasks import task_handler, enqueue
+import blobs
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 executor = ThreadPoolExecutor(max_workers=5)  # Thread pool for notifications
@@ -12,49 +15,115 @@ executor = ThreadPoolExecutor(max_workers=5)  # Thread pool for notifications
 
 def get_bot(token=None):
     """Return a Telegram Bot instance."""
+    from telegram import Bot
     if token is None:
         token = TELEGRAM_TOKEN
     return Bot(token=token)
 
 def send_text_message(msg, chat_id, token=None):
+    start = time.perf_counter()
+    outcome = "error"
     try:
-        bot = Bot(token or TELEGRAM_TOKEN)
-        bot.sendMessage(chat_id=chat_id, text=msg)
+        with notification_in_flight():
+            bot = get_bot(token)
+            bot.sendMessage(chat_id=chat_id, text=msg)
         logging.info(f"Telegram message sent to chat_id {chat_id}.")
+        outcome = "sent"
         return True
     except Exception as e:
         logging.error(f"Failed to send Telegram message to chat_id {chat_id}: {e}")
         return False
+    finally:
+        NOTIFICATION_SEND_LATENCY.labels("text", outcome).observe(time.perf_counter() - start)
+
+def load_photo(image_path=None, image_url=None):
+    """Return the bytes of a blob URL or local image file, or None if it is gone."""
+    if image_url:
+        blob = blobs.load(image_url)
+        return blob[1] if blob else None
+    if image_path and os.path.exists(image_path):
+        with open(image_path, "rb") as f:
+            return f.read()
+    return None
+
+@task_handler("notify", concurrency=5)
+def send_telegram_notification(message, chat_id, image_path=None, image_url=None):
+    """Send a message to one Telegram chat, attaching the image if it still exists."""
+    photo = load_photo(image_path, image_url)
+    if photo is None:
+        return send_text_message(message, chat_id)
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        with notification_in_flight():
+            # Telegram limits photo captions to 1024 characters.
+            get_bot().send_photo(chat_id=chat_id, photo=photo, caption=message[:1024])
+        logging.info(f"Telegram photo sent to chat_id {chat_id}.")
+        outcome = "sent"
+        return True
+    except Exception as e:
+        logging.error(f"Failed to send Telegram photo to chat_id {chat_id}: {e}")
+        return False
+    finally:
+        NOTIFICATION_SEND_LATENCY.labels("photo", outcome).observe(time.perf_counter() - start)
+
+def recipient_chat_ids():
+    """Return the chat ids of all Telegram recipients."""
+    with app.app_context():
+        return [recipient.chat_id for recipient in TelegramRecipient.query.all()]
+
+def notify_recipients(message, image_path=None, image_url=None, chat_ids=None):
+    """
+    Queue a message for every Telegram recipient, with an optional image
+    given as a local file or a blob store URL.
+    """
+    if chat_ids is None:
+        chat_ids = recipient_chat_ids()
+    for chat_id in chat_ids:
+        enqueue("notify", message=message, chat_id=chat_id, image_path=image_path, image_url=image_url)
+
+@task_handler("thumbnail", concurrency=2)
+def send_detection_photo(message, log_id, chat_ids):
+    """
+    Re-encode a detection's annotated frame as a WebP thumbnail and queue it
+    for the given chats. Runs as a task so the decode and encode stay off the
+    ingest request.
+    """
+    log_entry = db.session.get(Log, log_id)
+    thumbnail = blobs.make_thumbnail(log_entry.details.get('annotated_image')) if log_entry else None
+    notify_recipients(message, image_url=thumbnail, chat_ids=chat_ids)
+
+def send_chat_telegram_notification(image_path, description):
+    """Queue a flagged chat screenshot for every Telegram recipient."""
+    notify_recipients(description, image_path)
 
 def send_notifications(log_entry, detections=None):
     try:
         details = log_entry.details
-        streamer = details.get('streamer_name', 'Unknown Streamer')
-        platform = details.get('platform', 'Unknown Platform').capitalize()
-        confidence = details.get('confidence', 0)
+        streamer = details.get('streamer_name') or 'Unknown Streamer'
+        platform = (details.get('platform') or 'Unknown Platform').capitalize()
+        confidence = details.get('confidence') or 0
         
         if log_entry.event_type == 'object_detection':
+            detections = detections or details.get('detections') or []
             message = f"🚨 Visual Detection on {platform}\n"
             message += f"Streamer: {streamer}\n"
             message += f"Detected {len(detections)} objects\n"
             message += f"Confidence: {confidence:.0%}"
             
-            # Include image if available
-            if details.get('annotated_image'):
-                send_telegram_image(
-                    details['annotated_image'], 
-                    message,
-                    log_entry.id
-                )
+            chat_ids = recipient_chat_ids()
+            if chat_ids and details.get('annotated_image'):
+                # Attach a WebP thumbnail rather than the full annotated frame
+                enqueue("thumbnail", message=message, log_id=log_entry.id, chat_ids=chat_ids)
             else:
-                send_text_message(message)
+                notify_recipients(message, chat_ids=chat_ids)
                 
         elif log_entry.event_type == 'audio_detection':
             message = f"🔊 Audio Detection on {platform}\n"
             message += f"Streamer: {streamer}\n"
             message += f"Keyword: {details['keyword']}\n"
             message += f"Confidence: {confidence:.0%}"
-            send_text_message(message)
+            notify_recipients(message)
             
     except Exception as e:
-        logging.error(f"Notification error: {str(e)}")
\ No newline at end of file
+        logging.error(f"Notification error: {str(e)}")
@@ -0,0 +1,204 @@
+"""
+Admission control for the detection ingest endpoints.
+
+Every event takes one token from three token buckets at once: the caller's
+(logged-in user, or client address when anonymous), the stream's and a
+global one. A bucket holds up to `burst` tokens and refills at `rate` per
+second; an event is only admitted if all three have a token, so a client
+stuck in a render loop is throttled long before it floods logs and
+Telegram. Buckets live in Redis, updated atomically by a Lua script so all
+workers and replicas share them; without Redis (or while it is down) each
+process keeps its own.
+
+Independently of the buckets, events are shed while the notification queue
+is saturated. Rejected requests get 429 with a Retry-After header.
+"""
+import os
+import json
+import math
+import time
+import logging
+import threading
+from functools import wraps
+from flask import request, session, jsonify
+from config import cache
+from metrics import INGEST_ADMISSION
+from tasks import queue_depth
+
+# (tokens per second, burst) of each bucket kind.
+RATE_LIMITS = {
+    "session": (float(os.getenv("INGEST_SESSION_RATE", 2)), int(os.getenv("INGEST_SESSION_BURST", 20))),
+    "stream": (float(os.getenv("INGEST_STREAM_RATE", 1)), int(os.getenv("INGEST_STREAM_BURST", 10))),
+    "global": (float(os.getenv("INGEST_GLOBAL_RATE", 50)), int(os.getenv("INGEST_GLOBAL_BURST", 200))),
+}
+# Queued notifications above which ingest is shed, and the Retry-After sent then.
+INGEST_QUEUE_LIMIT = int(os.getenv("INGEST_QUEUE_LIMIT", 500))
+SHED_RETRY_AFTER = 5
+QUEUE_CHECK_INTERVAL = 1
+LOCAL_BUCKET_LIMIT = 10000
+
+# Takes a token from every bucket in KEYS, or from none of them. ARGV holds
+# rate and burst per key. Returns {0, ""} when admitted, otherwise the
+# 1-based index of the most limiting bucket and the seconds to wait.
+TAKE_SCRIPT = """
+redis.replicate_commands()
+local clock = redis.call('time')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local tokens = {}
+local worst, wait = 0, 0
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    local state = redis.call('hmget', key, 'tokens', 'ts')
+    local level = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    level = math.min(burst, level + math.max(now - ts, 0) * rate)
+    tokens[i] = level
+    if level < 1 and (1 - level) / rate > wait then
+        worst, wait = i, (1 - level) / rate
+    end
+end
+if worst > 0 then
+    return {worst, tostring(wait)}
+end
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    redis.call('hset', key, 'tokens', tostring(tokens[i] - 1), 'ts', tostring(now))
+    redis.call('pexpire', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return {0, ""}
+"""
+
+class RedisBuckets:
+    """Token buckets shared through Redis."""
+    def __init__(self, client):
+        self.take_script = client.register_script(TAKE_SCRIPT)
+
+    def take(self, buckets):
+        """Take a token from each (key, rate, burst); return (index, wait) of a refusal or None."""
+        args = []
+        for _, rate, burst in buckets:
+            args += [rate, burst]
+        index, wait = self.take_script(keys=[f"ratelimit:{key}" for key, _, _ in buckets], args=args)
+        if not index:
+            return None
+        return int(index) - 1, float(wait)
+
+class LocalBuckets:
+    """In-process token buckets used when Redis is not configured or unreachable."""
+    def __init__(self):
+        self.buckets = {}  # key -> (tokens, as of)
+        self.lock = threading.Lock()
+
+    def take(self, buckets):
+        now = time.monotonic()
+        with self.lock:
+            if len(self.buckets) > LOCAL_BUCKET_LIMIT:
+                self._prune(now)
+            levels = []
+            worst = None
+            for index, (key, rate, burst) in enumerate(buckets):
+                tokens, as_of = self.buckets.get(key, (burst, now))
+                level = min(burst, tokens + (now - as_of) * rate)
+                levels.append(level)
+                if level < 1 and (worst is None or (1 - level) / rate > worst[1]):
+                    worst = (index, (1 - level) / rate)
+            if worst is not None:
+                return worst
+            for (key, _, _), level in zip(buckets, levels):
+                self.buckets[key] = (level - 1, now)
+            return None
+
+    def _prune(self, now):
+        # Buckets that have refilled completely are the same as absent ones.
+        for key, (tokens, as_of) in list(self.buckets.items()):
+            rate, burst = RATE_LIMITS[key.split(":", 1)[0]]
+            if tokens + (now - as_of) * rate >= burst:
+                del self.buckets[key]
+
+class AdmissionController:
+    def __init__(self):
+        self.local = LocalBuckets()
+        self.redis = None
+        self.redis_checked = False
+        self.queue_depth = 0
+        self.queue_checked_at = 0
+
+    def _redis(self):
+        if not self.redis_checked:
+            client = getattr(cache.cache, "_write_client", None)
+            self.redis = RedisBuckets(client) if client is not None else None
+            self.redis_checked = True
+        return self.redis
+
+    def saturated(self):
+        """Return True while the notification queue is over INGEST_QUEUE_LIMIT."""
+        now = time.monotonic()
+        if now - self.queue_checked_at > QUEUE_CHECK_INTERVAL:
+            try:
+                self.queue_depth = queue_depth("notify")
+            except Exception as e:
+                logging.error("Ingest queue depth check failed: %s", e)
+                self.queue_depth = 0
+            self.queue_checked_at = now
+        return self.queue_depth >= INGEST_QUEUE_LIMIT
+
+    def admit(self, client, stream_url=None):
+        """
+        Decide whether to accept one event from client for stream_url.
+        Returns (retry_after, reason): (0, None) when accepted, otherwise the
+        seconds to wait and "session", "stream", "global" or "saturated".
+        """
+        if self.saturated():
+            INGEST_ADMISSION.labels("shed").inc()
+            return SHED_RETRY_AFTER, "saturated"
+        kinds = ["session", "global"] + (["stream"] if stream_url else [])
+        keys = {"session": f"session:{client}", "stream": f"stream:{stream_url}", "global": "global:ingest"}
+        buckets = [(keys[kind], *RATE_LIMITS[kind]) for kind in kinds]
+        backend = self._redis()
+        try:
+            refusal = (backend or self.local).take(buckets)
+        except Exception as e:
+            logging.error("Rate limiter Redis error, using local buckets: %s", e)
+            refusal = self.local.take(buckets)
+        if refusal is None:
+            INGEST_ADMISSION.labels("accepted").inc()
+            return 0, None
+        index, wait = refusal
+        INGEST_ADMISSION.labels(f"limited_{kinds[index]}").inc()
+        return wait, kinds[index]
+
+admission = AdmissionController()
+
+def request_client():
+    """Identify the caller of the current request for the session bucket."""
+    if "user_id" in session:
+        return f"user:{session['user_id']}"
+    return f"addr:{request.remote_addr}"
+
+def request_stream_url():
+    """Return the stream_url of a JSON or multipart detection upload without storing its image."""
+    try:
+        if request.mimetype == "multipart/form-data":
+            data = json.loads(request.form.get("metadata") or "{}")
+        else:
+            data = request.get_json(silent=True) or {}
+    except ValueError:
+        return None
+    return data.get("stream_url") if isinstance(data, dict) else None
+
+def rejection(retry_after, reason):
+    """Return the 429 response for a rejected event."""
+    response = jsonify({"message": "Too many detection events", "reason": reason})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def rate_limited(f):
+    """Decorator applying ingest admission control to a view."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        retry_after, reason = admission.admit(request_client(), request_stream_url())
+        if reason:
+            return rejection(retry_after, reason)
+        return f(*args, **kwargs)
+    return decorated_function
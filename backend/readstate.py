@@ -0,0 +1,473 @@
+"""
+Per-user notification read state.
+
+Every user has a read cursor, the id of the newest log they have caught up
+to, plus a sparse set of exceptions: logs above the cursor they read one by
+one, and logs at or below it they marked unread again. A log is read when
+it is at or below the cursor or is an exception, but not both. New logs
+need no per-user rows, unread queries are a primary key range scan, and
+marking everything read is a single cursor update.
+
+Unread badge counts per event type and per room URL are kept as counters in
+the shared cache: how many notifications were ever logged in a bucket, and
+how many of them each user has read. Unread is the difference, so logging
+a notification costs two increments whatever the number of users, and
+reading one two more. Lost cache writes make counters drift, so they are
+rebuilt from the database every COUNTS_RECONCILE_INTERVAL seconds. Each
+rebuild starts a generation with its own counters, and logs committed while
+it runs are counted exactly once (see _claim_log). Deleting logs corrects
+the counters and only resets the users who had read them.
+
+Agents cannot delete the shared logs; their deletes hide them from their own
+list instead (NotificationHidden), marking them read on the way.
+"""
+import uuid
+import logging
+from collections import Counter
+from sqlalchemy.exc import IntegrityError
+from config import cache
+from extensions import db
+from models import User, Log, NotificationCursor, NotificationReadException, NotificationHidden
+
+NOTIFICATION_EVENT_TYPES = ["object_detection", "chat_detection", "video_notification", "audio_detection"]
+COUNTS_RECONCILE_INTERVAL = 600
+
+def _newest_log_id():
+    return db.session.query(db.func.max(Log.id)).scalar() or 0
+
+def _exceptions(user_id):
+    return db.select(NotificationReadException.log_id).where(NotificationReadException.user_id == user_id)
+
+def create_cursor(user_id):
+    """
+    Start a new user's cursor at the newest log, so everything logged after
+    the account was created is unread. Call when creating a user; does not
+    commit.
+    """
+    cursor = NotificationCursor(user_id=user_id, last_read_id=_newest_log_id())
+    db.session.add(cursor)
+    return cursor
+
+def get_cursor(user_id):
+    """Return a user's cursor, seeding a missing one from the legacy read flags."""
+    cursor = db.session.get(NotificationCursor, user_id)
+    if cursor is not None:
+        return cursor
+    try:
+        with db.session.begin_nested():
+            _seed_cursors([user_id])
+        db.session.commit()
+    except IntegrityError:
+        # Created concurrently by another request.
+        pass
+    return db.session.get(NotificationCursor, user_id)
+
+def unread_condition(user_id):
+    """Return a SQL condition matching the logs a user has not read."""
+    last_read_id = get_cursor(user_id).last_read_id
+    exceptions = _exceptions(user_id)
+    return db.or_(
+        db.and_(
+            Log.id > last_read_id,
+            ~Log.id.in_(exceptions.where(NotificationReadException.log_id > last_read_id)),
+        ),
+        Log.id.in_(exceptions.where(NotificationReadException.log_id <= last_read_id)),
+    )
+
+def visible_condition(user_id):
+    """Return a SQL condition matching the logs a user has not hidden."""
+    return ~Log.id.in_(db.select(NotificationHidden.log_id).where(NotificationHidden.user_id == user_id))
+
+def hide_logs(user_id, ids):
+    """Hide logs from a user's notification list and return how many were newly hidden."""
+    ids = set(ids)
+    if not ids:
+        return 0
+    # Hidden logs must not keep counting towards the user's unread badges.
+    mark_read(user_id, ids)
+    hidden = set(db.session.scalars(db.select(NotificationHidden.log_id).where(
+        NotificationHidden.user_id == user_id, NotificationHidden.log_id.in_(ids)
+    )))
+    db.session.add_all(NotificationHidden(user_id=user_id, log_id=log_id) for log_id in ids - hidden)
+    db.session.commit()
+    return len(ids - hidden)
+
+def unread_count(user_id, query=None):
+    """Count the notifications (or the logs of query) a user has not read."""
+    if query is None:
+        query = Log.query.filter(Log.event_type.in_(NOTIFICATION_EVENT_TYPES))
+    return query.filter(unread_condition(user_id)).count()
+
+def read_ids(user_id, ids):
+    """Return the subset of log ids a user has read."""
+    ids = set(ids)
+    if not ids:
+        return set()
+    last_read_id = get_cursor(user_id).last_read_id
+    flipped = set(db.session.scalars(_exceptions(user_id).where(NotificationReadException.log_id.in_(ids))))
+    return {log_id for log_id in ids if (log_id <= last_read_id) != (log_id in flipped)}
+
+def _set_state(cursor, ids, read):
+    """Add or remove exceptions so that ids end up read (or unread); return the ids that changed."""
+    ids = set(ids)
+    # Above the cursor an exception means read, at or below it unread.
+    flip = {log_id for log_id in ids if (log_id > cursor.last_read_id) == read}
+    clear = ids - flip
+    changed = set()
+    if clear:
+        changed.update(db.session.scalars(
+            _exceptions(cursor.user_id).where(NotificationReadException.log_id.in_(clear))
+        ))
+        if changed:
+            NotificationReadException.query.filter(
+                NotificationReadException.user_id == cursor.user_id,
+                NotificationReadException.log_id.in_(changed),
+            ).delete(synchronize_session=False)
+    if flip:
+        existing = set(db.session.scalars(
+            _exceptions(cursor.user_id).where(NotificationReadException.log_id.in_(flip))
+        ))
+        new = db.session.scalars(db.select(Log.id).where(Log.id.in_(flip - existing))).all()
+        if new:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(db.insert(NotificationReadException), [
+                        {"user_id": cursor.user_id, "log_id": log_id} for log_id in new
+                    ])
+                changed.update(new)
+            except IntegrityError:
+                # Another request for the same user got there first.
+                pass
+    return changed
+
+def _advance(cursor):
+    """
+    Move the cursor over the read notifications directly above it, dropping
+    their exceptions. It never passes the newest log the user read, so logs
+    still being written are not skipped.
+    """
+    top = db.session.query(db.func.max(NotificationReadException.log_id)).filter(
+        NotificationReadException.user_id == cursor.user_id,
+        NotificationReadException.log_id > cursor.last_read_id,
+    ).scalar()
+    if top is None:
+        return
+    next_unread = db.session.query(db.func.min(Log.id)).filter(
+        Log.id > cursor.last_read_id,
+        Log.id <= top,
+        Log.event_type.in_(NOTIFICATION_EVENT_TYPES),
+        ~Log.id.in_(_exceptions(cursor.user_id)),
+    ).scalar()
+    last_read_id = top if next_unread is None else next_unread - 1
+    if last_read_id <= cursor.last_read_id:
+        return
+    NotificationReadException.query.filter(
+        NotificationReadException.user_id == cursor.user_id,
+        NotificationReadException.log_id > cursor.last_read_id,
+        NotificationReadException.log_id <= last_read_id,
+    ).delete(synchronize_session=False)
+    cursor.last_read_id = last_read_id
+
+def mark_read(user_id, ids):
+    """Mark logs as read for a user and return how many changed."""
+    if not ids:
+        return 0
+    cursor = get_cursor(user_id)
+    changed = _set_state(cursor, ids, True)
+    _advance(cursor)
+    db.session.commit()
+    _count_read(user_id, changed, 1)
+    return len(changed)
+
+def mark_unread(user_id, ids):
+    """Mark logs as unread for a user and return how many changed."""
+    if not ids:
+        return 0
+    changed = _set_state(get_cursor(user_id), ids, False)
+    db.session.commit()
+    _count_read(user_id, changed, -1)
+    return len(changed)
+
+def mark_all_read(user_id, up_to=None):
+    """Mark every log up to up_to (default: the newest) as read for a user."""
+    cursor = get_cursor(user_id)
+    up_to = _newest_log_id() if up_to is None else up_to
+    NotificationReadException.query.filter(
+        NotificationReadException.user_id == user_id,
+        NotificationReadException.log_id <= up_to,
+    ).delete(synchronize_session=False)
+    cursor.last_read_id = max(cursor.last_read_id, up_to)
+    db.session.commit()
+    _forget_counts(user_id)
+    return cursor.last_read_id
+
+def forget_logs(ids):
+    """
+    Drop the read exceptions and hides of logs about to be deleted. Returns
+    what invalidate_counts needs once the deletion is committed. Does not
+    commit.
+    """
+    if not ids:
+        return None
+    logs = db.session.query(Log.id, Log.event_type, Log.room_url).filter(
+        Log.id.in_(ids), Log.event_type.in_(NOTIFICATION_EVENT_TYPES)
+    ).all()
+    # Users whose cursor passed a deleted log, or who have an exception for
+    # one, may have counted it as read.
+    users = set(db.session.scalars(
+        db.select(NotificationCursor.user_id).where(NotificationCursor.last_read_id >= min(ids))
+    ))
+    users.update(db.session.scalars(
+        db.select(NotificationReadException.user_id).where(NotificationReadException.log_id.in_(ids)).distinct()
+    ))
+    NotificationReadException.query.filter(
+        NotificationReadException.log_id.in_(ids)
+    ).delete(synchronize_session=False)
+    NotificationHidden.query.filter(NotificationHidden.log_id.in_(ids)).delete(synchronize_session=False)
+    return {"logs": [tuple(log) for log in logs], "users": sorted(users)}
+
+def forget_user(user_id):
+    """Drop a user's cursor, exceptions and hides. Does not commit."""
+    NotificationReadException.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    NotificationHidden.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    NotificationCursor.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+
+def _bucket_keys(event_type, room_url):
+    return [f"type:{event_type}", f"url:{room_url}"]
+
+def _produced_key(generation, bucket):
+    return f"unread:produced:{generation['id']}:{bucket}"
+
+def _seen_key(user_id, bucket):
+    return f"unread:seen:{user_id}:{bucket}"
+
+def _synced_key(user_id):
+    return f"unread:synced:{user_id}"
+
+def _increment_produced(generation, event_type, room_url, delta):
+    for bucket in _bucket_keys(event_type, room_url):
+        cache.cache.inc(_produced_key(generation, bucket), delta)
+
+def _claim_log(generation, log_id):
+    """
+    Return True if the log is not in the generation's produced counters yet,
+    recording that it now is. The rebuild counted every log up to
+    high_water, then those it caught up on up to caught_up; count_new_log
+    and the catch-up race only for logs in between, and a marker settles
+    which of them counts each one.
+    """
+    if log_id <= generation["high_water"]:
+        return False
+    caught_up = generation.get("caught_up")
+    if caught_up is not None and log_id > caught_up:
+        return True
+    return bool(cache.add(f"unread:counted:{generation['id']}:{log_id}", 1, timeout=COUNTS_RECONCILE_INTERVAL))
+
+def count_new_log(log):
+    """Count a newly committed log towards everyone's unread badges."""
+    if log.event_type not in NOTIFICATION_EVENT_TYPES:
+        return
+    try:
+        generation = cache.get("unread:generation")
+        # Without a generation the next lookup rebuilds from the database.
+        if generation and _claim_log(generation, log.id):
+            _increment_produced(generation, log.event_type, log.room_url, 1)
+    except Exception as e:
+        logging.error("Unread counter error for log %s: %s", log.id, e)
+
+def _count_read(user_id, ids, delta):
+    """Add delta to the user's read counters of the buckets of ids."""
+    if not ids:
+        return
+    try:
+        synced = cache.get(_synced_key(user_id))
+        if not synced:
+            # Counters are rebuilt on the next lookup anyway.
+            return
+        deltas = Counter()
+        for event_type, room_url in db.session.query(Log.event_type, Log.room_url).filter(
+            Log.id.in_(ids), Log.event_type.in_(NOTIFICATION_EVENT_TYPES)
+        ):
+            for bucket in _bucket_keys(event_type, room_url):
+                deltas[bucket] += delta
+        for bucket, change in deltas.items():
+            # Buckets the user has not looked up yet get built from scratch later.
+            if bucket in synced["buckets"]:
+                cache.cache.inc(_seen_key(user_id, bucket), change)
+    except Exception as e:
+        logging.error("Unread counter error for user %s: %s", user_id, e)
+
+def _forget_counts(user_id):
+    try:
+        cache.delete(_synced_key(user_id))
+    except Exception as e:
+        logging.error("Unread counter error for user %s: %s", user_id, e)
+
+def invalidate_counts(forgotten):
+    """
+    Take deleted logs out of the produced counters and reset the counters of
+    the users who had read them; forgotten is what forget_logs returned.
+    Call after the deletion is committed.
+    """
+    if not forgotten:
+        return
+    try:
+        generation = cache.get("unread:generation")
+        if generation:
+            caught_up = generation.get("caught_up")
+            for log_id, event_type, room_url in forgotten["logs"]:
+                if caught_up is not None and log_id > caught_up:
+                    # count_new_log counted these without a marker.
+                    counted = True
+                else:
+                    # Claiming a log nobody counted yet keeps it from being counted later.
+                    counted = not _claim_log(generation, log_id)
+                if counted:
+                    _increment_produced(generation, event_type, room_url, -1)
+        cache.delete_many(*[_synced_key(user_id) for user_id in forgotten["users"]])
+    except Exception as e:
+        logging.error("Unread counter invalidation error: %s", e)
+        try:
+            cache.delete("unread:generation")
+        except Exception as e:
+            logging.error("Unread counter invalidation error: %s", e)
+
+def _bucket_counts(query):
+    counts = Counter()
+    for event_type, room_url, count in query.with_entities(
+        Log.event_type, Log.room_url, db.func.count(Log.id)
+    ).filter(Log.event_type.in_(NOTIFICATION_EVENT_TYPES)).group_by(Log.event_type, Log.room_url):
+        for bucket in _bucket_keys(event_type, room_url):
+            counts[bucket] += count
+    return counts
+
+def _rebuild_produced():
+    """
+    Recount the notifications of every bucket into a new generation and
+    publish it. Logs committed during the count are caught up afterwards.
+    """
+    generation = {"id": uuid.uuid4().hex, "high_water": _newest_log_id()}
+    produced = _bucket_counts(Log.query.filter(Log.id <= generation["high_water"]))
+    # Buckets without logs must read as zero, not keep a stale count.
+    for event_type in NOTIFICATION_EVENT_TYPES:
+        produced.setdefault(f"type:{event_type}", 0)
+    # The keys outlive the generation so lookups under way can finish.
+    cache.set_many({_produced_key(generation, bucket): count for bucket, count in produced.items()},
+                   timeout=2 * COUNTS_RECONCILE_INTERVAL)
+    cache.set("unread:generation", generation, timeout=COUNTS_RECONCILE_INTERVAL)
+    caught_up = generation["high_water"]
+    for log_id, event_type, room_url in db.session.query(Log.id, Log.event_type, Log.room_url).filter(
+        Log.id > generation["high_water"], Log.event_type.in_(NOTIFICATION_EVENT_TYPES)
+    ):
+        caught_up = max(caught_up, log_id)
+        if _claim_log(generation, log_id):
+            _increment_produced(generation, event_type, room_url, 1)
+    published = cache.get("unread:generation")
+    if published and published["id"] == generation["id"]:
+        generation["caught_up"] = caught_up
+        cache.set("unread:generation", generation, timeout=COUNTS_RECONCILE_INTERVAL)
+    return generation
+
+def _rebuild_user(user_id, buckets, generation):
+    """Set the user's read counters of buckets from their read state."""
+    unread = _bucket_counts(Log.query.filter(unread_condition(user_id)))
+    produced = cache.get_many(*[_produced_key(generation, bucket) for bucket in buckets])
+    cache.set_many({
+        _seen_key(user_id, bucket): (count or 0) - unread[bucket]
+        for bucket, count in zip(buckets, produced)
+    }, timeout=0)
+    cache.set(_synced_key(user_id), {"generation": generation["id"], "buckets": buckets}, timeout=0)
+
+def _read_counters(user_id, buckets, generation):
+    """Return the produced counters of buckets followed by the user's read counters."""
+    return cache.get_many(
+        *[_produced_key(generation, bucket) for bucket in buckets],
+        *[_seen_key(user_id, bucket) for bucket in buckets],
+    )
+
+def unread_counts(user_id, stream_urls):
+    """
+    Return unread notification counts for a user:
+    {"total": n, "by_type": {event_type: n}, "by_stream": {stream_id: n}},
+    where stream_urls maps each stream id to the room URLs logged for it.
+    """
+    buckets = [f"type:{event_type}" for event_type in NOTIFICATION_EVENT_TYPES]
+    buckets += sorted({f"url:{url}" for urls in stream_urls.values() for url in urls})
+    generation, synced = cache.get_many("unread:generation", _synced_key(user_id))
+    if generation is None:
+        generation = _rebuild_produced()
+    if not synced or synced["generation"] != generation["id"] or not set(buckets) <= set(synced["buckets"]):
+        if synced and synced["generation"] == generation["id"]:
+            buckets = sorted(set(buckets) | set(synced["buckets"]))
+        _rebuild_user(user_id, buckets, generation)
+    values = _read_counters(user_id, buckets, generation)
+    if None in values[:len(NOTIFICATION_EVENT_TYPES)]:
+        # Type buckets always exist; a missing one means the counters were evicted.
+        generation = _rebuild_produced()
+        _rebuild_user(user_id, buckets, generation)
+        values = _read_counters(user_id, buckets, generation)
+    unread = {
+        bucket: max((produced or 0) - (seen or 0), 0)
+        for bucket, produced, seen in zip(buckets, values[:len(buckets)], values[len(buckets):])
+    }
+    by_type = {event_type: unread[f"type:{event_type}"] for event_type in NOTIFICATION_EVENT_TYPES}
+    return {
+        "total": sum(by_type.values()),
+        "by_type": by_type,
+        "by_stream": {
+            stream_id: sum(unread.get(f"url:{url}", 0) for url in set(urls))
+            for stream_id, urls in stream_urls.items()
+        },
+    }
+
+def _legacy_position():
+    """
+    Return (last_read_id, exceptions query) reproducing the legacy global
+    Log.read flags: either just below the oldest unread notification, with
+    the read ones above it as exceptions, or at the newest read one, with
+    the unread ones below it as exceptions, whichever needs fewer rows.
+    """
+    notifications = Log.query.filter(Log.event_type.in_(NOTIFICATION_EVENT_TYPES))
+    oldest_unread = notifications.filter(Log.read == False).with_entities(db.func.min(Log.id)).scalar()
+    newest_read = notifications.filter(Log.read == True).with_entities(db.func.max(Log.id)).scalar()
+    if oldest_unread is None or newest_read is None or newest_read < oldest_unread:
+        return (_newest_log_id() if oldest_unread is None else oldest_unread - 1), None
+    read_above = notifications.filter(Log.id >= oldest_unread, Log.read == True)
+    unread_below = notifications.filter(Log.id <= newest_read, Log.read == False)
+    if read_above.count() <= unread_below.count():
+        return oldest_unread - 1, read_above
+    return newest_read, unread_below
+
+def _seed_cursors(user_ids):
+    """Give users that predate per-user read state their legacy read state. Does not commit."""
+    last_read_id, flipped = _legacy_position()
+    for user_id in user_ids:
+        db.session.add(NotificationCursor(user_id=user_id, last_read_id=last_read_id))
+        if flipped is not None:
+            db.session.execute(
+                db.insert(NotificationReadException).from_select(
+                    ["user_id", "log_id"],
+                    flipped.with_entities(db.literal(user_id), Log.id),
+                )
+            )
+    db.session.flush()
+
+def ensure_read_cursors():
+    """
+    Seed a read cursor from the legacy global Log.read flag for every user
+    that has none, i.e. users created before per-user read state. Users
+    created since get theirs from create_cursor. Must run inside an app
+    context, after the default users are created.
+    """
+    try:
+        user_ids = [
+            user_id for (user_id,) in db.session.query(User.id).filter(
+                ~User.id.in_(db.select(NotificationCursor.user_id))
+            )
+        ]
+        if user_ids:
+            _seed_cursors(user_ids)
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error("Could not seed notification read cursors: %s", e)
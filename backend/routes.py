@@ -6,19 +6,29 @@ import base64
 import shutil
 from collections import defaultdict
 from datetime import datetime, timedelta
-import cv2
-import numpy as np
-from PIL import Image
-import m3u8
-import requests
-from flask import request, jsonify, session, send_from_directory, current_app
-from config import app
+from flask import request, jsonify, session, send_from_directory, current_app, stream_with_context
+from sqlalchemy.exc import IntegrityError
+from config import app, cache
 from extensions import db
-from models import User, Stream, Assignment, Log, ChatKeyword, FlaggedObject, TelegramRecipient, ChaturbateStream, StripchatStream
-from utils import allowed_file, login_required
+from models import User, Stream, Assignment, Log, ChatKeyword, FlaggedObject, TelegramRecipient, ChaturbateStream, StripchatStream, AnnotatedFrame
+from utils import allowed_file, login_required, forget_user_role, get_user_role
+from caching import cached_response, invalidate_tags
+from ratelimit import rate_limited
+from search import search_streams
+from balancer import auto_assign, agent_loads, rebalance
+from bulk import BULK_ACTIONS, resolve_filters, is_small, run_chunk, start_bulk_job, get_bulk_job, stream_url_map
+from health import cached_health
+from events import broadcaster
+from ingest import record_object_detection
+import blobs
+import hls
+import readstate
+import channel  # registers the /api/ws WebSocket route
+from metrics import metrics_response, SSE_CLIENTS, EVENTS_TOTAL
 from notifications import *
-from scraping import scrape_stripchat_data, scrape_chaturbate_data, run_scrape_job, scrape_jobs
-from detection import detect_frame, detect_chat, update_flagged_objects, refresh_keywords
+from scraping import scrape_stripchat_data, scrape_chaturbate_data, update_job_progress, get_scrape_job
+from tasks import enqueue, uses_worker
+from detection import detect_frame, detect_chat, update_flagged_objects, refresh_keywords, process_chat_image
 from monitoring import *
 
 
@@ -38,28 +48,11 @@ def detect_chat_from_image():
     new_filename = f"{timestamp}_{filename}"
     chat_image_path = os.path.join(app.config["CHAT_IMAGES_FOLDER"], new_filename)
     file.save(chat_image_path)
-    image = Image.open(chat_image_path)
-    import pytesseract
-    ocr_text = pytesseract.image_to_string(image)
-    refresh_keywords()
-    flagged_keywords = [kw.keyword for kw in ChatKeyword.query.all()]
-    detected_keywords = [kw for kw in flagged_keywords if kw.lower() in ocr_text.lower()]
+    if uses_worker():
+        enqueue("ocr", chat_image_path=chat_image_path)
+        return jsonify({"message": "Chat image queued for OCR"}), 202
+    detected_keywords = process_chat_image(chat_image_path)
     if detected_keywords:
-        flagged_filename = f"flagged_{new_filename}"
-        flagged_filepath = os.path.join(app.config["FLAGGED_CHAT_IMAGES_FOLDER"], flagged_filename)
-        shutil.move(chat_image_path, flagged_filepath)
-        description = (
-            "Chat flagged: Detected keywords " + ", ".join(detected_keywords) +
-            ". OCR text: " + ocr_text
-        )
-        log_entry = Log(
-            room_url="chat",
-            event_type="chat_detection",
-            details={"keywords": detected_keywords, "ocr_text": ocr_text},
-        )
-        db.session.add(log_entry)
-        db.session.commit()
-        send_chat_telegram_notification(flagged_filepath, description)
         return jsonify({"message": "Flagged keywords detected", "keywords": detected_keywords})
     else:
         return jsonify({"message": "No flagged keywords detected"})
@@ -93,6 +86,7 @@ def check_session():
 
 @app.route("/api/agents", methods=["GET"])
 @login_required(role="admin")
+@cached_response("agents")
 def get_agents():
     agents = User.query.filter_by(role="agent").all()
     return jsonify([agent.serialize() for agent in agents])
@@ -117,7 +111,10 @@ def create_agent():
         role="agent",
     )
     db.session.add(agent)
+    db.session.flush()
+    readstate.create_cursor(agent.id)
     db.session.commit()
+    invalidate_tags("agents")
     return jsonify({"message": "Agent created", "agent": agent.serialize()}), 201
 
 @app.route("/api/agents/<int:agent_id>", methods=["PUT"])
@@ -135,6 +132,8 @@ def update_agent(agent_id):
         agent.password = new_pwd
         updates["password"] = "updated"
     db.session.commit()
+    forget_user_role(agent_id)
+    invalidate_tags("agents")
     return jsonify({"message": "Agent updated", "updates": updates})
 
 @app.route("/api/agents/<int:agent_id>", methods=["DELETE"])
@@ -143,16 +142,37 @@ def delete_agent(agent_id):
     agent = User.query.filter_by(id=agent_id, role="agent").first()
     if not agent:
         return jsonify({"message": "Agent not found"}), 404
+    readstate.forget_user(agent_id)
     db.session.delete(agent)
     db.session.commit()
+    forget_user_role(agent_id)
+    invalidate_tags("agents", "assignments")
     return jsonify({"message": "Agent deleted"})
 
 @app.route("/api/streams", methods=["GET"])
 @login_required(role="admin")
+@cached_response("streams", "assignments")
 def get_streams():
     platform = request.args.get("platform", "").strip().lower()
     streamer = request.args.get("streamer", "").strip().lower()  # Filter by streamer
 
+    # Search mode: ranked, paginated matches served from the search index.
+    if "q" in request.args:
+        assigned = request.args.get("assigned", "").strip().lower()
+        page = max(1, request.args.get("page", 1, type=int))
+        total, streams = search_streams(
+            request.args["q"],
+            platform=platform or None,
+            assigned={"true": True, "false": False}.get(assigned),
+            page=page,
+            per_page=request.args.get("per_page", 50, type=int),
+        )
+        return jsonify({
+            "total": total,
+            "page": page,
+            "streams": [stream.serialize() for stream in streams],
+        })
+
     if platform == "chaturbate":
         streams = ChaturbateStream.query.filter(ChaturbateStream.streamer_username.ilike(f"%{streamer}%")).all()
     elif platform == "stripchat":
@@ -213,6 +233,7 @@ def create_stream():
 
     db.session.add(stream)
     db.session.commit()
+    invalidate_tags("streams")
 
     return jsonify({
         "message": "Stream created",
@@ -243,11 +264,67 @@ def assign_agent_to_stream():
         assignment = Assignment(agent_id=agent_id, stream_id=stream_id)
         db.session.add(assignment)
         db.session.commit()
+        invalidate_tags("assignments")
         return jsonify({"message": "Assignment created successfully."}), 201
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"message": "Agent is already assigned to this stream."}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Assignment creation failed", "error": str(e)}), 500
 
+@app.route("/api/assign/auto", methods=["POST"])
+@login_required(role="admin")
+def auto_assign_streams():
+    """
+    Assign unassigned streams to the least loaded agents.
+
+    Optional JSON payload:
+    {
+        "stream_ids": [<stream_id>, ...]   # limit to these streams
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        created = auto_assign(data.get("stream_ids"))
+        db.session.commit()
+        invalidate_tags("assignments")
+        return jsonify({
+            "message": f"{len(created)} streams assigned.",
+            "assignments": [assignment.serialize() for assignment in created],
+            "agent_loads": agent_loads(),
+        }), 201 if created else 200
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"message": "Assignments changed concurrently, please retry."}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Auto-assignment failed", "error": str(e)}), 500
+
+@app.route("/api/assign/rebalance", methods=["POST"])
+@login_required(role="admin")
+def rebalance_assignments():
+    """
+    Redistribute all streams across agents by load in one transaction.
+
+    Optional JSON payload:
+    {
+        "dry_run": true   # only report the moves
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        result = rebalance(dry_run=bool(data.get("dry_run")))
+        if not data.get("dry_run"):
+            invalidate_tags("assignments")
+        return jsonify(result), 200
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"message": "Assignments changed concurrently, please retry."}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Rebalance failed", "error": str(e)}), 500
+
 @app.route("/api/streams/<int:stream_id>", methods=["PUT"])
 @login_required(role="admin")
 def update_stream(stream_id):
@@ -278,6 +355,7 @@ def update_stream(stream_id):
     if "platform" in data:
         stream.type = data["platform"].strip().lower()
     db.session.commit()
+    invalidate_tags("streams")
     return jsonify({"message": "Stream updated", "stream": stream.serialize()})
 
 @app.route("/api/streams/<int:stream_id>", methods=["DELETE"])
@@ -294,6 +372,7 @@ def delete_stream(stream_id):
     # Delete the stream
     db.session.delete(stream)
     db.session.commit()
+    invalidate_tags("streams", "assignments")
 
     return jsonify({"message": "Stream deleted"})
 
@@ -309,10 +388,10 @@ def scrape_stripchat_endpoint():
         return jsonify({"message": "Invalid Stripchat URL"}), 400
 
     job_id = str(uuid.uuid4())
-    scrape_jobs[job_id] = {"progress": 0, "message": "Job created"}
+    update_job_progress(job_id, 0, "Job created")
 
-    # Start the scraping job in a separate thread
-    threading.Thread(target=run_scrape_job, args=(job_id, url), daemon=True).start()
+    # Hand the scraping job to the task queue
+    enqueue("scrape", job_id=job_id, url=url)
 
     return jsonify({"message": "Scrape job started", "job_id": job_id})
 
@@ -320,13 +399,14 @@ def scrape_stripchat_endpoint():
 @login_required(role="admin")
 def get_scrape_progress(job_id):
     """Get the progress of a scraping job."""
-    job = scrape_jobs.get(job_id)
+    job = get_scrape_job(job_id)
     if not job:
         return jsonify({"message": "Job ID not found"}), 404
     return jsonify(job)
 
 @app.route("/api/keywords", methods=["GET"])
 @login_required(role="admin")
+@cached_response("keywords")
 def get_keywords():
     keywords = ChatKeyword.query.all()
     return jsonify([kw.serialize() for kw in keywords])
@@ -343,6 +423,7 @@ def create_keyword():
     kw = ChatKeyword(keyword=keyword)
     db.session.add(kw)
     db.session.commit()
+    invalidate_tags("keywords")
     refresh_keywords()
     return jsonify({"message": "Keyword added", "keyword": kw.serialize()}), 201
 
@@ -358,6 +439,7 @@ def update_keyword(keyword_id):
         return jsonify({"message": "New keyword required"}), 400
     kw.keyword = new_kw
     db.session.commit()
+    invalidate_tags("keywords")
     refresh_keywords()
     return jsonify({"message": "Keyword updated", "keyword": kw.serialize()})
 
@@ -369,11 +451,13 @@ def delete_keyword(keyword_id):
         return jsonify({"message": "Keyword not found"}), 404
     db.session.delete(kw)
     db.session.commit()
+    invalidate_tags("keywords")
     refresh_keywords()
     return jsonify({"message": "Keyword deleted"})
 
 @app.route("/api/objects", methods=["GET"])
 @login_required(role="admin")
+@cached_response("objects")
 def get_objects():
     objects = FlaggedObject.query.all()
     return jsonify([obj.serialize() for obj in objects])
@@ -390,6 +474,7 @@ def create_object():
     obj = FlaggedObject(object_name=obj_name)
     db.session.add(obj)
     db.session.commit()
+    invalidate_tags("objects")
     return jsonify({"message": "Object added", "object": obj.serialize()}), 201
 
 @app.route("/api/objects/<int:object_id>", methods=["PUT"])
@@ -404,6 +489,7 @@ def update_object(object_id):
         return jsonify({"message": "New name required"}), 400
     obj.object_name = new_name
     db.session.commit()
+    invalidate_tags("objects")
     return jsonify({"message": "Object updated", "object": obj.serialize()})
 
 @app.route("/api/objects/<int:object_id>", methods=["DELETE"])
@@ -414,10 +500,12 @@ def delete_object(object_id):
         return jsonify({"message": "Object not found"}), 404
     db.session.delete(obj)
     db.session.commit()
+    invalidate_tags("objects")
     return jsonify({"message": "Object deleted"})
 
 @app.route("/api/telegram_recipients", methods=["GET"])
 @login_required(role="admin")
+@cached_response("telegram_recipients")
 def get_telegram_recipients():
     recipients = TelegramRecipient.query.all()
     return jsonify([r.serialize() for r in recipients])
@@ -435,6 +523,7 @@ def create_telegram_recipient():
     recipient = TelegramRecipient(telegram_username=username, chat_id=chat_id)
     db.session.add(recipient)
     db.session.commit()
+    invalidate_tags("telegram_recipients")
     return jsonify({"message": "Recipient added", "recipient": recipient.serialize()}), 201
 
 @app.route("/api/telegram_recipients/<int:recipient_id>", methods=["DELETE"])
@@ -445,38 +534,102 @@ def delete_telegram_recipient(recipient_id):
         return jsonify({"message": "Recipient not found"}), 404
     db.session.delete(recipient)
     db.session.commit()
+    invalidate_tags("telegram_recipients")
     return jsonify({"message": "Recipient deleted"})
 
 @app.route("/api/dashboard", methods=["GET"])
 @login_required(role="admin")
+@cached_response("streams", "agents", "assignments")
 def get_dashboard():
-    streams = Stream.query.all()
-    data = []
-    for stream in streams:
-        assignment = stream.assignments[0] if stream.assignments else None
-        data.append({
+    # One projected query: every stream (with its platform columns) joined to
+    # the agent of its earliest assignment, instead of per-stream lazy loads.
+    poly = db.with_polymorphic(Stream, [ChaturbateStream, StripchatStream])
+    first_assignment = (
+        db.session.query(
+            Assignment.stream_id.label("stream_id"),
+            db.func.min(Assignment.id).label("assignment_id"),
+        )
+        .group_by(Assignment.stream_id)
+        .subquery()
+    )
+    rows = (
+        db.session.query(poly, User)
+        .outerjoin(first_assignment, first_assignment.c.stream_id == poly.id)
+        .outerjoin(Assignment, Assignment.id == first_assignment.c.assignment_id)
+        .outerjoin(User, User.id == Assignment.agent_id)
+        .options(db.lazyload(poly.assignments), db.lazyload(User.assignments))
+        .order_by(poly.id)
+        .all()
+    )
+    data = [
+        {
             **stream.serialize(),
-            "agent": assignment.agent.serialize() if assignment else None,
+            "agent": agent.serialize() if agent else None,
             "confidence": 0.8
-        })
+        }
+        for stream, agent in rows
+    ]
     return jsonify({"ongoing_streams": len(data), "streams": data})
 
 @app.route("/api/agent/dashboard", methods=["GET"])
 @login_required(role="agent")
 def get_agent_dashboard():
     agent_id = session["user_id"]
-    assignments = Assignment.query.filter_by(agent_id=agent_id).all()
+    poly = db.with_polymorphic(Stream, [ChaturbateStream, StripchatStream])
+    streams = (
+        db.session.query(poly)
+        .join(Assignment, Assignment.stream_id == poly.id)
+        .filter(Assignment.agent_id == agent_id)
+        .options(db.lazyload(poly.assignments))
+        .order_by(Assignment.id)
+        .all()
+    )
     return jsonify({
-        "ongoing_streams": len(assignments),
-        "assignments": [a.stream.serialize() for a in assignments if a.stream]
+        "ongoing_streams": len(streams),
+        "assignments": [stream.serialize() for stream in streams]
     })
 
 
 @app.route("/detection-images/<filename>")
 def serve_detection_image(filename):
-    return send_from_directory("detections", filename)
+    return send_from_directory(app.config["DETECTIONS_FOLDER"], filename)
+
+@app.route("/api/clips/<filename>")
+@login_required()
+def serve_clip(filename):
+    return send_from_directory(app.config["CLIPS_FOLDER"], filename)
+
+@app.route("/api/annotated-frames/<filename>")
+@login_required()
+def serve_annotated_frame(filename):
+    frame = db.session.get(AnnotatedFrame, filename)
+    if frame is None:
+        return jsonify({"message": "Frame not found"}), 404
+    response = app.response_class(stream_with_context(blobs.iter_chunks(filename)), mimetype=frame.content_type)
+    response.headers["Content-Length"] = frame.size
+    # Frames never change once stored.
+    response.headers["Cache-Control"] = "private, max-age=86400, immutable"
+    return response
+
+def detection_payload():
+    """
+    Return (data, store_image) for a detection upload. Multipart uploads carry
+    the JSON metadata in a "metadata" field and the frame as an
+    "annotated_image" file, which goes to the blob store as-is instead of being
+    base64-decoded. store_image() saves that file and returns its URL; callers
+    run it only once the metadata is valid, so rejected uploads leave no blob.
+    It is None when there is no file.
+    """
+    if request.mimetype != "multipart/form-data":
+        return request.get_json(), None
+    data = json.loads(request.form.get("metadata") or "{}")
+    image = request.files.get("annotated_image")
+    if not image:
+        return data, None
+    return data, lambda: blobs.save_stream(image.stream, image.mimetype or "image/jpeg")
 
 @app.route("/api/detect", methods=["POST"])
+@rate_limited
 def unified_detect():
     data = request.get_json()
     text = data.get("text", "")
@@ -484,6 +637,7 @@ def unified_detect():
     audio_flag = None
     visual_results = []
     if visual_frame:
+        import numpy as np
         visual_results = detect_frame(np.array(visual_frame))
     chat_results = detect_chat(text)
     return jsonify({
@@ -494,116 +648,124 @@ def unified_detect():
 
 @app.route("/api/notification-events")
 def notification_events():
-    def generate():
-        import json
-        import time
-        while True:
-            try:
-                cutoff = datetime.utcnow() - timedelta(seconds=30)
-                # Updated filter: include both object_detection and video_notification events
-                logs = Log.query.filter(
-                    Log.timestamp >= cutoff,
-                    Log.event_type.in_(["object_detection", "video_notification"])
-                ).order_by(Log.timestamp.desc()).all()
-                for log in logs:
-                    if log.event_type == "object_detection":
-                        for det in log.details.get("detections", []):
-                            payload = {
-                                "type": "detection",
-                                "stream": log.room_url,
-                                "object": det.get("class", "object"),
-                                "confidence": det.get("confidence", 0),
-                                "id": log.id,
-                            }
-                            yield "data: " + json.dumps(payload) + "\n\n"
-                    elif log.event_type == "video_notification":
-                        payload = {
-                            "type": "video",
-                            "stream": log.room_url,
-                            "message": log.details.get("message", "Video event occurred"),
-                            "id": log.id,
-                        }
-                        yield "data: " + json.dumps(payload) + "\n\n"
-                time.sleep(1)
-            except Exception as e:
-                time.sleep(5)
-    return current_app.response_class(generate(), mimetype="text/event-stream")
+    # Subscribe before reading the backlog so no event falls in between;
+    # clients de-duplicate by id.
+    subscriber = broadcaster.subscribe()
+    backlog = broadcaster.replay()
+    SSE_CLIENTS.inc()
+
+    def close():
+        broadcaster.unsubscribe(subscriber)
+        SSE_CLIENTS.dec()
+
+    response = current_app.response_class(
+        broadcaster.stream(subscriber, backlog), mimetype="text/event-stream"
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.call_on_close(close)
+    return response
 
 @app.route("/health")
 def health():
     return "OK", 200
 
+@app.route("/health/live")
+def health_live():
+    healthy, checks = cached_health("live")
+    return jsonify({"status": "ok" if healthy else "unhealthy", "checks": checks}), 200 if healthy else 503
+
+@app.route("/health/ready")
+def health_ready():
+    healthy, checks = cached_health("ready")
+    return jsonify({"status": "ok" if healthy else "unhealthy", "checks": checks}), 200 if healthy else 503
+
+@app.route("/metrics")
+def metrics():
+    body, content_type = metrics_response()
+    return current_app.response_class(body, mimetype=content_type)
+
 @app.route("/api/livestream", methods=["POST"])
+@login_required()
 def get_livestream():
     data = request.get_json()
     if not data or "url" not in data:
         return jsonify({"error": "Missing M3U8 URL"}), 400
-    m3u8_url = data["url"]
     try:
-        response = requests.get(m3u8_url, timeout=10)
-        if response.status_code != 200:
-            return jsonify({"error": "Failed to fetch M3U8 file"}), 500
-        playlist = m3u8.loads(response.text)
-        if not playlist.playlists:
-            return jsonify({"error": "No valid streams found"}), 400
-        stream_url = playlist.playlists[0].uri
-        return jsonify({"stream_url": stream_url})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        playlist = hls.get_playlist(data["url"])
+    except hls.UpstreamError as e:
+        return jsonify({"error": str(e)}), e.status
+    variants = playlist.variants()
+    if not variants:
+        return jsonify({"error": "No valid streams found"}), 400
+    try:
+        variant = hls.select_variant(variants, data.get("max_bandwidth"), data.get("max_height"))
+    except ValueError:
+        return jsonify({"error": "Invalid variant limits"}), 400
+    return jsonify({
+        "stream_url": variant["uri"],
+        "proxy_url": hls.proxy_url(variant["uri"]),
+        "relay_url": hls.proxy_url(variant["uri"], relay=True),
+        "variants": variants,
+    })
+
+@app.route("/api/hls/playlist")
+@login_required()
+def proxy_playlist():
+    """
+    Serve a cached copy of an upstream playlist. For a master playlist,
+    max_bandwidth/max_height select a variant whose media playlist is
+    returned instead. relay=1 routes the segments through /api/hls/segment.
+    """
+    url = request.args.get("url")
+    if not url or not url.startswith(("http://", "https://")):
+        return jsonify({"error": "Missing M3U8 URL"}), 400
+    try:
+        playlist = hls.get_playlist(url)
+        limits = (request.args.get("max_bandwidth"), request.args.get("max_height"))
+        if playlist.is_variant and any(limits):
+            variant = hls.select_variant(playlist.variants(), *limits)
+            if variant:
+                playlist = hls.get_playlist(variant["uri"])
+    except hls.UpstreamError as e:
+        return jsonify({"error": str(e)}), e.status
+    except ValueError:
+        return jsonify({"error": "Invalid variant limits"}), 400
+    relay = request.args.get("relay") == "1"
+    response = current_app.response_class(
+        hls.rewrite_playlist(playlist, relay), mimetype="application/vnd.apple.mpegurl"
+    )
+    if playlist.is_live:
+        # A new segment can appear at any moment; the player must revalidate.
+        response.headers["Cache-Control"] = "no-cache"
+    else:
+        response.headers["Cache-Control"] = f"private, max-age={int(playlist.ttl())}"
+    return response
+
+@app.route("/api/hls/segment")
+@login_required()
+def relay_segment():
+    url = request.args.get("url")
+    if not url or not url.startswith(("http://", "https://")):
+        return jsonify({"error": "Missing segment URL"}), 400
+    try:
+        segment = hls.get_segment(url, request.args.get("stream"))
+    except hls.UpstreamError as e:
+        return jsonify({"error": str(e)}), e.status
+    response = current_app.response_class(segment.content, mimetype=segment.content_type)
+    response.headers["Cache-Control"] = f"private, max-age={hls.SEGMENT_TTL}"
+    return response
 
 # --------------------------------------------------------------------
 # Updated /api/detect-objects endpoint with error fixes
 # --------------------------------------------------------------------
 @app.route("/api/detect-objects", methods=["POST"])
 @login_required()
+@rate_limited
 def detect_objects():
     try:
-        data = request.get_json()
-        stream_url = data.get("stream_url")
-        detections = data.get("detections")
-        timestamp = data.get("timestamp")
-        annotated_image = data.get("annotated_image")
-        streamer_name = data.get("streamer_name")
-        platform = data.get("platform")
-        assigned_agent = data.get("assigned_agent")
-        detected_object = data.get("detected_object")
-
-        if not stream_url or not detections:
-            return jsonify({"message": "Missing required fields"}), 400
-
-        # Check if a similar detection has already been logged in the last 5 minutes, if detected_object is provided.
-        cutoff = datetime.utcnow() - timedelta(minutes=5)
-        existing_detection = None
-        if detected_object:
-            existing_detection = Log.query.filter(
-                Log.room_url == stream_url,
-                Log.event_type == "object_detection",
-                Log.timestamp >= cutoff,
-                Log.details.contains({"detected_object": detected_object})
-            ).first()
-
-        if existing_detection:
-            return jsonify({"message": "Duplicate detection skipped"}), 200
-
-        log_entry = Log(
-            room_url=stream_url,
-            event_type="object_detection",
-            details={
-                "detections": detections,
-                "annotated_image": annotated_image,
-                "timestamp": timestamp,
-                "streamer_name": streamer_name,
-                "platform": platform,
-                "assigned_agent": assigned_agent,
-                "detected_object": detected_object,
-            }
-        )
-        db.session.add(log_entry)
-        db.session.commit()
-
-        send_notifications(log_entry, detections)
-
-        return jsonify({"message": "Detection logged successfully"}), 201
+        body, status = record_object_detection(*detection_payload())
+        return jsonify(body), status
     except Exception as e:
         return jsonify({"message": "Error logging detection", "error": str(e)}), 500
 
@@ -612,48 +774,117 @@ def detect_objects():
 @login_required()
 def get_notifications():
     filter_type = request.args.get('filter', 'all')
+    user_id = session["user_id"]
     
-    query = Log.query.filter(Log.event_type.in_(['object_detection', 'chat_detection', 'video_notification']))
+    query = Log.query.filter(
+        Log.event_type.in_(readstate.NOTIFICATION_EVENT_TYPES),
+        readstate.visible_condition(user_id),
+    )
     
     if filter_type == 'unread':
-        query = query.filter_by(read=False)
+        query = query.filter(readstate.unread_condition(user_id))
     elif filter_type == 'detection':
         query = query.filter_by(event_type='object_detection')
     
     notifications = query.order_by(Log.timestamp.desc()).all()
+    read_ids = readstate.read_ids(user_id, [log.id for log in notifications])
     result = []
     for log in notifications:
         if log.event_type == 'video_notification':
             message = log.details.get('message', 'Video event occurred')
         elif log.event_type == 'chat_detection':
             message = "Chat detection event"
+        elif log.event_type == 'audio_detection':
+            message = f"Audio keyword detected: {log.details.get('keyword')}"
         else:
             message = f"Detected {len(log.details.get('detections', []))} objects"
         result.append({
             "id": log.id,
             "message": message,
             "timestamp": log.timestamp.isoformat(),
-            "read": log.read,
+            "read": log.id in read_ids,
             "type": log.event_type,
             "details": log.details
         })
     return jsonify(result)
 
+@app.route("/api/notifications/counts", methods=["GET"])
+@login_required()
+def get_notification_counts():
+    """Unread counts per event type and per stream, for badges."""
+    user_id = session["user_id"]
+    key = f"unread:streams:{user_id}"
+    stream_urls = cache.get(key)
+    if stream_urls is None:
+        stream_urls = stream_url_map(None if get_user_role(user_id) == "admin" else user_id)
+        # Assignment changes show up in the per-stream counts within 30s.
+        cache.set(key, stream_urls, timeout=30)
+    return jsonify(readstate.unread_counts(user_id, stream_urls))
+
 @app.route("/api/notifications/<int:notification_id>/read", methods=["PUT"])
 @login_required()
 def mark_notification_as_read(notification_id):
     log = Log.query.get(notification_id)
     if not log:
         return jsonify({"message": "Notification not found"}), 404
-    log.read = True
-    db.session.commit()
+    readstate.mark_read(session["user_id"], [notification_id])
     return jsonify({"message": "Notification marked as read"})
 
+def run_bulk_notifications(action, data):
+    """
+    Apply a bulk action to the notifications matching a filter, scoped to
+    the caller. Small id lists run inline; anything else becomes a chunked
+    background job whose progress is polled from /api/notifications/bulk/<job_id>;
+    its "total" is null until the job has counted the matching logs.
+    """
+    user_id = session["user_id"]
+    role = get_user_role(user_id)
+    if action == "delete" and role != "admin":
+        # Logs are shared by every user; an agent only removes them from their own list.
+        action = "hide"
+    try:
+        filters = resolve_filters(data, user_id, role, scoped=action != "hide")
+    except (TypeError, ValueError) as e:
+        return jsonify({"message": "Invalid filter", "error": str(e)}), 400
+    if is_small(filters):
+        processed, _ = run_chunk(filters, action)
+        return jsonify({"message": f"{processed} notifications affected", "status": "completed",
+                        "processed": processed}), 200
+    job = start_bulk_job(action, filters, user_id)
+    return jsonify({"message": f"Bulk {action} started", **job}), 202
+
+@app.route("/api/notifications/bulk", methods=["POST"])
+@login_required()
+def bulk_notifications():
+    """
+    Expected JSON payload:
+    {
+        "action": "read" | "unread" | "delete",
+        "filter": {...}   # see bulk.resolve_filters
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    action = data.get("action")
+    if action not in BULK_ACTIONS:
+        return jsonify({"message": f"action must be one of {', '.join(BULK_ACTIONS)}"}), 400
+    filter_data = data.get("filter") or {}
+    if not isinstance(filter_data, dict):
+        return jsonify({"message": "filter must be an object"}), 400
+    return run_bulk_notifications(action, filter_data)
+
+@app.route("/api/notifications/bulk/<job_id>", methods=["GET"])
+@login_required()
+def get_bulk_notifications_progress(job_id):
+    job = get_bulk_job(job_id)
+    if not job or (job.get("user_id") != session["user_id"] and get_user_role(session["user_id"]) != "admin"):
+        return jsonify({"message": "Job ID not found"}), 404
+    return jsonify(job)
+
 @app.route("/api/notifications/read-all", methods=["PUT"])
 @login_required()
 def mark_all_notifications_read():
-    Log.query.filter(Log.event_type.in_(['object_detection', 'chat_detection']), Log.read == False).update({'read': True})
-    db.session.commit()
+    # A single cursor update, however many notifications are unread.
+    readstate.mark_all_read(session["user_id"])
     return jsonify({"message": "All notifications marked as read"})
 
 @app.route("/api/notifications/<int:notification_id>", methods=["DELETE"])
@@ -662,16 +893,19 @@ def delete_notification(notification_id):
     log = Log.query.get(notification_id)
     if not log:
         return jsonify({"message": "Notification not found"}), 404
+    if get_user_role(session["user_id"]) != "admin":
+        readstate.hide_logs(session["user_id"], [notification_id])
+        return jsonify({"message": "Notification deleted"})
+    forgotten = readstate.forget_logs([notification_id])
     db.session.delete(log)
     db.session.commit()
+    readstate.invalidate_counts(forgotten)
     return jsonify({"message": "Notification deleted"})
 
 @app.route("/api/notifications/delete-all", methods=["DELETE"])
 @login_required()
 def delete_all_notifications():
-    Log.query.filter(Log.event_type.in_(['object_detection', 'chat_detection'])).delete()
-    db.session.commit()
-    return jsonify({"message": "All notifications deleted"})
+    return run_bulk_notifications("delete", {"event_types": ["object_detection", "chat_detection"]})
 
 
 
@@ -689,15 +923,16 @@ def send_telegram_message():
             return jsonify({"message": "No Telegram recipients found"}), 404
 
         for recipient in recipients:
-            send_text_message(message, recipient.chat_id)
+            enqueue("notify", message=message, chat_id=recipient.chat_id)
 
-        return jsonify({"message": "Message sent to all Telegram recipients"}), 200
+        return jsonify({"message": "Message queued for all Telegram recipients"}), 200
     except Exception as e:
         return jsonify({"message": "Error sending Telegram messages", "error": str(e)}), 500
 
 
 @app.route("/api/detect-keyword", methods=["POST"])
 @login_required()
+@rate_limited
 def detect_keyword():
     try:
         data = request.get_json()
@@ -719,6 +954,8 @@ def detect_keyword():
         )
         db.session.add(log_entry)
         db.session.commit()
+        EVENTS_TOTAL.labels(log_entry.event_type).inc()
+        readstate.count_new_log(log_entry)
 
         # Send notifications
         send_notifications(log_entry, {"keyword": keyword})
@@ -728,9 +965,10 @@ def detect_keyword():
         return jsonify({"message": "Error logging keyword detection", "error": str(e)}), 500
 
 @app.route("/api/detection-events", methods=["POST"])
+@rate_limited
 def handle_detection_events():
     try:
-        data = request.get_json()
+        data, store_image = detection_payload()
         event_type = data['type']
         stream_url = data['stream_url']
         
@@ -745,11 +983,14 @@ def handle_detection_events():
             log_entry.event_type = 'object_detection'
             log_entry.details = {
                 'detections': data['detections'],
-                'annotated_image': data['annotated_image'],
+                'annotated_image': None if store_image else data['annotated_image'],
                 'confidence': data['confidence'],
                 'streamer_name': data['streamer_name'],
                 'platform': data['platform']
             }
+            if store_image:
+                # Stored last, once every required field has been read.
+                log_entry.details['annotated_image'] = store_image()
         elif event_type == 'audio':
             log_entry.event_type = 'audio_detection'
             log_entry.details = {
@@ -763,6 +1004,8 @@ def handle_detection_events():
 
         db.session.add(log_entry)
         db.session.commit()
+        EVENTS_TOTAL.labels(log_entry.event_type).inc()
+        readstate.count_new_log(log_entry)
         
         # Trigger notifications
         send_notifications(log_entry)
@@ -0,0 +1,155 @@
+"""
+Risk-based sampling schedule for monitored streams.
+
+Every stream gets a risk score: its detection logs, weighted by type and
+decayed exponentially with age. Hot streams are sampled up to every
+MIN_SAMPLE_INTERVAL seconds and quiet ones every MAX_SAMPLE_INTERVAL
+seconds, scaled down when needed to stay within a fixed global budget of
+samples per second.
+"""
+import os
+import time
+import math
+from datetime import datetime, timedelta
+from extensions import db
+from models import Log
+
+MIN_SAMPLE_INTERVAL = 1
+MAX_SAMPLE_INTERVAL = 60
+# Samples per second shared by all streams, i.e. the CPU/egress budget.
+SAMPLING_BUDGET = float(os.getenv("STREAM_SAMPLES_PER_SECOND", 5))
+RISK_HALF_LIFE = 15 * 60
+# Older logs contribute less than 1/32 of their weight and are not loaded.
+RISK_WINDOW = 5 * RISK_HALF_LIFE
+RESCORE_INTERVAL = 5
+# Score at which a stream is sampled at the fastest rate, e.g. three
+# detections within the last few minutes.
+HOT_SCORE = 3.0
+EVENT_WEIGHTS = {
+    "object_detection": 1.0,
+    "audio_detection": 0.8,
+    "chat_detection": 0.6,
+    "video_notification": 0.3,
+}
+
+def _seconds(timestamp):
+    return (timestamp - datetime(1970, 1, 1)).total_seconds()
+
+def _decay(age):
+    return math.pow(0.5, max(age, 0) / RISK_HALF_LIFE)
+
+class RiskScores:
+    """Decayed, weighted detection counts per Log.room_url, updated incrementally."""
+    def __init__(self):
+        self.scores = {}  # room_url -> (score, as of)
+        self.last_id = None
+
+    def add(self, key, weight, at):
+        score, as_of = self.scores.get(key, (0.0, at))
+        if at >= as_of:
+            self.scores[key] = (score * _decay(at - as_of) + weight, at)
+        else:
+            self.scores[key] = (score + weight * _decay(as_of - at), as_of)
+
+    def get(self, key, now):
+        score, as_of = self.scores.get(key, (0.0, now))
+        return score * _decay(now - as_of)
+
+    def refresh(self):
+        """Fold the logs written since the last refresh into the scores."""
+        query = db.session.query(Log.id, Log.room_url, Log.event_type, Log.timestamp).filter(
+            Log.event_type.in_(list(EVENT_WEIGHTS))
+        )
+        if self.last_id is None:
+            # Later refreshes go by id, so logs outside the window must not
+            # be picked up by them either.
+            self.last_id = db.session.query(db.func.max(Log.id)).scalar() or 0
+            query = query.filter(
+                Log.id <= self.last_id,
+                Log.timestamp >= datetime.utcnow() - timedelta(seconds=RISK_WINDOW),
+            )
+        else:
+            query = query.filter(Log.id > self.last_id)
+        for log_id, room_url, event_type, timestamp in query.order_by(Log.id):
+            self.last_id = max(self.last_id, log_id)
+            if room_url and timestamp:
+                self.add(room_url, EVENT_WEIGHTS[event_type], _seconds(timestamp))
+        # Forget streams whose score has decayed to nothing.
+        now = _seconds(datetime.utcnow())
+        for key in [k for k in self.scores if self.get(k, now) < 1e-3]:
+            del self.scores[key]
+
+def allocate_intervals(scores, budget=SAMPLING_BUDGET,
+                       min_interval=MIN_SAMPLE_INTERVAL, max_interval=MAX_SAMPLE_INTERVAL):
+    """
+    Return {key: sampling interval}. A stream's rate rises linearly with its
+    score from one sample per max_interval to one per min_interval at
+    HOT_SCORE. If the total exceeds the budget, the part above the floor rate
+    is scaled down for every stream alike; the floor itself is always kept.
+    """
+    floor, cap = 1.0 / max_interval, 1.0 / min_interval
+    extra = {key: (cap - floor) * min(1.0, score / HOT_SCORE) for key, score in scores.items()}
+    spare = budget - floor * len(scores)
+    wanted = sum(extra.values())
+    scale = 1.0 if wanted <= spare else max(spare, 0.0) / wanted
+    return {key: 1.0 / (floor + extra[key] * scale) for key in scores}
+
+class StreamScheduler:
+    """
+    Tracks when each stream is next due for sampling. Streams are identified
+    by a key and a set of URLs whose logs count towards its risk (room URL,
+    M3U8 URL, media playlist URL).
+    """
+    def __init__(self):
+        self.risk = RiskScores()
+        self.aliases = {}
+        self.intervals = {}
+        self.last_run = {}
+        self.next_due = {}
+        self.rescored_at = 0
+
+    def set_streams(self, aliases):
+        """Replace the scheduled streams with {key: iterable of URLs}."""
+        self.aliases = {key: {url for url in urls if url} for key, urls in aliases.items()}
+        for key in list(self.next_due):
+            if key not in self.aliases:
+                self.next_due.pop(key, None)
+                self.last_run.pop(key, None)
+        for key in self.aliases:
+            self.next_due.setdefault(key, 0)
+
+    def rescore(self, force=False):
+        """Refresh risk scores and intervals, at most every RESCORE_INTERVAL seconds."""
+        if not force and time.monotonic() - self.rescored_at < RESCORE_INTERVAL:
+            return
+        self.risk.refresh()
+        now = _seconds(datetime.utcnow())
+        scores = {key: sum(self.risk.get(url, now) for url in urls) for key, urls in self.aliases.items()}
+        self.intervals = allocate_intervals(scores)
+        # A stream that just turned hot should not wait out its old interval.
+        for key, interval in self.intervals.items():
+            if key in self.last_run:
+                self.next_due[key] = min(self.next_due.get(key, 0), self.last_run[key] + interval)
+        self.rescored_at = time.monotonic()
+
+    def interval(self, key):
+        return self.intervals.get(key, MAX_SAMPLE_INTERVAL)
+
+    def interval_for_url(self, url, default=MAX_SAMPLE_INTERVAL):
+        """Return the interval of the stream that url belongs to, or default if it is not scheduled."""
+        for key, urls in self.aliases.items():
+            if key == url or url in urls:
+                return self.interval(key)
+        return default
+
+    def due(self, now=None):
+        """Return the keys of the streams due for sampling, most overdue first."""
+        now = time.monotonic() if now is None else now
+        return sorted((key for key, at in self.next_due.items() if at <= now), key=self.next_due.get)
+
+    def mark_sampled(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        self.last_run[key] = now
+        self.next_due[key] = now + self.interval(key)
+
+stream_scheduler = StreamScheduler()
@@ -27,23 +27,53 @@ import logging
 import uuid
 import time
 from concurrent.futures import ThreadPoolExecutor
-from seleniumwire import webdriver
-from selenium.webdriver.chrome.options import Options
+from metrics import stage_timer
+from config import cache
+from tasks import task_handler
 
-# Global dictionary to hold scraping job statuses.
+# Global dictionary to hold scraping job statuses. Jobs are mirrored to the
+# shared cache so progress is visible when they run in the worker process.
 scrape_jobs = {}
 executor = ThreadPoolExecutor(max_workers=5)  # Thread pool for parallel scraping
+SCRAPE_JOB_TIMEOUT = 3600
+
+def save_scrape_job(job_id, job):
+    """Store the status of a scraping job locally and in the shared cache."""
+    scrape_jobs[job_id] = job
+    try:
+        cache.set(f"scrape_job:{job_id}", job, timeout=SCRAPE_JOB_TIMEOUT)
+    except Exception as e:
+        logging.error("Failed to store scrape job %s: %s", job_id, e)
+
+def get_scrape_job(job_id):
+    """Return the status of a scraping job, or None if unknown."""
+    try:
+        job = cache.get(f"scrape_job:{job_id}")
+    except Exception as e:
+        logging.error("Failed to load scrape job %s: %s", job_id, e)
+        job = None
+    return job or scrape_jobs.get(job_id)
 
 def update_job_progress(job_id, percent, message):
     """Update the progress of a scraping job."""
-    scrape_jobs[job_id] = {
+    job = dict(scrape_jobs.get(job_id, {}))
+    job.update({
         "progress": percent,
         "message": message,
-    }
+    })
+    save_scrape_job(job_id, job)
     logging.info("Job %s progress: %s%% - %s", job_id, percent, message)
 
 def fetch_m3u8_from_page(url, timeout=90):
     """Fetch the M3U8 URL from the given page using Selenium."""
+    with stage_timer("scrape"):
+        return _fetch_m3u8_from_page(url, timeout)
+
+def _fetch_m3u8_from_page(url, timeout):
+    # Selenium is only needed by scrape jobs; import it here to keep it out of
+    # web worker startup.
+    from seleniumwire import webdriver
+    from selenium.webdriver.chrome.options import Options
     chrome_options = Options()
     chrome_options.add_argument("--headless")
     chrome_options.add_argument("--disable-gpu")
@@ -146,6 +176,7 @@ def scrape_stripchat_data(url, progress_callback=None):
             progress_callback(100, f"Error: {e}")
         return None
 
+@task_handler("scrape", concurrency=2)
 def run_scrape_job(job_id, url):
     """Run a scraping job and update progress."""
     update_job_progress(job_id, 0, "Starting scrape job")
@@ -156,8 +187,10 @@ def run_scrape_job(job_id, url):
     else:
         logging.error("Unsupported platform for URL: %s", url)
         result = None
+    job = dict(scrape_jobs.get(job_id, {}))
     if result:
-        scrape_jobs[job_id]["result"] = result
+        job["result"] = result
     else:
-        scrape_jobs[job_id]["error"] = "Scraping failed"
-    update_job_progress(job_id, 100, scrape_jobs[job_id].get("error", "Scraping complete"))
\ No newline at end of file
+        job["error"] = "Scraping failed"
+    save_scrape_job(job_id, job)
+    update_job_progress(job_id, 100, job.get("error", "Scraping complete"))
\ No newline at end of file
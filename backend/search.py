@@ -0,0 +1,105 @@
+import logging
+from extensions import db
+from models import Stream, Assignment, ChaturbateStream, StripchatStream
+
+# Trigram indexes only help for terms of at least three characters; shorter
+# terms fall back to a plain substring filter.
+MIN_INDEXED_TERM_LENGTH = 3
+MAX_PER_PAGE = 200
+
+_fts_available = False
+
+SQLITE_FTS_STATEMENTS = [
+    """CREATE VIRTUAL TABLE streams_fts USING fts5(
+        streamer_username, content='streams', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS streams_fts_ai AFTER INSERT ON streams BEGIN
+        INSERT INTO streams_fts(rowid, streamer_username) VALUES (new.id, new.streamer_username);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS streams_fts_ad AFTER DELETE ON streams BEGIN
+        INSERT INTO streams_fts(streams_fts, rowid, streamer_username)
+        VALUES ('delete', old.id, old.streamer_username);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS streams_fts_au AFTER UPDATE OF streamer_username ON streams BEGIN
+        INSERT INTO streams_fts(streams_fts, rowid, streamer_username)
+        VALUES ('delete', old.id, old.streamer_username);
+        INSERT INTO streams_fts(rowid, streamer_username) VALUES (new.id, new.streamer_username);
+    END""",
+    "INSERT INTO streams_fts(streams_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_TRGM_STATEMENTS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """CREATE INDEX IF NOT EXISTS idx_streams_username_trgm
+        ON streams USING gin (lower(streamer_username) gin_trgm_ops)""",
+]
+
+def ensure_search_index():
+    """
+    Create the streamer search index for the current database.
+    SQLite gets an FTS5 trigram table kept in sync by triggers,
+    Postgres gets a pg_trgm GIN index. Must run inside an app context.
+    """
+    global _fts_available
+    dialect = db.engine.dialect.name
+    try:
+        with db.engine.begin() as conn:
+            if dialect == "sqlite":
+                exists = conn.execute(db.text(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name='streams_fts'"
+                )).first()
+                if not exists:
+                    for statement in SQLITE_FTS_STATEMENTS:
+                        conn.execute(db.text(statement))
+                _fts_available = True
+            elif dialect == "postgresql":
+                for statement in POSTGRES_TRGM_STATEMENTS:
+                    conn.execute(db.text(statement))
+    except Exception as e:
+        logging.error("Could not create streamer search index: %s", e)
+
+def _escape_like(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def search_streams(term, platform=None, assigned=None, page=1, per_page=50):
+    """
+    Search streams by streamer username.
+    Matches are ranked exact, then prefix, then substring, shortest name first.
+    Returns (total, streams) for the requested page.
+    """
+    term = term.strip().lower()
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    page = max(1, page)
+    poly = db.with_polymorphic(Stream, [ChaturbateStream, StripchatStream])
+    username = db.func.lower(poly.streamer_username)
+
+    query = db.session.query(poly).options(db.lazyload(poly.assignments))
+    if term:
+        pattern = f"%{_escape_like(term)}%"
+        if _fts_available and len(term) >= MIN_INDEXED_TERM_LENGTH:
+            fts_query = '"' + term.replace('"', '""') + '"'
+            matches = db.text(
+                "SELECT rowid FROM streams_fts WHERE streams_fts MATCH :fts_query"
+            ).bindparams(fts_query=fts_query).columns(rowid=db.Integer)
+            query = query.filter(poly.id.in_(matches.subquery().select()))
+        else:
+            query = query.filter(username.like(pattern, escape="\\"))
+    if platform:
+        query = query.filter(poly.type == platform.lower())
+    if assigned is not None:
+        has_assignment = db.exists().where(Assignment.stream_id == poly.id)
+        query = query.filter(has_assignment if assigned else ~has_assignment)
+
+    total = query.order_by(None).count()
+    rank = db.case(
+        (username == term, 0),
+        (username.like(f"{_escape_like(term)}%", escape="\\"), 1),
+        else_=2,
+    )
+    streams = (
+        query.order_by(rank, db.func.length(poly.streamer_username), poly.id)
+        .offset((page - 1) * per_page)
+        .limit(per_page)
+        .all()
+    )
+    return total, streams
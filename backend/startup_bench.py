@@ -0,0 +1,119 @@
+"""
+Measure web worker boot time and memory.
+
+Each scenario runs in a fresh interpreter and reports the time to import the
+application, the time until /health answers, and the resulting RSS:
+
+    python startup_bench.py
+    python startup_bench.py --runs 5
+
+"lazy" is the current behaviour. "eager" imports the heavy ML and browser
+libraries and loads the spaCy model up front, as workers did before they were
+made lazy. "warm" is lazy startup followed by warm_up_models().
+
+With --gunicorn-pid it instead reports the memory of a running gunicorn's
+workers. RSS counts shared pages in every worker; PSS splits them between the
+processes sharing them and Private is what each worker owns alone, so compare
+GUNICORN_PRELOAD=1 against GUNICORN_PRELOAD=0 on PSS/Private:
+
+    python startup_bench.py --gunicorn-pid $(pgrep -o gunicorn)
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+HEAVY_IMPORTS = "import cv2, numpy, PIL.Image, m3u8, seleniumwire.webdriver, telegram"
+
+SCENARIO_CODE = """
+import os, sys, time, json
+os.environ.setdefault("CACHE_TYPE", "SimpleCache")
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+start = time.perf_counter()
+if {eager}:
+    {heavy}
+    import detection
+    detection.warm_up_models()
+import routes
+imported = time.perf_counter()
+routes.app.test_client().get("/health")
+ready = time.perf_counter()
+if {warm}:
+    import detection
+    detection.warm_up_models()
+print(json.dumps({{
+    "import_s": imported - start,
+    "first_health_s": ready - start,
+    "rss_mb": rss_mb(),
+}}))
+"""
+
+SCENARIOS = {
+    "lazy": {"eager": False, "warm": False},
+    "eager": {"eager": True, "warm": False},
+    "warm": {"eager": False, "warm": True},
+}
+
+def run_scenario(name):
+    code = SCENARIO_CODE.format(heavy=HEAVY_IMPORTS, **SCENARIOS[name])
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def smaps_rollup(pid):
+    """Return RSS, PSS and private memory in MB for a process."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1]) / 1024.0
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return fields.get("Rss", 0), fields.get("Pss", 0), private
+
+def report_workers(master_pid):
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        workers = [int(pid) for pid in f.read().split()]
+    print(f"{'pid':<10}{'RSS MB':>10}{'PSS MB':>10}{'Private MB':>12}")
+    totals = [0.0, 0.0, 0.0]
+    for pid in [master_pid] + workers:
+        values = smaps_rollup(pid)
+        totals = [t + v for t, v in zip(totals, values)]
+        label = f"{pid}{'*' if pid == master_pid else ''}"
+        print("{:<10}{:>10.1f}{:>10.1f}{:>12.1f}".format(label, *values))
+    print("{:<10}{:>10.1f}{:>10.1f}{:>12.1f}".format("total", *totals))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark worker startup time and RSS.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--scenarios", default="lazy,eager,warm")
+    parser.add_argument("--gunicorn-pid", type=int, help="Report memory of this gunicorn master's workers")
+    args = parser.parse_args()
+
+    if args.gunicorn_pid:
+        report_workers(args.gunicorn_pid)
+        return
+
+    print(f"{'scenario':<10}{'import s':>10}{'/health s':>11}{'RSS MB':>10}")
+    for name in args.scenarios.split(","):
+        samples = [run_scenario(name) for _ in range(args.runs)]
+        print("{:<10}{:>10.3f}{:>11.3f}{:>10.1f}".format(
+            name,
+            statistics.median(s["import_s"] for s in samples),
+            statistics.median(s["first_health_s"] for s in samples),
+            statistics.median(s["rss_mb"] for s in samples),
+        ))
+
+if __name__ == "__main__":
+    main()
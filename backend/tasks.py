@@ -0,0 +1,84 @@
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import app
+
+# "redis" hands tasks to the separate worker process (worker.py); "local" runs
+# them on thread pools inside the web process, as before the worker existed.
+TASK_QUEUE_BACKEND = os.getenv("TASK_QUEUE_BACKEND", "local")
+TASK_QUEUE_URL = os.getenv("TASK_QUEUE_URL", app.config["CACHE_REDIS_URL"])
+QUEUE_POLL_TIMEOUT = 5
+
+# task_type -> (handler, concurrency)
+handlers = {}
+_local_executors = {}
+_local_lock = threading.Lock()
+_redis_client = None
+
+def task_handler(task_type, concurrency=1):
+    """Register a function as the handler for a task type."""
+    def decorator(f):
+        handlers[task_type] = (f, concurrency)
+        return f
+    return decorator
+
+def uses_worker():
+    """Return True if tasks are executed by the separate worker process."""
+    return TASK_QUEUE_BACKEND == "redis"
+
+def queue_key(task_type):
+    return f"tasks:{task_type}"
+
+def get_redis():
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(TASK_QUEUE_URL)
+    return _redis_client
+
+def run_task(task_type, payload):
+    """Execute one task inside an application context."""
+    handler, _ = handlers[task_type]
+    try:
+        with app.app_context():
+            handler(**payload)
+    except Exception as e:
+        logging.error("Task %s failed: %s", task_type, e)
+
+def _local_executor(task_type):
+    with _local_lock:
+        if task_type not in _local_executors:
+            _, concurrency = handlers[task_type]
+            _local_executors[task_type] = ThreadPoolExecutor(max_workers=concurrency)
+        return _local_executors[task_type]
+
+def enqueue(task_type, **payload):
+    """Submit a task; the payload must be JSON serializable."""
+    if task_type not in handlers:
+        raise ValueError(f"Unknown task type: {task_type}")
+    if uses_worker():
+        get_redis().rpush(queue_key(task_type), json.dumps(payload))
+    else:
+        _local_executor(task_type).submit(run_task, task_type, payload)
+
+def queue_depth(task_type):
+    """Return the number of queued tasks of the given type."""
+    if uses_worker():
+        return get_redis().llen(queue_key(task_type))
+    executor = _local_executors.get(task_type)
+    return executor._work_queue.qsize() if executor else 0
+
+def consume(task_type, stop=None):
+    """Worker loop pulling tasks of one type from the Redis queue until stop is set."""
+    while stop is None or not stop.is_set():
+        try:
+            item = get_redis().blpop(queue_key(task_type), timeout=QUEUE_POLL_TIMEOUT)
+        except Exception as e:
+            logging.error("Task queue %s error: %s", task_type, e)
+            time.sleep(1)
+            continue
+        if item is not None:
+            run_task(task_type, json.loads(item[1]))
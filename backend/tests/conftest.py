@@ -0,0 +1,96 @@
+import os
+import sys
+import tempfile
+
+# Run the app against a throwaway database, without Redis or background threads.
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db"))
+os.environ.setdefault("CACHE_TYPE", "SimpleCache")
+os.environ.setdefault("BACKGROUND_TASKS_POST_FORK", "1")
+os.environ.setdefault("CLIP_RECORDER_ENABLED", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+import time
+from collections import deque
+import pytest
+from sqlalchemy import event
+
+@pytest.fixture(scope="session")
+def app():
+    import main
+    return main.app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def count_statements(app):
+    """Return a function calling f() and returning (result, statements executed)."""
+    from extensions import db
+
+    def count(f):
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            result = f()
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        return result, len(statements)
+    return count
+
+class FakeRedis:
+    """The list commands of redis.Redis that the task queue uses, in memory."""
+    def __init__(self):
+        self.lists = {}
+        self.changed = threading.Condition()
+
+    def rpush(self, key, *values):
+        with self.changed:
+            items = self.lists.setdefault(key, deque())
+            items.extend(v.encode() if isinstance(v, str) else v for v in values)
+            self.changed.notify_all()
+            return len(items)
+
+    def llen(self, key):
+        with self.changed:
+            return len(self.lists.get(key, ()))
+
+    def blpop(self, key, timeout=0):
+        deadline = time.monotonic() + timeout if timeout else None
+        with self.changed:
+            while not self.lists.get(key):
+                remaining = deadline - time.monotonic() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.changed.wait(remaining)
+            return key.encode(), self.lists[key].popleft()
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Route enqueued tasks to an in-memory Redis, as with TASK_QUEUE_BACKEND=redis."""
+    import tasks
+    redis = FakeRedis()
+    monkeypatch.setattr(tasks, "TASK_QUEUE_BACKEND", "redis")
+    monkeypatch.setattr(tasks, "_redis_client", redis)
+    return redis
+
+@pytest.fixture
+def telegram(monkeypatch):
+    """Replace the Telegram bot; returns the list of (chat_id, text or photo) sent."""
+    import notifications
+    sent = []
+
+    class FakeBot:
+        def sendMessage(self, chat_id, text):
+            sent.append((chat_id, text))
+
+        def send_photo(self, chat_id, photo, caption):
+            sent.append((chat_id, photo))
+
+    monkeypatch.setattr(notifications, "get_bot", lambda token=None: FakeBot())
+    return sent
@@ -0,0 +1,99 @@
+import uuid
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+def login(client, username):
+    assert client.post("/api/login", json={"username": username, "password": username}).status_code == 200
+
+def new_stream():
+    from extensions import db
+    from models import ChaturbateStream
+    name = uuid.uuid4().hex[:12]
+    stream = ChaturbateStream(room_url=f"https://chaturbate.com/{name}", streamer_username=name, type="chaturbate")
+    db.session.add(stream)
+    db.session.commit()
+    return stream.id
+
+def new_agent():
+    from extensions import db
+    from models import User
+    name = uuid.uuid4().hex[:12]
+    agent = User(username=name, password=name, firstname=name, lastname=name,
+                 email=f"{name}@example.com", phonenumber="0", role="agent")
+    db.session.add(agent)
+    db.session.commit()
+    return agent.id
+
+def assignment_pairs():
+    from models import Assignment
+    return sorted((a.agent_id, a.stream_id) for a in Assignment.query.all())
+
+def test_agent_stream_pair_is_unique(app):
+    from extensions import db
+    from models import Assignment
+    with app.app_context():
+        stream_id, agent_id = new_stream(), new_agent()
+        db.session.add(Assignment(agent_id=agent_id, stream_id=stream_id))
+        db.session.commit()
+        db.session.add(Assignment(agent_id=agent_id, stream_id=stream_id))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+def test_duplicate_assign_returns_409(app, client):
+    with app.app_context():
+        stream_id, agent_id = new_stream(), new_agent()
+    login(client, "admin")
+    payload = {"agent_id": agent_id, "stream_id": stream_id}
+    assert client.post("/api/assign", json=payload).status_code == 201
+    assert client.post("/api/assign", json=payload).status_code == 409
+
+def test_rebalance_dry_run_then_apply(app, client):
+    import balancer
+    from extensions import db
+    from models import Stream, Assignment
+    with app.app_context():
+        agent_id = new_agent()
+        # Pile new streams on one agent so the rebalance has moves to make.
+        for _ in range(4):
+            db.session.add(Assignment(agent_id=agent_id, stream_id=new_stream()))
+        db.session.commit()
+        before = assignment_pairs()
+    login(client, "admin")
+    response = client.post("/api/assign/rebalance", json={"dry_run": True})
+    assert response.status_code == 200
+    planned = response.get_json()["moves"]
+    assert planned
+    with app.app_context():
+        assert assignment_pairs() == before
+
+    response = client.post("/api/assign/rebalance", json={})
+    assert response.status_code == 200
+    assert response.get_json()["moves"] == planned
+    with app.app_context():
+        streams = {stream.id for stream in Stream.query.all()}
+        pairs = assignment_pairs()
+        assert sorted(stream_id for _, stream_id in pairs) == sorted(streams)
+        plan, _ = balancer.plan_rebalance()
+        assert {stream_id: agent for agent, stream_id in pairs} == plan
+    assert client.post("/api/assign/rebalance", json={"dry_run": True}).get_json()["moves"] == []
+
+def test_unique_assignments_command_removes_duplicates(app):
+    import balancer
+    from extensions import db
+    with app.app_context():
+        stream_id, agent_id = new_stream(), new_agent()
+        # Recreate the index as it was before it became unique.
+        with db.engine.begin() as conn:
+            conn.execute(db.text("DROP INDEX idx_assignment_agent_stream"))
+            conn.execute(db.text("CREATE INDEX idx_assignment_agent_stream ON assignments (agent_id, stream_id)"))
+            for _ in range(3):
+                conn.execute(db.text("INSERT INTO assignments (agent_id, stream_id) VALUES (:a, :s)"),
+                             {"a": agent_id, "s": stream_id})
+        assert not balancer.assignments_are_unique()
+    result = app.test_cli_runner().invoke(args=["unique-assignments"])
+    assert result.exit_code == 0, result.output
+    assert "Removed 2 duplicate assignments" in result.output
+    with app.app_context():
+        assert balancer.assignments_are_unique()
+        assert assignment_pairs().count((agent_id, stream_id)) == 1
@@ -0,0 +1,140 @@
+import sys
+import types
+import uuid
+import threading
+import pytest
+
+class Ring:
+    def __init__(self, url):
+        self.url = url
+        self.stream = {"room_url": url, "streamer_name": "someone", "platform": "chaturbate"}
+
+class Segment:
+    def __init__(self, content):
+        self.content = content
+
+class Doc:
+    def __init__(self, text):
+        self.words = text.split()
+
+    def __getitem__(self, span):
+        return types.SimpleNamespace(text=" ".join(self.words[span]))
+
+class KeywordMatcher:
+    def __init__(self, keywords):
+        self.keywords = set(keywords)
+
+    def __call__(self, doc):
+        return [(0, i, i + 1) for i, word in enumerate(doc.words) if word in self.keywords]
+
+@pytest.fixture
+def keywords(app):
+    from extensions import db
+    from models import ChatKeyword
+    words = [uuid.uuid4().hex[:12] for _ in range(3)]
+    with app.app_context():
+        db.session.add_all([ChatKeyword(keyword=word) for word in words])
+        db.session.commit()
+    yield words
+    with app.app_context():
+        ChatKeyword.query.filter(ChatKeyword.keyword.in_(words)).delete()
+        db.session.commit()
+
+def test_refresh_publishes_only_a_complete_matcher(app, keywords, monkeypatch):
+    import detection
+    building = threading.Event()
+    release = threading.Event()
+
+    class SlowMatcher:
+        def __init__(self, vocab):
+            self.words = []
+
+        def add(self, word, patterns):
+            self.words.append(word)
+            building.set()
+            release.wait(10)
+
+    spacy = types.ModuleType("spacy")
+    spacy.matcher = types.SimpleNamespace(Matcher=SlowMatcher)
+    monkeypatch.setitem(sys.modules, "spacy", spacy)
+    monkeypatch.setitem(sys.modules, "spacy.matcher", spacy.matcher)
+    monkeypatch.setattr(detection, "get_nlp", lambda: types.SimpleNamespace(vocab=None))
+    old = KeywordMatcher([])
+    monkeypatch.setattr(detection, "matcher", old)
+
+    refresh = threading.Thread(target=detection.refresh_keywords)
+    refresh.start()
+    assert building.wait(10)
+    # Readers keep the previous matcher while the new one is being filled.
+    assert detection.matcher is old
+    release.set()
+    refresh.join(10)
+    assert set(keywords) <= set(detection.matcher.words)
+
+def test_spot_keywords_uses_the_matcher_it_took(monkeypatch):
+    import time
+    import audio
+    import detection
+    taken = KeywordMatcher(["knife"])
+
+    def nlp(text):
+        # A refresh elsewhere swaps the matcher while the transcript is parsed.
+        detection.matcher = KeywordMatcher([])
+        return Doc(text)
+
+    monkeypatch.setattr(detection, "matcher", taken)
+    monkeypatch.setattr(detection, "get_nlp", lambda: nlp)
+    monkeypatch.setattr(audio, "_keywords_refreshed_at", time.monotonic())
+    assert audio.spot_keywords("he has a knife") == {"knife"}
+
+def test_repeated_keyword_is_logged_once_per_window(app, monkeypatch):
+    import audio
+    from models import Log
+    now = [1000.0]
+    monkeypatch.setattr(audio.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(audio, "spot_keywords", lambda text: {"knife"})
+    state = audio.StreamAudio(Ring(f"https://chaturbate.com/{uuid.uuid4().hex}"))
+    result = {"text": "a knife", "result": [{"word": "knife", "conf": 0.8}]}
+
+    def logged():
+        return Log.query.filter_by(room_url=state.ring.url, event_type="audio_detection").count()
+
+    with app.app_context():
+        audio.audio_pipeline.handle_result(state, result)
+        audio.audio_pipeline.handle_result(state, result)
+        assert logged() == 1
+        now[0] += audio.AUDIO_ALERT_WINDOW
+        audio.audio_pipeline.handle_result(state, result)
+        assert logged() == 2
+        log = Log.query.filter_by(room_url=state.ring.url).first()
+        assert log.details["keyword"] == "knife" and log.details["confidence"] == 0.8
+
+def test_slow_stream_keeps_only_the_newest_segments(monkeypatch):
+    import audio
+    pipeline = audio.AudioPipeline(workers=1)
+    started = threading.Event()
+    release = threading.Event()
+    processed = []
+    done = threading.Semaphore(0)
+
+    def process(state, segment, init=None):
+        started.set()
+        release.wait(10)
+        processed.append(segment.content)
+        done.release()
+
+    monkeypatch.setattr(pipeline, "process", process)
+    ring = Ring(f"https://chaturbate.com/{uuid.uuid4().hex}")
+    try:
+        pipeline.offer(ring, Segment(0))
+        assert started.wait(10)
+        for i in range(1, 5):
+            pipeline.offer(ring, Segment(i))
+        assert len(pipeline.streams[ring.url].pending) == audio.AUDIO_QUEUE_SEGMENTS
+    finally:
+        release.set()
+    for _ in range(1 + audio.AUDIO_QUEUE_SEGMENTS):
+        assert done.acquire(timeout=10)
+    pipeline.executor.shutdown(wait=True)
+    assert processed == [0, 3, 4]
+    assert not pipeline.streams[ring.url].busy
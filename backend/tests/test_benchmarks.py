@@ -0,0 +1,264 @@
+"""
+Benchmarks of the backend hot paths against the test app (SQLite, in-memory
+Redis for the task queue, fake Telegram bot).
+
+Each benchmark reports p50/p99 latency and throughput and fails when it
+regressed against fixtures/benchmarks.json by more than BENCHMARK_TOLERANCE.
+Timings below BENCHMARK_FLOOR_MS per request count as that floor, because
+thread scheduling in one shared process dominates them. The defaults
+(tolerance 2.0, i.e. three times slower, and a 50 ms floor) keep the normal
+test run stable and only catch gross regressions such as a query per row.
+On a quiet, dedicated machine use e.g. BENCHMARK_TOLERANCE=0.2
+BENCHMARK_FLOOR_MS=0 against a baseline recorded there with
+
+    BENCHMARK_SAVE=tests/fixtures/benchmarks.json python -m pytest tests/test_benchmarks.py
+
+BENCHMARK_REQUESTS sets the number of calls per benchmark. detect_chat and
+OCR are skipped unless spaCy and Tesseract are installed. Scrape resolution
+is not covered: it needs a real headless Chrome.
+"""
+import os
+import io
+import json
+import time
+import uuid
+import socket
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+REQUESTS = int(os.getenv("BENCHMARK_REQUESTS", 200))
+CONCURRENCY = 4
+SSE_CLIENTS = 50
+TOLERANCE = float(os.getenv("BENCHMARK_TOLERANCE", 2.0))
+FLOOR_MS = float(os.getenv("BENCHMARK_FLOOR_MS", 50))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "benchmarks.json")
+
+results = {}
+
+@pytest.fixture(scope="module", autouse=True)
+def save_results():
+    yield
+    path = os.getenv("BENCHMARK_SAVE")
+    if path and results:
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+@pytest.fixture
+def open_admission(monkeypatch):
+    """Lift the ingest limits: one session sends every request here."""
+    import ratelimit
+    for kind in ratelimit.RATE_LIMITS:
+        monkeypatch.setitem(ratelimit.RATE_LIMITS, kind, (1e6, 10**6))
+    monkeypatch.setattr(ratelimit, "INGEST_QUEUE_LIMIT", REQUESTS + 1)
+    ratelimit.admission.local.buckets.clear()
+    ratelimit.admission.queue_checked_at = 0
+    yield
+    ratelimit.admission.local.buckets.clear()
+    ratelimit.admission.queue_checked_at = 0
+
+@pytest.fixture
+def recipient(app):
+    from extensions import db
+    from models import TelegramRecipient
+    with app.app_context():
+        row = TelegramRecipient(telegram_username=uuid.uuid4().hex[:20], chat_id="42")
+        db.session.add(row)
+        db.session.commit()
+        row_id = row.id
+    yield "42"
+    with app.app_context():
+        TelegramRecipient.query.filter_by(id=row_id).delete()
+        db.session.commit()
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of a list of latencies."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+def summarize(latencies, duration):
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "throughput_rps": round(len(latencies) / duration, 2),
+    }
+
+def measure(call, total=REQUESTS, concurrency=CONCURRENCY):
+    """Run call(i) total times on concurrency threads; return (summary, return values)."""
+    latencies = []
+    returned = []
+    lock = threading.Lock()
+
+    def one(i):
+        start = time.perf_counter()
+        value = call(i)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            returned.append(value)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    return summarize(latencies, time.perf_counter() - started), returned
+
+def check(name, summary):
+    """Record a benchmark and fail on a regression against the stored baseline."""
+    results[name] = summary
+    print(f"\n{name}: " + ", ".join(f"{key} {value}" for key, value in sorted(summary.items())))
+    if os.getenv("BENCHMARK_SAVE") or not os.path.exists(BASELINE):
+        return
+    with open(BASELINE) as f:
+        before = json.load(f).get(name)
+    if not before:
+        return
+    assert summary["p99_ms"] <= max(before["p99_ms"], FLOOR_MS) * (1 + TOLERANCE), f"{name} p99 regressed"
+    if "throughput_rps" in before:
+        expected = before["throughput_rps"]
+        if FLOOR_MS:
+            expected = min(expected, CONCURRENCY * 1000 / FLOOR_MS)
+        assert summary["throughput_rps"] >= expected / (1 + TOLERANCE), f"{name} throughput regressed"
+
+def logged_in_clients(app, count):
+    clients = []
+    for _ in range(count):
+        client = app.test_client()
+        assert client.post("/api/login", json={"username": "agent", "password": "agent"}).status_code == 200
+        clients.append(client)
+    return clients
+
+def test_detect_objects_ingest_and_notify(app, fake_redis, telegram, recipient, open_admission):
+    import tasks
+    clients = logged_in_clients(app, CONCURRENCY)
+    run = uuid.uuid4().hex
+
+    def detect(i):
+        return clients[i % CONCURRENCY].post("/api/detect-objects", json={
+            "stream_url": f"https://chaturbate.com/bench-{run}-{i % 50}",
+            "detections": [{"class": "person", "confidence": 0.91, "bbox": [10, 10, 120, 240]}],
+            "detected_object": f"person-{i}",
+        }).status_code
+
+    summary, statuses = measure(detect)
+    assert statuses == [201] * REQUESTS
+    check("detect_objects", summary)
+
+    # The worker side: every detection queued one Telegram message.
+    key = tasks.queue_key("notify")
+    assert fake_redis.llen(key) == REQUESTS
+    summary, _ = measure(lambda i: tasks.run_task("notify", json.loads(fake_redis.blpop(key, 5)[1])))
+    assert len(telegram) == REQUESTS and {chat_id for chat_id, _ in telegram} == {recipient}
+    check("notify_drain", summary)
+
+def test_unread_notifications_read(app):
+    clients = logged_in_clients(app, CONCURRENCY)
+    summary, statuses = measure(
+        lambda i: clients[i % CONCURRENCY].get("/api/notifications?filter=unread").status_code)
+    assert statuses == [200] * REQUESTS
+    check("notifications", summary)
+
+@pytest.fixture
+def server(app):
+    from werkzeug.serving import make_server
+    httpd = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_port
+    httpd.shutdown()
+
+def test_sse_fanout(app, server, monkeypatch):
+    import events
+    import routes
+    from extensions import db
+    from models import Log
+    broadcaster = events.NotificationBroadcaster()
+    monkeypatch.setattr(routes, "broadcaster", broadcaster)
+    monkeypatch.setattr(events, "SSE_POLL_INTERVAL", 0.1)
+    marker = f"https://chaturbate.com/{uuid.uuid4().hex}".encode()
+    arrivals = []
+    lock = threading.Lock()
+    sockets = []
+    # Fan-out latency counts from the poll that read the log, not from the
+    # commit, which adds up to SSE_POLL_INTERVAL of waiting for the next tick.
+    polls = []
+    poll = broadcaster._poll
+    broadcaster._poll = lambda: polls.append(time.perf_counter()) or poll()
+
+    def read(sock):
+        buffer = b""
+        try:
+            while marker not in buffer:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    return
+                buffer = buffer[-len(marker):] + chunk
+            with lock:
+                arrivals.append(time.perf_counter())
+        except OSError:
+            pass
+
+    readers = []
+    try:
+        for _ in range(SSE_CLIENTS):
+            sock = socket.create_connection(("127.0.0.1", server), timeout=15)
+            sock.sendall(b"GET /api/notification-events HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            sockets.append(sock)
+            reader = threading.Thread(target=read, args=(sock,), daemon=True)
+            reader.start()
+            readers.append(reader)
+        for _ in range(200):
+            if len(broadcaster.subscribers) == SSE_CLIENTS:
+                break
+            threading.Event().wait(0.05)
+        assert len(broadcaster.subscribers) == SSE_CLIENTS
+        with app.app_context():
+            db.session.add(Log(room_url=marker.decode(), event_type="object_detection",
+                               details={"detections": [{"class": "knife", "confidence": 0.9}]}))
+            db.session.commit()
+        for reader in readers:
+            reader.join(10)
+    finally:
+        # The poller thread cannot be stopped; keep it off the database.
+        broadcaster._poll = lambda: None
+        for sock in sockets:
+            sock.close()
+    assert len(arrivals) == SSE_CLIENTS
+    polled = max(t for t in polls if t <= min(arrivals))
+    summary = summarize([t - polled for t in arrivals], max(arrivals) - polled)
+    # One event to every client: only the delivery latency means something.
+    del summary["throughput_rps"]
+    check("sse_fanout", summary)
+
+def test_detect_chat_matching(app, open_admission):
+    pytest.importorskip("spacy")
+    import detection
+    try:
+        detection.get_nlp()
+    except OSError:
+        pytest.skip("spaCy model en_core_web_sm is not installed")
+    clients = logged_in_clients(app, CONCURRENCY)
+    summary, statuses = measure(lambda i: clients[i % CONCURRENCY].post(
+        "/api/detect", json={"text": f"benchmark message {i}"}).status_code)
+    assert statuses == [200] * REQUESTS
+    check("detect_chat", summary)
+
+def test_ocr_throughput(app, tmp_path):
+    pytest.importorskip("pytesseract")
+    if shutil.which("tesseract") is None:
+        pytest.skip("tesseract is not installed")
+    from PIL import Image, ImageDraw
+    import detection
+    image = Image.new("RGB", (480, 120), "white")
+    ImageDraw.Draw(image).text((10, 40), "user123: this is a benchmark chat line", fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+
+    def ocr(i):
+        path = tmp_path / f"chat_{i}.png"
+        path.write_bytes(buffer.getvalue())
+        with app.app_context():
+            return detection.process_chat_image(str(path))
+
+    summary, _ = measure(ocr, total=max(1, REQUESTS // 10))
+    check("ocr", summary)
@@ -0,0 +1,146 @@
+import io
+import json
+import uuid
+import threading
+import pytest
+
+def login(client, username):
+    assert client.post("/api/login", json={"username": username, "password": username}).status_code == 200
+
+def jpeg(size=(1280, 720)):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+def frame_count(app):
+    from extensions import db
+    from models import AnnotatedFrame, AnnotatedFrameChunk
+    with app.app_context():
+        return db.session.query(AnnotatedFrame).count(), db.session.query(AnnotatedFrameChunk).count()
+
+@pytest.fixture
+def recipient(app):
+    from extensions import db
+    from models import TelegramRecipient
+    with app.app_context():
+        row = TelegramRecipient(telegram_username=uuid.uuid4().hex[:20], chat_id="42")
+        db.session.add(row)
+        db.session.commit()
+        row_id = row.id
+    yield "42"
+    with app.app_context():
+        TelegramRecipient.query.filter_by(id=row_id).delete()
+        db.session.commit()
+
+def test_stream_is_stored_and_served_in_chunks(app, client, monkeypatch):
+    import blobs
+    monkeypatch.setattr(blobs, "BLOB_CHUNK_SIZE", 1000)
+    data = jpeg()
+    reads = []
+
+    class Upload(io.BytesIO):
+        def read(self, size=-1):
+            reads.append(size)
+            return super().read(size)
+
+    with app.app_context():
+        frames, chunks = frame_count(app)
+        url = blobs.save_stream(Upload(data), "image/jpeg")
+        assert set(reads) == {1000}
+        assert frame_count(app) == (frames + 1, chunks + -(-len(data) // 1000))
+        assert blobs.load(url) == ("image/jpeg", data)
+
+    assert client.get(url).status_code == 401
+    login(client, "agent")
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.mimetype == "image/jpeg"
+    assert response.headers["Content-Length"] == str(len(data))
+    assert response.data == data
+
+    with app.app_context():
+        blobs.discard(url)
+        assert blobs.load(url) is None
+        assert frame_count(app) == (frames, chunks)
+
+def test_oversized_stream_is_rejected_without_leftovers(app, monkeypatch):
+    import blobs
+    monkeypatch.setattr(blobs, "BLOB_CHUNK_SIZE", 100)
+    monkeypatch.setattr(blobs, "BLOB_MAX_BYTES", 250)
+    stream = io.BytesIO(b"x" * 10000)
+    with app.app_context():
+        before = frame_count(app)
+        with pytest.raises(ValueError):
+            blobs.save_stream(stream, "image/jpeg")
+        assert frame_count(app) == before
+    # Reading stopped at the first chunk over the limit.
+    assert stream.tell() == 300
+
+def test_thumbnail_is_built_by_the_task_not_the_request(app, client, recipient, monkeypatch):
+    import blobs
+    import notifications
+    sent = threading.Event()
+    photos = []
+    thumbnail_threads = []
+    make_thumbnail = blobs.make_thumbnail
+
+    def recording_make_thumbnail(image_ref):
+        thumbnail_threads.append(threading.current_thread())
+        return make_thumbnail(image_ref)
+
+    class FakeBot:
+        def send_photo(self, chat_id, photo, caption):
+            photos.append((chat_id, photo))
+            sent.set()
+
+    monkeypatch.setattr(blobs, "make_thumbnail", recording_make_thumbnail)
+    monkeypatch.setattr(notifications, "get_bot", lambda token=None: FakeBot())
+    login(client, "agent")
+    metadata = {"stream_url": f"https://chaturbate.com/{uuid.uuid4().hex}",
+                "detections": [{"class": "knife", "confidence": 0.9}]}
+    response = client.post("/api/detect-objects", data={
+        "metadata": json.dumps(metadata),
+        "annotated_image": (io.BytesIO(jpeg()), "frame.jpg", "image/jpeg"),
+    })
+    assert response.status_code == 201
+    assert sent.wait(10)
+    assert thumbnail_threads and threading.current_thread() not in thumbnail_threads
+    chat_id, photo = photos[0]
+    assert chat_id == recipient
+    assert photo[:4] == b"RIFF" and photo[8:12] == b"WEBP"
+    assert len(photo) <= blobs.THUMBNAIL_MAX_BYTES
+
+def test_no_thumbnail_without_recipients(app, client, monkeypatch):
+    import notifications
+    from models import TelegramRecipient
+    with app.app_context():
+        assert TelegramRecipient.query.count() == 0
+    queued = []
+    monkeypatch.setattr(notifications, "enqueue", lambda task_type, **payload: queued.append(task_type))
+    login(client, "agent")
+    metadata = {"stream_url": f"https://chaturbate.com/{uuid.uuid4().hex}",
+                "detections": [{"class": "knife", "confidence": 0.9}]}
+    response = client.post("/api/detect-objects", data={
+        "metadata": json.dumps(metadata),
+        "annotated_image": (io.BytesIO(jpeg()), "frame.jpg", "image/jpeg"),
+    })
+    assert response.status_code == 201
+    assert queued == []
+
+@pytest.mark.parametrize("path,metadata", [
+    # Missing "platform": the event is rejected after most fields were read.
+    ("/api/detection-events", {"type": "visual", "stream_url": "https://chaturbate.com/x",
+                               "timestamp": "2026-01-01T00:00:00", "detections": [],
+                               "confidence": 0.9, "streamer_name": "x"}),
+    ("/api/detect-objects", {"stream_url": "https://chaturbate.com/x"}),
+])
+def test_rejected_upload_leaves_no_blob(app, client, path, metadata):
+    login(client, "agent")
+    before = frame_count(app)
+    response = client.post(path, data={
+        "metadata": json.dumps(metadata),
+        "annotated_image": (io.BytesIO(jpeg((64, 64))), "frame.jpg", "image/jpeg"),
+    })
+    assert response.status_code in (400, 500)
+    assert frame_count(app) == before
@@ -0,0 +1,86 @@
+import time
+import uuid
+import pytest
+
+def login(client, username):
+    assert client.post("/api/login", json={"username": username, "password": username}).status_code == 200
+
+def add_logs(count, room_url=None, event_type="object_detection"):
+    from extensions import db
+    from models import Log
+    room_url = room_url or f"https://chaturbate.com/{uuid.uuid4().hex}"
+    logs = [Log(room_url=room_url, event_type=event_type, details={"detections": []}) for _ in range(count)]
+    db.session.add_all(logs)
+    db.session.commit()
+    return room_url, [log.id for log in logs]
+
+def assign_stream(room_url, username="agent"):
+    from extensions import db
+    from models import User, ChaturbateStream, Assignment
+    name = room_url.rsplit("/", 1)[-1][:12]
+    stream = ChaturbateStream(room_url=room_url, streamer_username=name, type="chaturbate")
+    db.session.add(stream)
+    db.session.flush()
+    db.session.add(Assignment(agent_id=User.query.filter_by(username=username).one().id, stream_id=stream.id))
+    db.session.commit()
+
+def test_job_works_through_chunks(app, monkeypatch):
+    import bulk
+    import readstate
+    monkeypatch.setattr(bulk, "BULK_CHUNK_SIZE", 2)
+    monkeypatch.setattr(bulk, "BULK_CHUNK_PAUSE", 0)
+    chunks = []
+    run_chunk = bulk.run_chunk
+    monkeypatch.setattr(bulk, "run_chunk", lambda *args: chunks.append(run_chunk(*args)) or chunks[-1])
+    with app.app_context():
+        room_url, ids = add_logs(5)
+        filters = bulk.resolve_filters({"room_urls": [room_url]}, 1, "admin")
+        bulk.run_bulk_job("job-chunks", "read", filters)
+        job = bulk.get_bulk_job("job-chunks")
+        assert (job["status"], job["total"], job["processed"]) == ("completed", 5, 5)
+        assert [count for count, _ in chunks] == [2, 2, 1, 0]
+        assert [last_id for _, last_id in chunks[:3]] == [ids[1], ids[3], ids[4]]
+        assert readstate.read_ids(1, ids) == set(ids)
+
+def test_agent_scope_covers_assigned_streams_and_chat(app):
+    import bulk
+    from models import User
+    with app.app_context():
+        agent_id = User.query.filter_by(username="agent").one().id
+        assigned, assigned_ids = add_logs(2)
+        assign_stream(assigned)
+        _, other_ids = add_logs(2)
+        _, chat_ids = add_logs(1, room_url=bulk.CHAT_ROOM_URL, event_type="chat_detection")
+        filters = bulk.resolve_filters({"ids": assigned_ids + other_ids + chat_ids}, agent_id, "agent")
+        matched = {log.id for log in bulk.filtered_query(filters)}
+        assert matched == set(assigned_ids + chat_ids)
+        # Admins are only scoped when they name an agent, and then without chat.
+        filters = bulk.resolve_filters({"ids": assigned_ids + chat_ids, "agent_id": agent_id}, 1, "admin")
+        assert {log.id for log in bulk.filtered_query(filters)} == set(assigned_ids)
+        # Hiding is not scoped at all.
+        filters = bulk.resolve_filters({"ids": other_ids}, agent_id, "agent", scoped=False)
+        assert {log.id for log in bulk.filtered_query(filters)} == set(other_ids)
+
+def test_large_bulk_request_returns_a_job_to_poll(app, client):
+    import readstate
+    from models import User
+    with app.app_context():
+        room_url, ids = add_logs(3)
+        admin_id = User.query.filter_by(username="admin").one().id
+    login(client, "admin")
+    response = client.post("/api/notifications/bulk", json={"action": "read", "filter": {"room_urls": [room_url]}})
+    assert response.status_code == 202
+    job = response.get_json()
+    # The job counts the matching logs itself, off the request.
+    assert (job["status"], job["total"]) == ("queued", None)
+    for _ in range(100):
+        job = client.get(f"/api/notifications/bulk/{job['job_id']}").get_json()
+        if job["status"] == "completed":
+            break
+        time.sleep(0.05)
+    assert (job["status"], job["total"], job["processed"]) == ("completed", 3, 3)
+    with app.app_context():
+        assert readstate.read_ids(admin_id, ids) == set(ids)
+    # Other users cannot poll the job.
+    login(client, "agent")
+    assert client.get(f"/api/notifications/bulk/{job['job_id']}").status_code == 404
@@ -0,0 +1,91 @@
+import uuid
+import pytest
+
+def login(client, username):
+    assert client.post("/api/login", json={"username": username, "password": username}).status_code == 200
+
+@pytest.fixture
+def counted_view(app):
+    """A view cached under the tags "things" and "other", counting how often it really runs."""
+    from flask import jsonify
+    from caching import cached_response, invalidate_tags
+    # Start from a generation no other test has cached.
+    invalidate_tags("things")
+    calls = []
+
+    @cached_response("things", "other")
+    def view():
+        calls.append(1)
+        return jsonify({"calls": len(calls)})
+
+    def get(path="/things", etag=None):
+        headers = {"If-None-Match": f'"{etag}"'} if etag else {}
+        with app.test_request_context(path, headers=headers):
+            return view()
+    return get, calls
+
+def test_only_the_dependent_tags_invalidate(counted_view):
+    from caching import invalidate_tags
+    get, calls = counted_view
+    assert get().get_json() == {"calls": 1}
+    assert get().get_json() == {"calls": 1}
+    invalidate_tags("unrelated")
+    assert get().get_json() == {"calls": 1}
+    invalidate_tags("other")
+    assert get().get_json() == {"calls": 2}
+    # The query string is part of the key.
+    assert get("/things?page=2").get_json() == {"calls": 3}
+    assert len(calls) == 3
+
+def test_etag_answers_conditional_gets_with_304(counted_view):
+    from caching import invalidate_tags
+    get, calls = counted_view
+    first = get()
+    etag, _ = first.get_etag()
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    revalidated = get(etag=etag)
+    assert revalidated.status_code == 304
+    assert revalidated.get_data() == b""
+    assert revalidated.get_etag() == (etag, False)
+    invalidate_tags("things")
+    changed = get(etag=etag)
+    assert changed.status_code == 200
+    assert changed.get_etag()[0] != etag
+    assert len(calls) == 2
+
+def test_errors_are_not_cached(app):
+    from flask import jsonify
+    from caching import cached_response
+    calls = []
+
+    @cached_response("things")
+    def failing():
+        calls.append(1)
+        return jsonify({"message": "nope"}), 404
+
+    for _ in range(2):
+        with app.test_request_context("/failing"):
+            assert failing().status_code == 404
+    assert len(calls) == 2
+
+def test_object_list_revalidates_until_an_object_is_added(app, client, count_statements):
+    login(client, "admin")
+    first = client.get("/api/objects")
+    assert first.status_code == 200
+    etag, _ = first.get_etag()
+    # A cached, unchanged list costs no query at all (the role is cached too).
+    response, statements = count_statements(
+        lambda: client.get("/api/objects", headers={"If-None-Match": f'"{etag}"'}))
+    assert response.status_code == 304
+    assert statements == 0
+
+    name = uuid.uuid4().hex[:12]
+    assert client.post("/api/objects", json={"object_name": name}).status_code == 201
+    response = client.get("/api/objects", headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 200
+    assert name in response.get_data(as_text=True)
+
+    # Authorization runs before the cache: an agent never gets the admin's copy.
+    agent = app.test_client()
+    login(agent, "agent")
+    assert agent.get("/api/objects").status_code == 403
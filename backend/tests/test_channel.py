@@ -0,0 +1,101 @@
+import json
+import uuid
+import threading
+import http.client
+import pytest
+
+@pytest.fixture
+def server(app):
+    from werkzeug.serving import make_server
+    httpd = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_port
+    httpd.shutdown()
+
+@pytest.fixture
+def broadcaster(app, monkeypatch):
+    import events
+    import channel
+    from extensions import db
+    from models import Log
+    broadcaster = events.NotificationBroadcaster()
+    monkeypatch.setattr(channel, "broadcaster", broadcaster)
+    monkeypatch.setattr(events, "SSE_POLL_INTERVAL", 0.1)
+    with app.app_context():
+        broadcaster.last_id = db.session.query(db.func.max(Log.id)).scalar() or 0
+    yield broadcaster
+    # The poller thread cannot be stopped; keep it off the database.
+    broadcaster._poll = lambda: None
+
+def session_cookie(port, username):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request("POST", "/api/login", json.dumps({"username": username, "password": username}),
+                 {"Content-Type": "application/json"})
+    response = conn.getresponse()
+    assert response.status == 200
+    cookie = response.getheader("Set-Cookie").split(";", 1)[0]
+    conn.close()
+    return cookie
+
+def connect(port, cookie=None):
+    from simple_websocket import Client
+    headers = {"Cookie": cookie} if cookie else None
+    return Client.connect(f"ws://127.0.0.1:{port}/api/ws", headers=headers)
+
+def receive(ws, op, timeout=10):
+    while True:
+        message = ws.receive(timeout=timeout)
+        assert message is not None, f"no {op} message"
+        message = json.loads(message)
+        if message["op"] == op:
+            return message
+
+def test_websocket_requires_a_session(server):
+    from simple_websocket import ConnectionClosed
+    ws = connect(server)
+    with pytest.raises(ConnectionClosed):
+        ws.receive(timeout=5)
+        ws.receive(timeout=5)
+
+def test_websocket_answers_and_pushes_without_polling(app, server, broadcaster):
+    from extensions import db
+    from models import Log
+    ws = connect(server, session_cookie(server, "agent"))
+    try:
+        for _ in range(100):
+            if broadcaster.subscribers:
+                break
+            threading.Event().wait(0.05)
+        assert len(broadcaster.subscribers) == 1
+
+        ws.send(json.dumps({"op": "ping", "ref": 1}))
+        result = receive(ws, "result")
+        assert result["ref"] == 1 and result["status"] == 200
+
+        stream_url = f"https://chaturbate.com/{uuid.uuid4().hex}"
+        ws.send(json.dumps({"op": "detection", "ref": 2, "data": {
+            "stream_url": stream_url,
+            "detections": [{"class": "knife", "confidence": 0.9}],
+            "detected_object": uuid.uuid4().hex,
+        }}))
+        result = receive(ws, "result")
+        assert result["ref"] == 2 and result["status"] == 201
+
+        # The detection itself reaches the client through the broadcaster.
+        event = receive(ws, "event")
+        assert (event["data"]["stream"], event["data"]["object"]) == (stream_url, "knife")
+
+        marker = f"https://chaturbate.com/{uuid.uuid4().hex}"
+        with app.app_context():
+            db.session.add(Log(room_url=marker, event_type="object_detection",
+                               details={"detections": [{"class": "gun", "confidence": 0.8}]}))
+            db.session.commit()
+        assert receive(ws, "event")["data"]["stream"] == marker
+    finally:
+        ws.close()
+    for _ in range(100):
+        if not broadcaster.subscribers:
+            break
+        threading.Event().wait(0.05)
+    assert not broadcaster.subscribers
@@ -0,0 +1,129 @@
+import os
+import time
+from datetime import datetime, timedelta
+import pytest
+
+def write(folder, name, size=100):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+def listing(index):
+    return [os.path.basename(path) for _, path, _ in index.entries]
+
+def test_folder_index_evicts_oldest_over_budget_then_by_age(tmp_path):
+    from cleanup import FolderIndex
+    for i in range(5):
+        write(tmp_path, f"{i}.jpg")
+    index = FolderIndex(str(tmp_path), max_age=3600, max_bytes=250)
+    assert index.evict() == (3, 300)
+    assert sorted(os.listdir(tmp_path)) == ["3.jpg", "4.jpg"]
+    assert (listing(index), index.total_bytes) == (["3.jpg", "4.jpg"], 200)
+    assert index.evict(now=time.time() + 3601) == (2, 200)
+    assert (os.listdir(tmp_path), index.entries, index.total_bytes) == ([], [], 0)
+
+def test_folder_index_only_stats_new_files(tmp_path, monkeypatch):
+    from cleanup import FolderIndex
+    for i in range(3):
+        write(tmp_path, f"{i}.jpg")
+    index = FolderIndex(str(tmp_path))
+    index.refresh()
+    stats = []
+    scandir = os.scandir
+
+    class Entry:
+        def __init__(self, entry):
+            self.entry, self.path = entry, entry.path
+
+        def is_file(self, follow_symlinks=True):
+            return self.entry.is_file(follow_symlinks=follow_symlinks)
+
+        def stat(self, follow_symlinks=True):
+            stats.append(os.path.basename(self.path))
+            return self.entry.stat(follow_symlinks=follow_symlinks)
+
+    class Listing:
+        def __init__(self, path):
+            self.it = scandir(path)
+
+        def __enter__(self):
+            return (Entry(entry) for entry in self.it)
+
+        def __exit__(self, *args):
+            self.it.close()
+
+    monkeypatch.setattr(os, "scandir", Listing)
+    write(tmp_path, "3.jpg")
+    os.remove(tmp_path / "0.jpg")
+    index.dir_mtime = None
+    index.refresh()
+    assert stats == ["3.jpg"]
+    assert listing(index) == ["1.jpg", "2.jpg", "3.jpg"]
+    assert index.total_bytes == 300
+
+def test_folder_index_sees_files_added_while_evicting(tmp_path, monkeypatch):
+    from cleanup import FolderIndex
+    write(tmp_path, "old.jpg")
+    index = FolderIndex(str(tmp_path), max_bytes=50)
+    remove = os.remove
+
+    def remove_while_a_file_arrives(path):
+        remove(path)
+        write(tmp_path, "new.jpg", size=10)
+
+    monkeypatch.setattr(os, "remove", remove_while_a_file_arrives)
+    assert index.evict() == (1, 100)
+    monkeypatch.undo()
+    index.refresh()
+    assert listing(index) == ["new.jpg"]
+    assert index.total_bytes == 10
+
+@pytest.fixture
+def frames(app):
+    import blobs
+    from extensions import db
+    from models import AnnotatedFrame
+    with app.app_context():
+        # Start from an empty table so budgets are exact.
+        blobs.delete_frames([frame_id for (frame_id,) in db.session.query(AnnotatedFrame.id)])
+        db.session.commit()
+
+    def add(age_seconds, size):
+        with app.app_context():
+            url = blobs.save_bytes(b"x" * size, "image/jpeg")
+            frame = db.session.get(AnnotatedFrame, url.rsplit("/", 1)[-1])
+            frame.created_at = datetime.utcnow() - timedelta(seconds=age_seconds)
+            db.session.commit()
+            return frame.id
+    return add
+
+def remaining(app):
+    from extensions import db
+    from models import AnnotatedFrame, AnnotatedFrameChunk
+    with app.app_context():
+        frames = {frame_id for (frame_id,) in db.session.query(AnnotatedFrame.id)}
+        chunks = {frame_id for (frame_id,) in db.session.query(AnnotatedFrameChunk.frame_id)}
+        return frames, chunks
+
+def test_annotated_frames_evicted_by_age_then_budget(app, frames, monkeypatch):
+    import cleanup
+    monkeypatch.setitem(app.config, "ANNOTATED_FRAMES_MAX_AGE", 3600)
+    monkeypatch.setitem(app.config, "ANNOTATED_FRAMES_MAX_BYTES", 250)
+    monkeypatch.setattr(cleanup, "FRAME_CLEANUP_BATCH", 2)
+    # One frame expired, then the two oldest until 250 bytes fit.
+    for age in (7200, 300, 200):
+        frames(age, 100)
+    kept = [frames(100, 100), frames(10, 100)]
+    assert cleanup.cleanup_annotated_frames() == (3, 300)
+    assert remaining(app) == (set(kept), set(kept))
+
+def test_idle_annotated_frame_cleanup_is_one_query(app, frames, monkeypatch, count_statements):
+    import cleanup
+    monkeypatch.setitem(app.config, "ANNOTATED_FRAMES_MAX_AGE", 3600)
+    monkeypatch.setitem(app.config, "ANNOTATED_FRAMES_MAX_BYTES", 10000)
+    for _ in range(5):
+        frames(10, 100)
+    result, statements = count_statements(cleanup.cleanup_annotated_frames)
+    assert result == (0, 0)
+    assert statements == 1
@@ -0,0 +1,15 @@
+import os
+import uuid
+
+def test_clips_require_login(app, client):
+    filename = f"{uuid.uuid4().hex}.ts"
+    with open(os.path.join(app.config["CLIPS_FOLDER"], filename), "wb") as f:
+        f.write(b"\x47" * 188)
+    try:
+        assert client.get(f"/api/clips/{filename}").status_code == 401
+        client.post("/api/login", json={"username": "agent", "password": "agent"})
+        response = client.get(f"/api/clips/{filename}")
+        assert response.status_code == 200
+        assert response.data == b"\x47" * 188
+    finally:
+        os.remove(os.path.join(app.config["CLIPS_FOLDER"], filename))
@@ -0,0 +1,42 @@
+import uuid
+import pytest
+
+def login(client, username):
+    response = client.post("/api/login", json={"username": username, "password": username})
+    assert response.status_code == 200
+
+def add_streams(app, count, agent_username="agent"):
+    from extensions import db
+    from models import User, ChaturbateStream, StripchatStream, Assignment
+    with app.app_context():
+        agent = User.query.filter_by(username=agent_username).one()
+        for i in range(count):
+            name = uuid.uuid4().hex[:12]
+            if i % 2:
+                stream = StripchatStream(room_url=f"https://stripchat.com/{name}", streamer_username=name,
+                                         type="stripchat", stripchat_m3u8_url=f"https://cdn.example.com/{name}.m3u8")
+            else:
+                stream = ChaturbateStream(room_url=f"https://chaturbate.com/{name}", streamer_username=name,
+                                          type="chaturbate", chaturbate_m3u8_url=f"https://cdn.example.com/{name}.m3u8")
+            db.session.add(stream)
+            db.session.flush()
+            db.session.add(Assignment(agent_id=agent.id, stream_id=stream.id))
+        db.session.commit()
+
+@pytest.mark.parametrize("path,username,key", [
+    ("/api/dashboard", "admin", "streams"),
+    ("/api/agent/dashboard", "agent", "assignments"),
+])
+def test_dashboard_statement_count_does_not_grow_with_streams(app, client, count_statements, path, username, key):
+    login(client, username)
+    existing = len(client.get(f"{path}?start").get_json()[key])
+    counts = []
+    for added in (3, 27):
+        add_streams(app, added)
+        existing += added
+        # A distinct query string bypasses the cached response.
+        response, statements = count_statements(lambda: client.get(f"{path}?n={existing}"))
+        assert response.status_code == 200
+        assert len(response.get_json()[key]) == existing
+        counts.append(statements)
+    assert counts[0] == counts[1]
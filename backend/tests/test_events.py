@@ -0,0 +1,104 @@
+import socket
+import threading
+import uuid
+import pytest
+
+SUBSCRIBERS = 200
+
+@pytest.fixture
+def server(app):
+    from werkzeug.serving import make_server
+    httpd = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_port
+    httpd.shutdown()
+
+def test_sse_fanout_reads_each_log_once(app, count_statements):
+    from extensions import db
+    from models import Log
+    from events import NotificationBroadcaster
+    broadcaster = NotificationBroadcaster()
+    # Drive the poller by hand instead of from its thread.
+    broadcaster._started = True
+    subscribers = [broadcaster.subscribe() for _ in range(50)]
+    with app.app_context():
+        broadcaster.last_id = db.session.query(db.func.max(Log.id)).scalar() or 0
+        db.session.add(Log(room_url="https://chaturbate.com/sse", event_type="object_detection",
+                           details={"detections": [{"class": "knife", "confidence": 0.9}]}))
+        db.session.commit()
+    _, statements = count_statements(broadcaster._poll)
+    assert statements == 1
+    for subscriber in subscribers:
+        payload = subscriber.get_nowait()
+        assert (payload["stream"], payload["object"]) == ("https://chaturbate.com/sse", "knife")
+        assert subscriber.empty()
+
+def test_sse_clients_over_a_real_server_share_one_poll_per_tick(app, server, monkeypatch):
+    import events
+    import routes
+    from sqlalchemy import event
+    from extensions import db
+    from models import Log
+    broadcaster = events.NotificationBroadcaster()
+    monkeypatch.setattr(routes, "broadcaster", broadcaster)
+    monkeypatch.setattr(events, "SSE_POLL_INTERVAL", 0.2)
+    polls = []
+    poll = broadcaster._poll
+    broadcaster._poll = lambda: polls.append(1) or poll()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        # The poller filters on logs.id; the per-client replay on timestamp.
+        if statement.startswith("SELECT") and "logs.id >" in statement:
+            statements.append(statement)
+
+    marker = f"https://chaturbate.com/{uuid.uuid4().hex}".encode()
+    received = [threading.Event() for _ in range(SUBSCRIBERS)]
+    sockets = []
+
+    def read(sock, done):
+        buffer = b""
+        try:
+            while marker not in buffer:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    return
+                buffer = buffer[-len(marker):] + chunk
+            done.set()
+        except OSError:
+            pass
+
+    with app.app_context():
+        engine = db.engine
+    try:
+        for done in received:
+            sock = socket.create_connection(("127.0.0.1", server), timeout=15)
+            sock.sendall(b"GET /api/notification-events HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            sockets.append(sock)
+            threading.Thread(target=read, args=(sock, done), daemon=True).start()
+        for _ in range(200):
+            if len(broadcaster.subscribers) == SUBSCRIBERS:
+                break
+            threading.Event().wait(0.05)
+        assert len(broadcaster.subscribers) == SUBSCRIBERS
+
+        event.listen(engine, "before_cursor_execute", record)
+        polls.clear()
+        with app.app_context():
+            db.session.add(Log(room_url=marker.decode(), event_type="object_detection",
+                               details={"detections": [{"class": "knife", "confidence": 0.9}]}))
+            db.session.commit()
+        for done in received:
+            assert done.wait(10)
+    finally:
+        if event.contains(engine, "before_cursor_execute", record):
+            event.remove(engine, "before_cursor_execute", record)
+        # The poller thread cannot be stopped; keep it off the database.
+        broadcaster._poll = lambda: None
+        for sock in sockets:
+            sock.close()
+
+    # Every client got the event, yet the database saw one query per poll.
+    assert 0 < len(polls) < SUBSCRIBERS / 10
+    assert len(statements) <= len(polls)
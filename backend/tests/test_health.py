@@ -0,0 +1,38 @@
+import threading
+import pytest
+
+@pytest.fixture
+def fresh_health():
+    import health
+    health._results.clear()
+    yield health
+    health._results.clear()
+
+def test_readiness_fails_while_notify_queue_is_saturated(client, fresh_health, monkeypatch):
+    import tasks
+    release = threading.Event()
+    done = threading.Semaphore(0)
+    _, concurrency = tasks.handlers["notify"]
+
+    def blocked_send(**payload):
+        release.wait(10)
+        done.release()
+
+    monkeypatch.setitem(tasks.handlers, "notify", (blocked_send, concurrency))
+    monkeypatch.setattr(fresh_health, "MAX_QUEUED_NOTIFICATIONS", 3)
+    total = concurrency + 3
+    try:
+        assert client.get("/health/ready").status_code == 200
+        fresh_health._results.clear()
+        # The first sends occupy every notify thread; the rest wait in the queue.
+        for i in range(total):
+            tasks.enqueue("notify", message=f"backlog {i}", chat_id="1")
+        assert tasks.queue_depth("notify") >= 3
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.get_json()["checks"]["notification_queue"].startswith("saturated")
+    finally:
+        release.set()
+        # Drain the queue before the real handler is restored.
+        for _ in range(total):
+            assert done.acquire(timeout=10)
@@ -0,0 +1,147 @@
+import os
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+import pytest
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+MASTER_URL = "https://edge1.example-cdn.com/live/room/master.m3u8"
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return f.read()
+
+def test_hls_master_fixture(app):
+    import m3u8
+    import hls
+    playlist = hls.Playlist(MASTER_URL, read_fixture("master.m3u8"), m3u8.loads(read_fixture("master.m3u8"), uri=MASTER_URL))
+    variants = playlist.variants()
+    assert [v["height"] for v in variants] == [1080, 720, 360]
+    assert variants[1]["uri"] == "https://edge1.example-cdn.com/live/room/720p/playlist.m3u8"
+    assert hls.select_variant(variants)["height"] == 1080
+    assert hls.select_variant(variants, max_height=720)["height"] == 720
+    assert hls.select_variant(variants, max_bandwidth=100)["height"] == 360
+    assert playlist.ttl() == hls.MASTER_PLAYLIST_TTL
+
+    rewritten = hls.rewrite_playlist(playlist, relay=True)
+    for variant in variants:
+        assert hls.proxy_url(variant["uri"], relay=True) in rewritten
+
+    # Hosts referenced by a fetched playlist may be fetched; internal ones never.
+    hls._remember_hosts(playlist.uris())
+    hls.check_url("https://edge2.example-cdn.com/live/room/360p/playlist.m3u8")
+    for url in ("http://169.254.169.254/latest/meta-data/", "http://redis:6379/", "https://unknown.example.org/a.ts"):
+        with pytest.raises(hls.UpstreamError):
+            hls.check_url(url)
+
+def test_hls_media_fixture_relays_segments():
+    import m3u8
+    import hls
+    url = "https://edge1.example-cdn.com/live/room/720p/playlist.m3u8"
+    playlist = hls.Playlist(url, read_fixture("media.m3u8"), m3u8.loads(read_fixture("media.m3u8"), uri=url))
+    assert playlist.ttl() == 2
+    rewritten = hls.rewrite_playlist(playlist, relay=True)
+    base = "https://edge1.example-cdn.com/live/room/720p/"
+    assert f'URI="{hls.relay_url(base + "init.mp4", url)}"' in rewritten
+    for sequence in (1042, 1043, 1044):
+        assert hls.relay_url(f"{base}seg{sequence}.m4s", url) in rewritten.splitlines()
+    assert hls.rewrite_playlist(playlist).splitlines()[-1] == f"{base}seg1044.m4s"
+
+CLIENTS = 20
+
+@pytest.fixture
+def upstream():
+    """Serve the media playlist fixture and its segments from loopback, counting requests per path."""
+    hits = {}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with lock:
+                hits[self.path] = hits.get(self.path, 0) + 1
+            # Hold the response so concurrent clients overlap.
+            threading.Event().wait(0.2)
+            if self.path.endswith(".m3u8"):
+                body, content_type = read_fixture("media.m3u8").encode(), "application/vnd.apple.mpegurl"
+            else:
+                body, content_type = b"segment " + self.path.encode(), "video/mp4"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}", hits
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_relay_fetches_each_upstream_file_once_for_concurrent_clients(app, upstream, monkeypatch):
+    import hls
+    base, hits = upstream
+    # The proxy refuses loopback hosts; allow this one for the test only.
+    monkeypatch.setattr(hls, "is_internal_host", lambda host: False)
+    monkeypatch.setattr(hls, "stored_stream_hosts", lambda: frozenset({"127.0.0.1"}))
+    monkeypatch.setattr(hls, "playlist_cache", hls.SingleFlightCache(hls.PLAYLIST_CACHE_SIZE))
+    monkeypatch.setattr(hls, "segment_cache", hls.SingleFlightCache(
+        hls.SEGMENT_CACHE_SIZE, max_bytes=hls.SEGMENT_CACHE_BYTES, max_per_group=hls.SEGMENTS_PER_STREAM))
+    playlist_url = f"{base}/live/room/720p/playlist.m3u8"
+    start = threading.Barrier(CLIENTS)
+    results = [None] * CLIENTS
+
+    def watch(index):
+        client = app.test_client()
+        assert client.post("/api/login", json={"username": "agent", "password": "agent"}).status_code == 200
+        start.wait()
+        playlist = client.get(hls.proxy_url(playlist_url, relay=True))
+        segments = {}
+        for line in playlist.get_data(as_text=True).splitlines():
+            for path in hls.URI_ATTRIBUTE.findall(line) or ([] if line.startswith("#") else [line]):
+                segments[path] = client.get(path).data
+        results[index] = (playlist.status_code, playlist.headers["Cache-Control"], segments)
+
+    threads = [threading.Thread(target=watch, args=(i,)) for i in range(CLIENTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    files = [f"{base}/live/room/720p/{name}" for name in ("init.mp4", "seg1042.m4s", "seg1043.m4s", "seg1044.m4s")]
+    expected = {hls.relay_url(url, playlist_url): b"segment " + urlsplit(url).path.encode() for url in files}
+    # The live playlist is revalidated by players; only the segments are cacheable.
+    assert results == [(200, "no-cache", expected)] * CLIENTS
+    # One upstream request per file for all the clients of this worker.
+    assert hits == {urlsplit(url).path: 1 for url in [playlist_url] + files}
+
+def test_waiters_outlast_a_slow_owner(monkeypatch):
+    import hls
+    assert hls.UPSTREAM_WAIT_TIMEOUT >= (hls.MAX_REDIRECTS + 1) * hls.FETCH_TIMEOUT
+    monkeypatch.setattr(hls, "UPSTREAM_WAIT_TIMEOUT", 0.5)
+    cache = hls.SingleFlightCache(4)
+    loading = threading.Event()
+    results = []
+
+    def slow_loader(key):
+        loading.set()
+        threading.Event().wait(0.3)
+        return key.upper(), 60
+
+    owner = threading.Thread(target=lambda: results.append(cache.get("a", slow_loader)))
+    owner.start()
+    assert loading.wait(5)
+    assert cache.get("a", slow_loader) == "A"
+    owner.join(5)
+    assert results == ["A"]
+
+    loading.clear()
+    monkeypatch.setattr(hls, "UPSTREAM_WAIT_TIMEOUT", 0.1)
+    owner = threading.Thread(target=lambda: cache.get("b", slow_loader))
+    owner.start()
+    assert loading.wait(5)
+    with pytest.raises(hls.UpstreamError):
+        cache.get("b", slow_loader)
+    owner.join(5)
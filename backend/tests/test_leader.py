@@ -0,0 +1,95 @@
+import pytest
+
+@pytest.fixture
+def clock(monkeypatch):
+    import leader
+    now = [1000.0]
+    monkeypatch.setattr(leader.time, "monotonic", lambda: now[0])
+    return now
+
+class FakeLeaseRedis:
+    """SET NX PX and the two lease scripts of leader.py, against an in-memory clock."""
+    def __init__(self, clock):
+        self.clock = clock
+        self.keys = {}  # key -> (value, expires at)
+
+    def get(self, key):
+        value, expires_at = self.keys.get(key, (None, 0))
+        return value if expires_at > self.clock[0] else None
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and self.get(key) is not None:
+            return None
+        self.keys[key] = (value, self.clock[0] + px / 1000)
+        return True
+
+    def eval(self, script, numkeys, key, token, *args):
+        import leader
+        if self.get(key) != token:
+            return 0
+        if script == leader.RENEW_SCRIPT:
+            self.keys[key] = (token, self.clock[0] + args[0] / 1000)
+        elif script == leader.RELEASE_SCRIPT:
+            del self.keys[key]
+        return 1
+
+def test_local_lease_is_exclusive_until_it_expires(clock):
+    import leader
+    lease = leader.LocalLease()
+    assert lease.acquire("jobs", "a", 30)
+    assert not lease.acquire("jobs", "b", 30)
+    # Renewing pushes the expiry out.
+    clock[0] += 20
+    assert lease.acquire("jobs", "a", 30)
+    clock[0] += 20
+    assert not lease.acquire("jobs", "b", 30)
+    clock[0] += 10
+    assert lease.acquire("jobs", "b", 30)
+    assert not lease.acquire("jobs", "a", 30)
+    # Only the holder can release; other names are independent.
+    lease.release("jobs", "a")
+    assert not lease.acquire("jobs", "a", 30)
+    assert lease.acquire("other", "a", 30)
+    lease.release("jobs", "b")
+    assert lease.acquire("jobs", "a", 30)
+
+@pytest.mark.parametrize("backend", ["local", "redis"])
+def test_leadership_hands_off(clock, backend):
+    import leader
+    shared = leader.LocalLease() if backend == "local" else leader.RedisLease(FakeLeaseRedis(clock))
+    first = leader.LeaderElector("jobs", backend=shared, ttl=30)
+    second = leader.LeaderElector("jobs", backend=shared, ttl=30)
+    assert first.try_acquire() and first.is_leader()
+    assert not second.try_acquire() and not second.is_leader()
+
+    # A clean release hands over at the next attempt.
+    first.release()
+    assert not first.is_leader()
+    assert second.try_acquire()
+    assert not first.try_acquire()
+
+    # A leader that stops renewing is replaced once its lease expires...
+    clock[0] += 29
+    assert not first.try_acquire()
+    clock[0] += 1
+    assert first.try_acquire()
+    # ...and learns it lost leadership at its next renewal.
+    assert not second.try_acquire() and not second.is_leader()
+
+def test_backend_errors_drop_leadership():
+    import leader
+
+    class BrokenLease:
+        calls = 0
+
+        def acquire(self, name, token, ttl):
+            self.calls += 1
+            if self.calls > 1:
+                raise ConnectionError("redis is down")
+            return True
+
+    elector = leader.LeaderElector("jobs", backend=BrokenLease())
+    assert elector.try_acquire()
+    # Without a confirmed renewal another process may already lead.
+    assert not elector.try_acquire()
+    assert not elector.is_leader()
@@ -0,0 +1,27 @@
+import re
+
+def sample(client, name):
+    body = client.get("/metrics").get_data(as_text=True)
+    match = re.search(rf"^{name} (\S+)$", body, re.MULTILINE)
+    assert match, f"{name} not exposed"
+    return float(match.group(1))
+
+def test_metrics_expose_notifications_in_flight(client, monkeypatch):
+    import notifications
+    seen = []
+
+    class FakeBot:
+        def sendMessage(self, chat_id, text):
+            seen.append(sample(client, "notifications_in_flight"))
+
+    monkeypatch.setattr(notifications, "get_bot", lambda token=None: FakeBot())
+    before = sample(client, "notifications_in_flight")
+    assert notifications.send_text_message("hello", "1")
+    assert seen == [before + 1]
+    assert sample(client, "notifications_in_flight") == before
+
+def test_metrics_expose_request_and_query_series(client):
+    client.get("/health")
+    body = client.get("/metrics").get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in body
+    assert "db_queries_per_request_bucket" in body
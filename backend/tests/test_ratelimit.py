@@ -0,0 +1,75 @@
+import json
+import uuid
+import pytest
+
+@pytest.fixture
+def admission():
+    import ratelimit
+    # Start from full buckets and re-read the queue depth on the next event.
+    ratelimit.admission.local.buckets.clear()
+    ratelimit.admission.queue_checked_at = 0
+    yield ratelimit.admission
+    ratelimit.admission.local.buckets.clear()
+    ratelimit.admission.queue_checked_at = 0
+
+def login(client, username):
+    assert client.post("/api/login", json={"username": username, "password": username}).status_code == 200
+
+def detection(stream_url):
+    return {
+        "stream_url": stream_url,
+        "detections": [{"class": "knife", "confidence": 0.9}],
+        "detected_object": uuid.uuid4().hex,
+    }
+
+def test_stream_bucket_rejects_after_burst_with_retry_after(client, admission):
+    import ratelimit
+    login(client, "agent")
+    stream_url = f"https://chaturbate.com/{uuid.uuid4().hex}"
+    _, burst = ratelimit.RATE_LIMITS["stream"]
+    statuses = [client.post("/api/detect-objects", json=detection(stream_url)).status_code for _ in range(burst)]
+    assert statuses == [201] * burst
+    response = client.post("/api/detect-objects", json=detection(stream_url))
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert response.get_json()["reason"] == "stream"
+    # Another stream still has its own budget.
+    assert client.post("/api/detect-objects", json=detection(stream_url + "-other")).status_code == 201
+
+def test_local_buckets_refill_over_time(monkeypatch):
+    import ratelimit
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    buckets = ratelimit.LocalBuckets()
+    bucket = [("stream:x", 1.0, 2)]
+    assert buckets.take(bucket) is None
+    assert buckets.take(bucket) is None
+    index, wait = buckets.take(bucket)
+    assert (index, wait) == (0, pytest.approx(1.0))
+    now[0] += 1.0
+    assert buckets.take(bucket) is None
+
+def test_saturated_notify_queue_sheds_ingest(client, admission, monkeypatch):
+    import ratelimit
+    login(client, "agent")
+    monkeypatch.setattr(ratelimit, "queue_depth", lambda task_type: ratelimit.INGEST_QUEUE_LIMIT)
+    response = client.post("/api/detect-objects", json=detection("https://chaturbate.com/shed"))
+    assert response.status_code == 429
+    assert response.get_json()["reason"] == "saturated"
+    assert response.headers["Retry-After"] == str(ratelimit.SHED_RETRY_AFTER)
+
+def test_rejected_websocket_frame_stores_no_image(app, admission, monkeypatch):
+    import ratelimit
+    import channel
+    from extensions import db
+    from models import AnnotatedFrame
+    monkeypatch.setitem(ratelimit.RATE_LIMITS, "stream", (0.001, 0))
+    header = json.dumps({"op": "detection", "ref": 1, "data": detection("https://chaturbate.com/ws")}).encode()
+    frame = len(header).to_bytes(4, "big") + header + b"\xff\xd8jpeg"
+    with app.app_context():
+        before = db.session.query(AnnotatedFrame).count()
+        message, image = channel.decode_binary_frame(frame)
+        assert image == (b"\xff\xd8jpeg", "image/jpeg")
+        status, body = channel.handle_message(message, 2, image)
+        assert status == 429 and body["reason"] == "stream"
+        assert db.session.query(AnnotatedFrame).count() == before
@@ -0,0 +1,210 @@
+import uuid
+import pytest
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield
+
+def new_user():
+    import readstate
+    from extensions import db
+    from models import User
+    name = uuid.uuid4().hex[:12]
+    user = User(username=name, password=name, firstname=name, lastname=name,
+                email=f"{name}@example.com", phonenumber="0", role="agent")
+    db.session.add(user)
+    db.session.flush()
+    readstate.create_cursor(user.id)
+    db.session.commit()
+    return user.id
+
+def add_logs(count, event_type="object_detection"):
+    from extensions import db
+    from models import Log
+    room_url = f"https://chaturbate.com/{uuid.uuid4().hex}"
+    logs = [Log(room_url=room_url, event_type=event_type, details={"detections": []}) for _ in range(count)]
+    db.session.add_all(logs)
+    db.session.commit()
+    return [log.id for log in logs]
+
+def exceptions(user_id):
+    from models import NotificationReadException
+    return sorted(row.log_id for row in NotificationReadException.query.filter_by(user_id=user_id))
+
+def test_read_state_is_per_user(ctx):
+    import readstate
+    alice, bob = new_user(), new_user()
+    ids = add_logs(3)
+    assert readstate.mark_read(alice, ids[:2]) == 2
+    assert readstate.read_ids(alice, ids) == set(ids[:2])
+    assert readstate.read_ids(bob, ids) == set()
+    assert readstate.unread_count(bob) - readstate.unread_count(alice) == 2
+
+def test_read_then_unread(ctx):
+    import readstate
+    user = new_user()
+    ids = add_logs(2)
+    assert readstate.mark_read(user, [ids[1]]) == 1
+    assert readstate.mark_read(user, [ids[1]]) == 0
+    assert readstate.read_ids(user, ids) == {ids[1]}
+    assert readstate.mark_unread(user, [ids[1]]) == 1
+    assert readstate.mark_unread(user, [ids[1]]) == 0
+    assert readstate.read_ids(user, ids) == set()
+    assert exceptions(user) == []
+
+def test_cursor_advances_over_read_exceptions(ctx):
+    import readstate
+    user = new_user()
+    start = readstate.get_cursor(user).last_read_id
+    ids = add_logs(3)
+    readstate.mark_read(user, [ids[1]])
+    assert readstate.get_cursor(user).last_read_id == start
+    assert exceptions(user) == [ids[1]]
+    # Reading the gap below the exception moves the cursor over both.
+    readstate.mark_read(user, [ids[0]])
+    assert readstate.get_cursor(user).last_read_id == ids[1]
+    assert exceptions(user) == []
+    assert readstate.read_ids(user, ids) == set(ids[:2])
+    # Below the cursor, an exception means unread.
+    readstate.mark_unread(user, [ids[0]])
+    assert exceptions(user) == [ids[0]]
+    assert readstate.read_ids(user, ids) == {ids[1]}
+
+def test_mark_all_read(ctx):
+    import readstate
+    user = new_user()
+    ids = add_logs(4)
+    readstate.mark_read(user, ids[:2])
+    readstate.mark_unread(user, [ids[0]])
+    readstate.mark_read(user, [ids[3]])
+    assert readstate.mark_all_read(user) >= ids[-1]
+    assert exceptions(user) == []
+    assert readstate.read_ids(user, ids) == set(ids)
+    assert readstate.unread_count(user) == 0
+    # Logs after the call are unread again.
+    later = add_logs(1)
+    assert readstate.read_ids(user, later) == set()
+
+def test_log_serialize_has_no_shared_read_flag(ctx):
+    from extensions import db
+    from models import Log
+    log = db.session.get(Log, add_logs(1)[0])
+    assert "read" not in log.serialize()
+
+def log_notification(room_url, event_type="object_detection"):
+    import readstate
+    from extensions import db
+    from models import Log
+    log = Log(room_url=room_url, event_type=event_type, details={"detections": []})
+    db.session.add(log)
+    db.session.commit()
+    readstate.count_new_log(log)
+    return log.id
+
+def counts(user_id, room_url):
+    import readstate
+    result = readstate.unread_counts(user_id, {1: [room_url]})
+    return result["total"], result["by_type"]["object_detection"], result["by_stream"][1]
+
+def assert_matches_database(user_id):
+    import readstate
+    assert readstate.unread_counts(user_id, {})["total"] == readstate.unread_count(user_id)
+
+def test_counts_follow_inserts_reads_and_hides(ctx):
+    import readstate
+    user = new_user()
+    room_url = f"https://chaturbate.com/{uuid.uuid4().hex}"
+    total, by_type, by_stream = counts(user, room_url)
+    ids = [log_notification(room_url) for _ in range(3)]
+    assert counts(user, room_url) == (total + 3, by_type + 3, by_stream + 3)
+    readstate.mark_read(user, ids[:2])
+    assert counts(user, room_url) == (total + 1, by_type + 1, by_stream + 1)
+    readstate.mark_unread(user, [ids[0]])
+    assert counts(user, room_url) == (total + 2, by_type + 2, by_stream + 2)
+    readstate.hide_logs(user, [ids[0]])
+    assert counts(user, room_url) == (total + 1, by_type + 1, by_stream + 1)
+    readstate.mark_all_read(user)
+    assert counts(user, room_url) == (0, 0, 0)
+    assert_matches_database(user)
+
+def test_counts_follow_bulk_operations(ctx):
+    import bulk
+    import readstate
+    reader, other = new_user(), new_user()
+    room_url = f"https://chaturbate.com/{uuid.uuid4().hex}"
+    ids = [log_notification(room_url) for _ in range(4)]
+    # Look the counts up first so the bulk changes update existing counters.
+    counts(reader, room_url)
+    counts(other, room_url)
+
+    def filters(user_id, selected):
+        return {"user_id": user_id, "ids": selected, "event_types": readstate.NOTIFICATION_EVENT_TYPES}
+
+    assert bulk.run_chunk(filters(reader, ids), "read")[0] == 4
+    assert counts(reader, room_url)[2] == 0
+    assert bulk.run_chunk(filters(reader, ids[:1]), "unread")[0] == 1
+    assert counts(reader, room_url)[2] == 1
+    assert bulk.run_chunk(filters(other, ids[:2]), "hide")[0] == 2
+    assert counts(other, room_url)[2] == 2
+    # Deleting logs lowers everyone's counts, read or not.
+    assert bulk.run_chunk(filters(other, ids[2:]), "delete")[0] == 2
+    assert counts(reader, room_url)[2] == 1
+    assert counts(other, room_url)[2] == 0
+    assert_matches_database(reader)
+    assert_matches_database(other)
+
+def test_deleting_logs_only_resets_users_who_read_them(ctx):
+    import readstate
+    from config import cache
+    from extensions import db
+    from models import Log
+    reader, unaware = new_user(), new_user()
+    room_url = f"https://chaturbate.com/{uuid.uuid4().hex}"
+    log_id = log_notification(room_url)
+    readstate.mark_read(reader, [log_id])
+    counts(reader, room_url)
+    counts(unaware, room_url)
+    generation = cache.get("unread:generation")
+    forgotten = readstate.forget_logs([log_id])
+    Log.query.filter_by(id=log_id).delete()
+    db.session.commit()
+    readstate.invalidate_counts(forgotten)
+    assert cache.get("unread:generation") == generation
+    assert cache.get(readstate._synced_key(reader)) is None
+    assert cache.get(readstate._synced_key(unaware)) is not None
+    assert counts(unaware, room_url)[2] == 0
+    assert_matches_database(reader)
+    assert_matches_database(unaware)
+
+@pytest.mark.parametrize("count_before_publish", [True, False])
+def test_log_committed_during_rebuild_is_counted_once(ctx, monkeypatch, count_before_publish):
+    import readstate
+    from config import cache
+    from extensions import db
+    from models import Log
+    user = new_user()
+    room_url = f"https://chaturbate.com/{uuid.uuid4().hex}"
+    late = []
+    bucket_counts = readstate._bucket_counts
+
+    def count_then_ingest(query):
+        counted = bucket_counts(query)
+        if not late:
+            # Another request commits a log after the rebuild counted.
+            log = Log(room_url=room_url, event_type="object_detection", details={"detections": []})
+            db.session.add(log)
+            db.session.commit()
+            late.append(log)
+            if count_before_publish:
+                readstate.count_new_log(log)
+        return counted
+
+    cache.delete("unread:generation")
+    monkeypatch.setattr(readstate, "_bucket_counts", count_then_ingest)
+    counts(user, room_url)
+    monkeypatch.undo()
+    if not count_before_publish:
+        readstate.count_new_log(late[0])
+    assert counts(user, room_url)[2] == 1
+    assert_matches_database(user)
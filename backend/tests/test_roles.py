@@ -0,0 +1,83 @@
+import uuid
+import pytest
+
+@pytest.fixture
+def roles():
+    import utils
+    utils._user_cache.clear()
+    yield utils
+    utils._user_cache.clear()
+
+@pytest.fixture
+def user(app):
+    from extensions import db
+    from models import User
+    name = uuid.uuid4().hex[:12]
+    with app.app_context():
+        row = User(username=name, password=name, firstname="A", lastname="B",
+                   email=f"{name}@example.com", phonenumber="1", role="agent")
+        db.session.add(row)
+        db.session.commit()
+        user_id = row.id
+    yield user_id
+    with app.app_context():
+        User.query.filter_by(id=user_id).delete()
+        db.session.commit()
+
+def set_role(app, user_id, role):
+    from extensions import db
+    from models import User
+    with app.app_context():
+        db.session.get(User, user_id).role = role
+        db.session.commit()
+
+def test_role_is_cached_until_forgotten(app, roles, user, count_statements):
+    with app.app_context():
+        assert count_statements(lambda: roles.get_user_role(user)) == ("agent", 1)
+        assert count_statements(lambda: roles.get_user_role(user)) == ("agent", 0)
+    set_role(app, user, "admin")
+    with app.app_context():
+        # Another worker's change is not seen until the entry goes away.
+        assert roles.get_user_role(user) == "agent"
+        roles.forget_user_role(user)
+        assert count_statements(lambda: roles.get_user_role(user)) == ("admin", 1)
+
+def test_role_expires_after_ttl(app, roles, user, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(roles.time, "monotonic", lambda: now[0])
+    with app.app_context():
+        assert roles.get_user_role(user) == "agent"
+        set_role(app, user, "admin")
+        now[0] += roles.USER_CACHE_TTL - 1
+        assert roles.get_user_role(user) == "agent"
+        now[0] += 1
+        assert roles.get_user_role(user) == "admin"
+
+def test_cache_keeps_the_most_recently_used_users(app, roles, monkeypatch):
+    monkeypatch.setattr(roles, "USER_CACHE_SIZE", 2)
+    with app.app_context():
+        for user_id in (1, 2):
+            roles.get_user_role(user_id)
+        roles.get_user_role(1)
+        roles.get_user_role(10**9)
+    assert list(roles._user_cache) == [1, 10**9]
+    assert roles._user_cache[10**9][0] is None
+
+def test_deleted_agent_loses_access_at_once(app, roles):
+    admin = app.test_client()
+    agent = app.test_client()
+    name = uuid.uuid4().hex[:12]
+    assert admin.post("/api/login", json={"username": "admin", "password": "admin"}).status_code == 200
+    response = admin.post("/api/agents", json={
+        "username": name, "password": name, "firstname": "A", "lastname": "B",
+        "email": f"{name}@example.com", "phonenumber": "1",
+    })
+    assert response.status_code == 201
+    agent_id = response.get_json()["agent"]["id"]
+    assert agent.post("/api/login", json={"username": name, "password": name}).status_code == 200
+    assert agent.get("/api/agent/dashboard").status_code == 200
+    assert agent_id in roles._user_cache
+
+    assert admin.delete(f"/api/agents/{agent_id}").status_code == 200
+    assert agent_id not in roles._user_cache
+    assert agent.get("/api/agent/dashboard").status_code == 403
@@ -0,0 +1,69 @@
+import uuid
+from datetime import datetime, timedelta
+import pytest
+
+def test_quiet_streams_get_the_max_interval_and_hot_ones_the_min():
+    from scheduler import allocate_intervals, HOT_SCORE
+    intervals = allocate_intervals({"quiet": 0.0, "warm": HOT_SCORE / 2, "hot": HOT_SCORE * 4},
+                                   budget=100, min_interval=1, max_interval=60)
+    assert intervals["quiet"] == pytest.approx(60)
+    assert intervals["hot"] == pytest.approx(1)
+    assert 1 < intervals["warm"] < 60
+
+def test_allocation_stays_within_budget_above_the_floor():
+    from scheduler import allocate_intervals, HOT_SCORE
+    scores = {f"hot{i}": HOT_SCORE for i in range(10)}
+    scores.update({f"quiet{i}": 0.0 for i in range(10)})
+    intervals = allocate_intervals(scores, budget=2, min_interval=1, max_interval=60)
+    assert sum(1 / interval for interval in intervals.values()) == pytest.approx(2)
+    assert all(intervals[f"quiet{i}"] == pytest.approx(60) for i in range(10))
+    assert len({round(intervals[f"hot{i}"], 6) for i in range(10)}) == 1
+    # Past the point where only the floor fits, every stream keeps its floor rate.
+    intervals = allocate_intervals(scores, budget=0.1, min_interval=1, max_interval=60)
+    assert all(interval == pytest.approx(60) for interval in intervals.values())
+
+def test_risk_scores_decay_with_age_in_any_order():
+    from scheduler import RiskScores, RISK_HALF_LIFE
+    risk = RiskScores()
+    risk.add("a", 1.0, 1000)
+    assert risk.get("a", 1000 + RISK_HALF_LIFE) == pytest.approx(0.5)
+    # An older event arriving late counts with its own age.
+    risk.add("a", 1.0, 1000 - RISK_HALF_LIFE)
+    assert risk.get("a", 1000) == pytest.approx(1.5)
+    assert risk.get("unknown", 1000) == 0
+
+def test_risk_scores_refresh_folds_in_new_logs_only(app):
+    from extensions import db
+    from models import Log
+    from scheduler import RiskScores, EVENT_WEIGHTS, RISK_WINDOW, _seconds
+    room_url = f"https://chaturbate.com/{uuid.uuid4().hex}"
+    now = datetime.utcnow()
+    with app.app_context():
+        db.session.add_all([
+            Log(room_url=room_url, event_type="object_detection", timestamp=now, details={}),
+            Log(room_url=room_url, event_type="chat_detection", timestamp=now, details={}),
+            # Outside the window: not loaded at all.
+            Log(room_url=room_url, event_type="object_detection",
+                timestamp=now - timedelta(seconds=RISK_WINDOW + 60), details={}),
+        ])
+        db.session.commit()
+        risk = RiskScores()
+        risk.refresh()
+        expected = EVENT_WEIGHTS["object_detection"] + EVENT_WEIGHTS["chat_detection"]
+        assert risk.get(room_url, _seconds(now)) == pytest.approx(expected)
+        db.session.add(Log(room_url=room_url, event_type="audio_detection", timestamp=now, details={}))
+        db.session.commit()
+        risk.refresh()
+        risk.refresh()
+        expected += EVENT_WEIGHTS["audio_detection"]
+        assert risk.get(room_url, _seconds(now)) == pytest.approx(expected)
+
+def test_unscheduled_urls_keep_the_callers_default():
+    import monitoring
+    from scheduler import StreamScheduler, MAX_SAMPLE_INTERVAL
+    scheduler = StreamScheduler()
+    scheduler.set_streams({"https://chaturbate.com/a": ["https://cdn.example.com/a.m3u8"]})
+    scheduler.intervals = {"https://chaturbate.com/a": 2.5}
+    assert scheduler.interval_for_url("https://cdn.example.com/a.m3u8") == 2.5
+    assert scheduler.interval_for_url("https://chaturbate.com/b") == MAX_SAMPLE_INTERVAL
+    assert scheduler.interval_for_url("https://chaturbate.com/b", default=monitoring.MONITOR_INTERVAL) == 10
@@ -0,0 +1,93 @@
+import uuid
+import pytest
+
+def login(client, username):
+    assert client.post("/api/login", json={"username": username, "password": username}).status_code == 200
+
+@pytest.fixture
+def streams(app):
+    """Streams whose usernames contain one fresh term in every ranked position."""
+    from extensions import db
+    from models import Stream, ChaturbateStream, StripchatStream, Assignment, User
+    from caching import invalidate_tags
+    term = "q" + uuid.uuid4().hex[:8]
+    names = {
+        "exact": term,
+        "prefix": term + "x",
+        "long_prefix": term + "xxxx",
+        "substring": "a" + term,
+        "long_substring": "zzz" + term + "zzz",
+    }
+    with app.app_context():
+        rows = {}
+        for key, name in names.items():
+            model = StripchatStream if key == "long_prefix" else ChaturbateStream
+            domain = "stripchat" if key == "long_prefix" else "chaturbate"
+            rows[key] = model(room_url=f"https://{domain}.com/{name}", streamer_username=name)
+        db.session.add_all(rows.values())
+        db.session.flush()
+        agent = User.query.filter_by(username="agent").first()
+        db.session.add(Assignment(agent_id=agent.id, stream_id=rows["substring"].id))
+        db.session.commit()
+        ids = {key: row.id for key, row in rows.items()}
+    invalidate_tags("streams")
+    yield term, names, ids
+    with app.app_context():
+        Assignment.query.filter(Assignment.stream_id.in_(ids.values())).delete()
+        for stream in Stream.query.filter(Stream.id.in_(ids.values())).all():
+            db.session.delete(stream)
+        db.session.commit()
+    invalidate_tags("streams", "assignments")
+
+def search(client, **params):
+    response = client.get("/api/streams", query_string=params)
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_matches_rank_exact_then_prefix_then_substring(app, client, streams):
+    import search as search_module
+    term, names, _ = streams
+    assert search_module._fts_available
+    login(client, "admin")
+    result = search(client, q=term.upper())
+    assert result["total"] == 5
+    assert [s["streamer_username"] for s in result["streams"]] == [
+        names["exact"], names["prefix"], names["long_prefix"], names["substring"], names["long_substring"],
+    ]
+
+def test_pages_partition_the_ranked_matches(app, client, streams):
+    term, names, _ = streams
+    login(client, "admin")
+    pages = [search(client, q=term, page=page, per_page=2) for page in (1, 2, 3, 4)]
+    assert [p["total"] for p in pages] == [5] * 4
+    assert [p["page"] for p in pages] == [1, 2, 3, 4]
+    assert [len(p["streams"]) for p in pages] == [2, 2, 1, 0]
+    everything = search(client, q=term)["streams"]
+    assert [s for p in pages for s in p["streams"]] == everything
+
+def test_filters_and_renames(app, client, streams):
+    from extensions import db
+    from models import Stream
+    from caching import invalidate_tags
+    term, names, ids = streams
+    login(client, "admin")
+    assert [s["streamer_username"] for s in search(client, q=term, platform="stripchat")["streams"]] == [
+        names["long_prefix"]]
+    assert [s["streamer_username"] for s in search(client, q=term, assigned="true")["streams"]] == [
+        names["substring"]]
+    assert search(client, q=term, assigned="false")["total"] == 4
+
+    # The index follows renames through its triggers.
+    with app.app_context():
+        db.session.get(Stream, ids["exact"]).streamer_username = "renamed" + term[1:]
+        db.session.commit()
+    invalidate_tags("streams")
+    result = search(client, q=term)
+    assert result["total"] == 4
+    assert result["streams"][0]["streamer_username"] == names["prefix"]
+
+def test_short_and_wildcard_terms_match_literally(app, client, streams):
+    login(client, "admin")
+    # Under the trigram minimum the term falls back to an escaped LIKE.
+    assert search(client, q="%")["total"] == 0
+    assert search(client, q="_")["total"] == 0
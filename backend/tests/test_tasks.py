@@ -0,0 +1,88 @@
+import json
+import threading
+import pytest
+
+@pytest.fixture
+def echo(monkeypatch):
+    """Register a task type whose handler records its payloads and the thread it ran on."""
+    import tasks
+    from flask import current_app
+    ran = []
+    done = threading.Semaphore(0)
+
+    def handler(value, fail=False):
+        # Handlers run inside an application context.
+        assert current_app.name
+        if fail:
+            raise RuntimeError("boom")
+        ran.append((value, threading.current_thread()))
+        done.release()
+
+    monkeypatch.setitem(tasks.handlers, "echo", (handler, 2))
+    yield ran, done
+    tasks._local_executors.pop("echo", None)
+
+def wait_for(done, count):
+    for _ in range(count):
+        assert done.acquire(timeout=10)
+
+def test_local_backend_runs_tasks_on_a_pool(echo):
+    import tasks
+    ran, done = echo
+    assert not tasks.uses_worker()
+    for i in range(10):
+        tasks.enqueue("echo", value=i)
+    wait_for(done, 10)
+    assert sorted(value for value, _ in ran) == list(range(10))
+    assert threading.current_thread() not in {thread for _, thread in ran}
+    assert len({thread for _, thread in ran}) <= 2
+    assert tasks.queue_depth("echo") == 0
+
+def test_failed_task_is_logged_not_raised(echo, caplog):
+    import tasks
+    ran, _ = echo
+    tasks.enqueue("echo", value=1, fail=True)
+    tasks.enqueue("echo", value=2)
+    tasks._local_executors["echo"].shutdown(wait=True)
+    assert [value for value, _ in ran] == [2]
+    assert "Task echo failed: boom" in caplog.text
+
+def test_unknown_task_type_is_rejected(fake_redis):
+    import tasks
+    with pytest.raises(ValueError):
+        tasks.enqueue("no-such-task", value=1)
+    assert fake_redis.lists == {}
+
+def test_redis_backend_queues_for_the_worker(echo, fake_redis):
+    import tasks
+    ran, _ = echo
+    assert tasks.uses_worker()
+    tasks.enqueue("echo", value=1)
+    tasks.enqueue("echo", value=2)
+    # Nothing runs in the web process; the payloads wait as JSON.
+    assert ran == []
+    assert tasks.queue_depth("echo") == 2
+    assert json.loads(fake_redis.lists[tasks.queue_key("echo")][0]) == {"value": 1}
+
+def test_worker_drains_the_queue(echo, fake_redis, monkeypatch):
+    import tasks
+    import worker
+    ran, done = echo
+    monkeypatch.setattr(tasks, "QUEUE_POLL_TIMEOUT", 0.1)
+    # The worker consumes every handler the web tier can enqueue.
+    assert {"scrape", "ocr", "thumbnail", "notify", "bulk"} <= set(tasks.handlers)
+    for i in range(20):
+        tasks.enqueue("echo", value=i)
+    stop = threading.Event()
+    threads = worker.start_consumers(["echo"], worker.parse_concurrency(["echo=3"]), stop=stop)
+    try:
+        assert len(threads) == 3
+        wait_for(done, 20)
+        assert tasks.queue_depth("echo") == 0
+        assert sorted(value for value, _ in ran) == list(range(20))
+        assert {thread for _, thread in ran} <= set(threads)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(5)
+    assert not any(thread.is_alive() for thread in threads)
@@ -1,4 +1,7 @@
 import os
+import time
+import threading
+from collections import OrderedDict
 from functools import wraps
 from flask import session, jsonify
 from config import app
@@ -7,10 +10,40 @@ from extensions import db
 
 ALLOWED_EXTENSIONS = {"mp4", "avi", "mov"}
 
+# Per-worker cache of user roles used by login_required. Entries expire after
+# USER_CACHE_TTL seconds, which bounds how long another worker may keep
+# honoring a role that was changed or a user that was deleted.
+USER_CACHE_TTL = 30
+USER_CACHE_SIZE = 1024
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+
 def allowed_file(filename):
     """Return True if the filename extension is allowed."""
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def get_user_role(user_id):
+    """Return the role of the given user (None if missing), using the LRU cache."""
+    now = time.monotonic()
+    with _user_cache_lock:
+        entry = _user_cache.get(user_id)
+        if entry and entry[1] > now:
+            _user_cache.move_to_end(user_id)
+            return entry[0]
+    # Only the role; loading the User would also select its assignments.
+    role = db.session.query(User.role).filter_by(id=user_id).scalar()
+    with _user_cache_lock:
+        _user_cache[user_id] = (role, now + USER_CACHE_TTL)
+        _user_cache.move_to_end(user_id)
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+    return role
+
+def forget_user_role(user_id):
+    """Drop a user from this worker's role cache after it was changed or deleted."""
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
 def login_required(role=None):
     """
     Decorator to require a logged-in user.
@@ -21,8 +54,7 @@ def login_required(role=None):
         def decorated_function(*args, **kwargs):
             if "user_id" not in session:
                 return jsonify({"message": "Authentication required"}), 401
-            user = db.session.get(User, session["user_id"])
-            if role and (user is None or user.role != role):
+            if role and get_user_role(session["user_id"]) != role:
                 return jsonify({"message": "Unauthorized"}), 403
             return f(*args, **kwargs)
         return decorated_function
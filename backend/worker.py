@@ -0,0 +1,72 @@
+"""
+Background worker entry point.
+
+Consumes the Redis task queue filled by the web tier (TASK_QUEUE_BACKEND=redis)
+and runs the scrape, OCR, thumbnail, notify and bulk handlers on their own
+threads, so heavy work can be scaled separately from the gunicorn web workers.
+
+    TASK_QUEUE_BACKEND=redis python worker.py
+    TASK_QUEUE_BACKEND=redis python worker.py --types scrape,ocr --concurrency scrape=4
+
+Web and worker processes must reach the same Redis (TASK_QUEUE_URL) and see
+the same uploads folder, since OCR reads the chat images. Annotated frames and
+their thumbnails are in the database. Upload cleanup runs in the web pods,
+once per host.
+"""
+import sys
+import time
+import logging
+import argparse
+import threading
+from config import app
+from extensions import db
+from tasks import handlers, consume, uses_worker
+
+# Importing these modules registers their task handlers.
+import scraping
+import detection
+import notifications
+import bulk
+
+def parse_concurrency(values):
+    """Parse repeated --concurrency type=N options into a dict."""
+    overrides = {}
+    for value in values or []:
+        task_type, _, count = value.partition("=")
+        overrides[task_type] = int(count)
+    return overrides
+
+def start_consumers(task_types, overrides=None, stop=None):
+    """Start the consumer threads of the given task types and return them."""
+    threads = []
+    for task_type in task_types:
+        _, concurrency = handlers[task_type]
+        count = (overrides or {}).get(task_type, concurrency)
+        for _ in range(count):
+            thread = threading.Thread(target=consume, args=(task_type, stop), daemon=True)
+            thread.start()
+            threads.append(thread)
+        logging.info("Consuming %s tasks with %s threads", task_type, count)
+    return threads
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background task handlers.")
+    parser.add_argument("--types", help="Comma separated task types to consume (default: all)")
+    parser.add_argument("--concurrency", action="append", help="Override threads per type, e.g. scrape=4")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not uses_worker():
+        logging.error("TASK_QUEUE_BACKEND is not 'redis'; the web tier runs tasks itself.")
+        sys.exit(1)
+
+    task_types = args.types.split(",") if args.types else sorted(handlers)
+    with app.app_context():
+        db.create_all()
+    start_consumers(task_types, parse_concurrency(args.concurrency))
+
+    while True:
+        time.sleep(60)
+
+if __name__ == "__main__":
+    main()
@@ -205,15 +205,12 @@ const HlsPlayer = ({ streamerUid, onDetection, streamerName, platform, assignedA
 
         // Send detection to backend for logging
         if (flaggedPredictions.length > 0 && !notificationSent) {
-          // Capture the annotated frame
-          const annotatedImage = canvas.toDataURL('image/jpeg', 0.8);
-
-          // Prepare detection details
+          // Prepare detection details; the annotated frame is uploaded
+          // alongside as a binary file part instead of a base64 string.
           const detectionDetails = {
             stream_url: hlsUrl,
             detections: flaggedPredictions,
             timestamp: new Date().toISOString(),
-            annotated_image: annotatedImage,
             streamer_name: streamerName,
             platform: platform,
             assigned_agent: assignedAgent ? {
@@ -223,7 +220,12 @@ const HlsPlayer = ({ streamerUid, onDetection, streamerName, platform, assignedA
             detected_object: flaggedPredictions[0].class // Only send the first detected object
           };
 
-          axios.post('/api/detect-objects', detectionDetails);
+          canvas.toBlob((annotatedImage) => {
+            const formData = new FormData();
+            formData.append('metadata', JSON.stringify(detectionDetails));
+            if (annotatedImage) formData.append('annotated_image', annotatedImage, 'frame.jpg');
+            axios.post('/api/detect-objects', formData);
+          }, 'image/jpeg', 0.8);
 
           // Set notification sent to true and reset after 10 seconds
           setNotificationSent(true);
@@ -7,10 +7,11 @@ const StripchatVideoPlayer = ({ streamerUid }) => {
   const videoRef = useRef(null);
   const playerRef = useRef(null);
   
-  // State to hold the stream URL fetched from the backend.
-  const [edgeServerUrl, setEdgeServerUrl] = useState('');
+  // State to hold the proxied playlist URL returned by the backend.
+  const [playlistUrl, setPlaylistUrl] = useState('');
 
-  // Fetch the m3u8 URL (edge_server_url) from the backend using the provided streamerUid.
+  // Resolve the stream through the backend, which serves its playlists and
+  // segments from a shared cache instead of every player hitting the CDN.
   useEffect(() => {
     if (!streamerUid) return;
     
@@ -19,13 +20,15 @@ const StripchatVideoPlayer = ({ streamerUid }) => {
         const response = await fetch('/api/livestream', {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ streamerUid })
+          body: JSON.stringify({
+            url: `https://b-hls-11.doppiocdn.live/hls/${streamerUid}/${streamerUid}.m3u8`
+          })
         });
         const data = await response.json();
-        if (data.edge_server_url) {
-          setEdgeServerUrl(data.edge_server_url);
+        if (data.relay_url || data.proxy_url) {
+          setPlaylistUrl(data.relay_url || data.proxy_url);
         } else {
-          console.error('No edge_server_url returned from backend');
+          console.error('No proxy_url returned from backend:', data.error);
         }
       } catch (error) {
         console.error('Error fetching stream URL:', error);
@@ -37,7 +40,7 @@ const StripchatVideoPlayer = ({ streamerUid }) => {
 
   // Initialize the Video.js player when the stream URL is available.
   useEffect(() => {
-    if (!edgeServerUrl) return;
+    if (!playlistUrl) return;
 
     // Initialize the video.js player with HLS source.
     playerRef.current = videojs(videoRef.current, {
@@ -45,7 +48,7 @@ const StripchatVideoPlayer = ({ streamerUid }) => {
       autoplay: true,
       preload: 'auto',
       sources: [{
-        src: edgeServerUrl,
+        src: playlistUrl,
         type: 'application/x-mpegURL'
       }]
     });
@@ -57,13 +60,13 @@ const StripchatVideoPlayer = ({ streamerUid }) => {
       });
     });
 
-    // Cleanup the player instance when the component unmounts or when edgeServerUrl changes.
+    // Cleanup the player instance when the component unmounts or when playlistUrl changes.
     return () => {
       if (playerRef.current) {
         playerRef.current.dispose();
       }
     };
-  }, [edgeServerUrl]);
+  }, [playlistUrl]);
 
   return (
     <div>
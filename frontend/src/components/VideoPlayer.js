@@ -165,25 +165,20 @@ const HlsPlayer = ({ m3u8Url, onDetection, isModalOpen, posterUrl }) => {
 
         // Send detection to backend for logging
         if (flaggedPredictions.length > 0 && !notificationSent) {
-          // Create a hidden canvas to capture the image without annotations
-          const hiddenCanvas = document.createElement('canvas');
-          hiddenCanvas.width = video.videoWidth;
-          hiddenCanvas.height = video.videoHeight;
-          const hiddenCtx = hiddenCanvas.getContext('2d');
-          hiddenCtx.drawImage(video, 0, 0, hiddenCanvas.width, hiddenCanvas.height);
-
-          // Capture the annotated frame from the canvas (video frame + annotations)
-          const annotatedImage = canvas.toDataURL('image/jpeg', 0.8);
-          const capturedImage = hiddenCanvas.toDataURL('image/jpeg', 0.8);
-
-          axios.post('/api/detect-objects', {
+          // Upload the annotated frame (video frame + annotations) as a
+          // binary file part; the JSON metadata travels beside it.
+          const metadata = {
             stream_url: m3u8Url,
             detections: flaggedPredictions,
             timestamp: new Date().toISOString(),
-            annotated_image: annotatedImage,
-            captured_image: capturedImage, // Image without annotations
             detected_object: detectedObject, // Detected object label
-          });
+          };
+          canvas.toBlob((annotatedImage) => {
+            const formData = new FormData();
+            formData.append('metadata', JSON.stringify(metadata));
+            if (annotatedImage) formData.append('annotated_image', annotatedImage, 'frame.jpg');
+            axios.post('/api/detect-objects', formData);
+          }, 'image/jpeg', 0.8);
 
           // Set notification sent to true and reset after 10 seconds
           setNotificationSent(true);